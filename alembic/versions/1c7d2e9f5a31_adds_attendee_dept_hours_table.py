@@ -0,0 +1,79 @@
+"""Adds attendee_dept_hours rollup table
+
+Revision ID: 1c7d2e9f5a31
+Revises: 4f2a3c8d9b10
+Create Date: 2017-12-06 14:05:42.731904
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7d2e9f5a31'
+down_revision = '4f2a3c8d9b10'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_table('attendee_dept_hours',
+    sa.Column('attendee_id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.Column('department_id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.Column('weighted_hours', sa.Float(), server_default='0', nullable=False),
+    sa.Column('worked_hours', sa.Float(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['attendee_id'], ['attendee.id'], name=op.f('fk_attendee_dept_hours_attendee_id_attendee'), ondelete='cascade'),
+    sa.ForeignKeyConstraint(['department_id'], ['department.id'], name=op.f('fk_attendee_dept_hours_department_id_department'), ondelete='cascade'),
+    sa.PrimaryKeyConstraint('attendee_id', 'department_id', name=op.f('pk_attendee_dept_hours'))
+    )
+
+    # Backfill the rollup from existing shifts; 59709335 is c.SHIFT_WORKED
+    op.execute("""
+        INSERT INTO attendee_dept_hours (attendee_id, department_id, weighted_hours, worked_hours)
+        SELECT shift.attendee_id, job.department_id,
+            SUM(job.weight * (job.duration + CASE WHEN job.extra15 THEN 0.25 ELSE 0 END)),
+            SUM(CASE WHEN shift.worked = 59709335
+                THEN job.weight * (job.duration + CASE WHEN job.extra15 THEN 0.25 ELSE 0 END)
+                ELSE 0 END)
+        FROM shift JOIN job ON shift.job_id = job.id
+        GROUP BY shift.attendee_id, job.department_id
+    """)
+
+
+def downgrade():
+    op.drop_table('attendee_dept_hours')
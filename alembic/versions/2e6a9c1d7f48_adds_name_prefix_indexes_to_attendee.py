@@ -0,0 +1,65 @@
+"""Adds name prefix indexes to attendee
+
+Revision ID: 2e6a9c1d7f48
+Revises: 8d4f1b2a6c93
+Create Date: 2017-12-10 11:46:52.630417
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6a9c1d7f48'
+down_revision = '8d4f1b2a6c93'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    if is_sqlite:
+        op.execute("CREATE INDEX ix_attendee_full_name_prefix ON attendee (lower(first_name || ' ' || last_name))")
+        op.execute("CREATE INDEX ix_attendee_last_name_prefix ON attendee (lower(last_name))")
+    else:
+        op.execute("CREATE INDEX ix_attendee_full_name_prefix ON attendee (lower(first_name || ' ' || last_name) text_pattern_ops)")
+        op.execute("CREATE INDEX ix_attendee_last_name_prefix ON attendee (lower(last_name) text_pattern_ops)")
+
+
+def downgrade():
+    op.drop_index('ix_attendee_last_name_prefix', table_name='attendee')
+    op.drop_index('ix_attendee_full_name_prefix', table_name='attendee')
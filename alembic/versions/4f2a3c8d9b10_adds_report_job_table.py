@@ -0,0 +1,79 @@
+"""Adds report_job table
+
+Revision ID: 4f2a3c8d9b10
+Revises: 06b9ad98e471
+Create Date: 2017-12-04 19:32:11.418205
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a3c8d9b10'
+down_revision = '06b9ad98e471'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_table('report_job',
+    sa.Column('id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.Column('admin_account_id', sideboard.lib.sa.UUID(), nullable=True),
+    sa.Column('section', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('handler', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('params', sa.Unicode(), server_default='{}', nullable=False),
+    sa.Column('fingerprint', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('status', sa.Integer(), server_default='52388450', nullable=False),
+    sa.Column('progress', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('filename', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('content_type', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('artifact_path', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('error', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('submitted_time', sideboard.lib.sa.UTCDateTime(), nullable=False),
+    sa.Column('started_time', sideboard.lib.sa.UTCDateTime(), nullable=True),
+    sa.Column('completed_time', sideboard.lib.sa.UTCDateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['admin_account_id'], ['admin_account.id'], name=op.f('fk_report_job_admin_account_id_admin_account'), ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_report_job'))
+    )
+    op.create_index(op.f('ix_report_job_fingerprint'), 'report_job', ['fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_report_job_fingerprint'), table_name='report_job')
+    op.drop_table('report_job')
@@ -0,0 +1,84 @@
+"""Adds denormalized department_name and restricted columns to job
+
+Revision ID: 5b8e0d4c7a26
+Revises: 1c7d2e9f5a31
+Create Date: 2017-12-07 10:22:51.604318
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0d4c7a26'
+down_revision = '1c7d2e9f5a31'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    if is_sqlite:
+        with op.batch_alter_table('job', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.add_column(sa.Column('department_name', sa.Unicode(), server_default='', nullable=False))
+            batch_op.add_column(sa.Column('restricted', sa.Boolean(), server_default='False', nullable=False))
+    else:
+        op.add_column('job', sa.Column('department_name', sa.Unicode(), server_default='', nullable=False))
+        op.add_column('job', sa.Column('restricted', sa.Boolean(), server_default='False', nullable=False))
+
+    op.execute("""
+        UPDATE job SET
+            department_name = COALESCE((SELECT department.name FROM department WHERE department.id = job.department_id), ''),
+            restricted = EXISTS (SELECT 1 FROM job_required_role WHERE job_required_role.job_id = job.id)
+    """)
+
+    if is_sqlite:
+        with op.batch_alter_table('job', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.create_index(op.f('ix_job_restricted'), ['restricted'], unique=False)
+    else:
+        op.create_index(op.f('ix_job_restricted'), 'job', ['restricted'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_restricted'), table_name='job')
+    if is_sqlite:
+        with op.batch_alter_table('job', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.drop_column('restricted')
+            batch_op.drop_column('department_name')
+    else:
+        op.drop_column('job', 'restricted')
+        op.drop_column('job', 'department_name')
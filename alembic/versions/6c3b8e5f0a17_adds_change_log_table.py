@@ -0,0 +1,66 @@
+"""Adds change_log table
+
+Revision ID: 6c3b8e5f0a17
+Revises: 2e6a9c1d7f48
+Create Date: 2017-12-11 16:20:08.447125
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3b8e5f0a17'
+down_revision = '2e6a9c1d7f48'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('model', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('fk_id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.Column('action', sa.Integer(), nullable=False),
+    sa.Column('when', sideboard.lib.sa.UTCDateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq', name=op.f('pk_change_log'))
+    )
+
+
+def downgrade():
+    op.drop_table('change_log')
@@ -0,0 +1,101 @@
+"""Adds shift_hour table
+
+Revision ID: 8d4f1b2a6c93
+Revises: 5b8e0d4c7a26
+Create Date: 2017-12-09 14:03:27.118902
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f1b2a6c93'
+down_revision = '5b8e0d4c7a26'
+branch_labels = None
+depends_on = None
+
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+import sideboard.lib.sa
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_table('shift_hour',
+    sa.Column('attendee_id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.Column('hour', sideboard.lib.sa.UTCDateTime(), nullable=False),
+    sa.Column('shift_id', sideboard.lib.sa.UUID(), nullable=False),
+    sa.ForeignKeyConstraint(['attendee_id'], ['attendee.id'], name=op.f('fk_shift_hour_attendee_id_attendee'), ondelete='cascade'),
+    sa.ForeignKeyConstraint(['shift_id'], ['shift.id'], name=op.f('fk_shift_hour_shift_id_shift'), ondelete='cascade'),
+    sa.PrimaryKeyConstraint('attendee_id', 'hour', name=op.f('pk_shift_hour'))
+    )
+    op.create_index(op.f('ix_shift_hour_hour'), 'shift_hour', ['hour'], unique=False)
+    op.create_index(op.f('ix_shift_hour_shift_id'), 'shift_hour', ['shift_id'], unique=False)
+
+    # Backfill from existing shifts.  Overlapping shifts were only ever
+    # prevented in Python, so if a volunteer already has two shifts at the
+    # same hour we keep the hour of whichever shift was found first.
+    shift_hour = sa.table('shift_hour',
+        sa.column('attendee_id', sideboard.lib.sa.UUID()),
+        sa.column('hour', sideboard.lib.sa.UTCDateTime()),
+        sa.column('shift_id', sideboard.lib.sa.UUID()))
+    shift = sa.table('shift', sa.column('id'), sa.column('attendee_id'), sa.column('job_id'))
+    job = sa.table('job',
+        sa.column('id'),
+        sa.column('start_time', sideboard.lib.sa.UTCDateTime()),
+        sa.column('duration', sa.Integer()))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select([shift.c.id, shift.c.attendee_id, job.c.start_time, job.c.duration])
+        .select_from(shift.join(job, shift.c.job_id == job.c.id))
+        .order_by(shift.c.id))
+
+    seen, hours = set(), []
+    for shift_id, attendee_id, start_time, duration in rows:
+        for k in range(duration):
+            hour = start_time + timedelta(hours=k)
+            if (attendee_id, hour) not in seen:
+                seen.add((attendee_id, hour))
+                hours.append({'attendee_id': attendee_id, 'hour': hour, 'shift_id': shift_id})
+    if hours:
+        op.bulk_insert(shift_hour, hours)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_shift_hour_shift_id'), table_name='shift_hour')
+    op.drop_index(op.f('ix_shift_hour_hour'), table_name='shift_hour')
+    op.drop_table('shift_hour')
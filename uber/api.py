@@ -1,3 +1,5 @@
+from hashlib import sha1
+
 from cherrypy import HTTPError
 from dateutil import parser as dateparser
 from uber.common import *
@@ -26,9 +28,9 @@ def _format_opts(opts):
     return ''.join(html)
 
 
-def _attendee_fields_and_query(full, query):
+def _attendee_serializer_and_query(full, query):
     if full:
-        fields = AttendeeLookup.fields_full
+        serialize = _attendee_full_to_dict
         query = query.options(
             subqueryload(Attendee.dept_memberships),
             subqueryload(Attendee.assigned_depts),
@@ -36,9 +38,67 @@ def _attendee_fields_and_query(full, query):
             subqueryload(Attendee.shifts)
                 .subqueryload(Shift.job))
     else:
-        fields = AttendeeLookup.fields
+        serialize = _attendee_to_dict
         query = query.options(subqueryload(Attendee.dept_memberships))
-    return (fields, query)
+    return (serialize, query)
+
+
+def _attendees_in(session, column, values, full):
+    """
+    Yields the serialized form and each attendee whose column is one of the
+    given values, loading them (and what "full" needs) a chunk at a time.
+    """
+    values = sorted(values)
+    for i in range(0, len(values), 500):
+        query = session.query(Attendee).filter(column.in_(values[i:i + 500]))
+        serialize, query = _attendee_serializer_and_query(full, query)
+        for attendee in query:
+            yield serialize(attendee), attendee
+
+
+def _records_by_id(session, model, ids):
+    if model == 'Attendee':
+        serialize, query = _attendee_serializer_and_query(False, session.query(Attendee).filter(Attendee.id.in_(ids)))
+        return query
+    model = {'Group': Group, 'Job': Job, 'Shift': Shift}[model]
+    return session.query(model).filter(model.id.in_(ids))
+
+
+def _export_page(query, model, allowed, fields, cursor, page_size):
+    """
+    Returns one page of an export: the records of the given query which come
+    after the cursor in order of id, serialized with only the requested
+    fields.  The allowed fields map each field name to its to_dict() spec and
+    the eager loading options it needs, so no caller can ask for more than
+    the export offers.  Paging on the id rather than an offset means every
+    page costs the same however deep into the export it is.
+    """
+    fields = listify(fields)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return {'error': 'Unknown fields: {}'.format(', '.join(map(str, unknown)))}
+
+    try:
+        page_size = c.API_EXPORT_MAX_PAGE_SIZE if page_size is None else int(page_size)
+        if cursor:
+            query = query.filter(model.id > str(uuid.UUID(cursor)))
+    except (TypeError, ValueError):
+        return {'error': 'Invalid cursor or page size'}
+    if page_size < 1:
+        return {'error': 'Invalid cursor or page size'}
+    page_size = min(page_size, c.API_EXPORT_MAX_PAGE_SIZE)
+
+    for field in fields:
+        query = query.options(*allowed[field][1])
+    records = query.order_by(model.id).limit(page_size + 1).all()
+    more, records = len(records) > page_size, records[:page_size]
+
+    serialize = compile_to_dict({field: allowed[field][0] for field in fields})
+    return {
+        'records': [serialize(record) for record in records],
+        'cursor': records[-1].id if more else None,
+        'more': more
+    }
 
 
 def _parse_datetime(d):
@@ -63,15 +123,21 @@ def auth_by_token(required_access):
     except ValueError as ex:
         return (403, 'Invalid auth token, {}: {}'.format(ex, token))
 
-    with Session() as session:
-        api_token = session.query(ApiToken).filter_by(token=token).first()
-        if not api_token:
-            return (403, 'Auth token not recognized: {}'.format(token))
-        if api_token.revoked_time:
-            return (403, 'Revoked auth token: {}'.format(token))
-        if not required_access.issubset(set(api_token.access_ints)):
-            return (403, 'Insufficient access for auth token: {}'.format(token))
-        cherrypy.session['account_id'] = api_token.admin_account_id
+    def load_token():
+        with Session() as session:
+            api_token = session.query(ApiToken).filter_by(token=token).first()
+            if api_token:
+                return api_token.admin_account_id, bool(api_token.revoked_time), set(api_token.access_ints)
+
+    api_token = auth_cache.get(('ApiToken', token), load_token)
+    if not api_token:
+        return (403, 'Auth token not recognized: {}'.format(token))
+    admin_account_id, revoked, access = api_token
+    if revoked:
+        return (403, 'Revoked auth token: {}'.format(token))
+    if not required_access.issubset(access):
+        return (403, 'Insufficient access for auth token: {}'.format(token))
+    cherrypy.session['account_id'] = admin_account_id
     return None
 
 
@@ -83,12 +149,18 @@ def auth_by_session(required_access):
     admin_account_id = cherrypy.session.get('account_id', None)
     if not admin_account_id:
         return (403, 'Missing admin account in session')
-    with Session() as session:
-        admin_account = session.query(AdminAccount).filter_by(id=admin_account_id).first()
-        if not admin_account:
-            return (403, 'Invalid admin account in session')
-        if not required_access.issubset(set(admin_account.access_ints)):
-            return (403, 'Insufficient access for admin account')
+
+    def load_access():
+        with Session() as session:
+            admin_account = session.query(AdminAccount).filter_by(id=admin_account_id).first()
+            if admin_account:
+                return set(admin_account.access_ints)
+
+    access = auth_cache.get(('AdminAccount', admin_account_id), load_access)
+    if access is None:
+        return (403, 'Invalid admin account in session')
+    if not required_access.issubset(access):
+        return (403, 'Insufficient access for admin account')
     return None
 
 
@@ -148,6 +220,10 @@ class AttendeeLookup:
         'ribbon_labels': True,
     }
 
+    export_fields = dict({field: (spec, []) for field, spec in fields.items()}, **{
+        'is_dept_head': (True, [subqueryload(Attendee.dept_memberships)])
+    })
+
     fields_full = dict(fields, **{
         'assigned_depts_labels': True,
         'weighted_hours': True,
@@ -179,13 +255,91 @@ class AttendeeLookup:
         """
         with Session() as session:
             attendee_query = session.query(Attendee).filter_by(badge_num=badge_num)
-            fields, attendee_query = _attendee_fields_and_query(full, attendee_query)
+            serialize, attendee_query = _attendee_serializer_and_query(full, attendee_query)
             attendee = attendee_query.first()
             if attendee:
-                return attendee.to_dict(fields)
+                return serialize(attendee)
             else:
                 return {'error': 'No attendee found with Badge #{}'.format(badge_num)}
 
+    def lookup_many(self, badge_nums, full=False):
+        """
+        Returns many attendees at once by badge number, which is much faster
+        than calling attendee.lookup for each of them.
+
+        Takes a list of badge numbers as the first parameter, and returns an
+        object whose keys are those badge numbers and whose values are what
+        attendee.lookup would return for each of them.
+
+        Optionally, "full" may be passed as the second parameter to return the
+        complete attendee records, including departments, shifts, and food
+        restrictions.
+        """
+        results, by_num = {}, defaultdict(list)
+        for badge_num in badge_nums:
+            try:
+                by_num[int(badge_num)].append(str(badge_num))
+            except (TypeError, ValueError):
+                results[str(badge_num)] = {'error': 'Invalid badge number: {}'.format(badge_num)}
+
+        with Session() as session:
+            for result, attendee in _attendees_in(session, Attendee.badge_num, by_num, full):
+                for key in by_num.pop(attendee.badge_num, []):
+                    results[key] = result
+
+        for keys in by_num.values():
+            for key in keys:
+                results[key] = {'error': 'No attendee found with Badge #{}'.format(key)}
+        return results
+
+    def by_ids(self, ids, full=False):
+        """
+        Returns many attendees at once by id.
+
+        Takes a list of attendee ids as the first parameter, and returns an
+        object whose keys are those ids and whose values are the attendees,
+        with the same fields as attendee.lookup returns.
+
+        Optionally, "full" may be passed as the second parameter to return the
+        complete attendee records, including departments, shifts, and food
+        restrictions.
+        """
+        results, by_id = {}, defaultdict(list)
+        for id in ids:
+            try:
+                by_id[str(uuid.UUID(str(id)))].append(str(id))
+            except ValueError:
+                results[str(id)] = {'error': 'Invalid attendee id: {}'.format(id)}
+
+        with Session() as session:
+            for result, attendee in _attendees_in(session, Attendee.id, by_id, full):
+                for key in by_id.pop(attendee.id, []):
+                    results[key] = result
+
+        for keys in by_id.values():
+            for key in keys:
+                results[key] = {'error': 'No attendee found with id {}'.format(key)}
+        return results
+
+    def export(self, fields=None, cursor=None, page_size=None):
+        """
+        Returns every attendee, a page at a time.
+
+        Optionally takes the list of fields to return for each attendee as
+        the first parameter; these may be any of the fields returned by
+        attendee.lookup, which is also the default.
+
+        To get the next page, pass the "cursor" from the previous page as the
+        second parameter.  The last page has no cursor.
+
+        Optionally takes the number of attendees per page as the third
+        parameter, which is capped at the server's maximum page size.
+        """
+        with Session() as session:
+            return _export_page(
+                session.query(Attendee), Attendee, self.export_fields,
+                fields or sorted(self.fields), cursor, page_size)
+
     def search(self, query, full=False):
         """
         Searches for attendees using a freeform text query. Returns all
@@ -200,8 +354,13 @@ class AttendeeLookup:
         """
         with Session() as session:
             attendee_query = session.search(query)
-            fields, attendee_query = _attendee_fields_and_query(full, attendee_query)
-            return [a.to_dict(fields) for a in attendee_query.limit(100)]
+            serialize, attendee_query = _attendee_serializer_and_query(full, attendee_query)
+            return [serialize(a) for a in attendee_query.limit(100)]
+
+
+# These aren't attributes of AttendeeLookup because @all_api_auth would wrap them.
+_attendee_to_dict = compile_to_dict(AttendeeLookup.fields)
+_attendee_full_to_dict = compile_to_dict(AttendeeLookup.fields_full)
 
 
 @all_api_auth(c.API_UPDATE)
@@ -228,9 +387,24 @@ class JobLookup:
         }
     }
 
+    export_fields = {
+        'job_id': (True, []),
+        'attendee_id': (True, []),
+        'worked': (True, []),
+        'worked_label': (True, []),
+        'rating': (True, []),
+        'rating_label': (True, []),
+        'comment': (True, []),
+        'job': (
+            ['name', 'department_id', 'department_name', 'start_time', 'end_time', 'duration'],
+            [subqueryload(Shift.job).subqueryload(Job.department)]),
+        'attendee': (AttendeeLookup.fields, [
+            subqueryload(Shift.attendee).subqueryload(Attendee.dept_memberships)])
+    }
+
     @department_id_adapter
     @api_auth(c.API_READ)
-    def lookup(self, department_id, start_time=None, end_time=None):
+    def lookup(self, department_id, start_time=None, end_time=None, since_version=None):
         """
         Returns a list of all shifts for the given department.
 
@@ -241,23 +415,83 @@ class JobLookup:
         results to a given date range. Dates may be given in any format
         supported by the
         <a href="http://dateutil.readthedocs.io/en/stable/parser.html">
-        dateutil parser</a>, plus the string "now".
+        dateutil parser</a>, plus the string "now".  Times are rounded down
+        to the minute.
 
         Unless otherwise specified, "start_time" and "end_time" are assumed
         to be in the local timezone of the event.
+
+        Clients which poll this should pass "since_version" as the fourth
+        parameter, which makes this return an object with the "version" of
+        the shifts and the list of "jobs".  Pass the "version" from the last
+        response, or an empty string the first time, and if nothing has
+        changed since then the result is just the "version" and
+        "not_modified".  The version is also sent as the ETag of the
+        response, and sending it back in an If-None-Match header does the
+        same thing.
         """
+        if start_time:
+            start_time = _parse_datetime(start_time).replace(second=0, microsecond=0)
+        if end_time:
+            end_time = _parse_datetime(end_time).replace(second=0, microsecond=0)
+
+        stamp = version_stamps.current([('department', department_id)])
+        key = ResultCache.make_key('uber.api.shifts.lookup', {
+            'department_id': department_id,
+            'start_time': start_time,
+            'end_time': end_time,
+            'stamp': stamp
+        })
+
+        def compute():
+            with Session() as session:
+                query = session.query(Job).filter_by(department_id=department_id)
+                if start_time:
+                    query = query.filter(Job.start_time >= start_time)
+                if end_time:
+                    query = query.filter(Job.start_time <= end_time)
+                query = query.options(
+                        subqueryload(Job.department),
+                        subqueryload(Job.shifts).subqueryload(Shift.attendee))
+                jobs = [_job_to_dict(job) for job in query]
+            version = sha1(json.dumps(jobs, cls=serializer, sort_keys=True).encode('utf-8')).hexdigest()
+            return {'version': version, 'jobs': jobs}
+
+        result = result_cache.fetch(key, CachePolicy(ttl=5 * 60), compute)
+        cherrypy.response.headers['ETag'] = '"{}"'.format(result['version'])
+        cherrypy.response.headers['Cache-Control'] = 'private, no-cache'
+
+        if_none_match = cherrypy.request.headers.get('If-None-Match', '')
+        if since_version == result['version'] or '"{}"'.format(result['version']) in if_none_match:
+            return {'version': result['version'], 'not_modified': True}
+        elif since_version is not None:
+            return result
+        else:
+            return result['jobs']
+
+    @api_auth(c.API_READ)
+    def export(self, fields=None, cursor=None, page_size=None):
+        """
+        Returns every shift, a page at a time.
+
+        Optionally takes the list of fields to return for each shift as the
+        first parameter; these may be any of "job_id", "attendee_id",
+        "worked", "worked_label", "rating", "rating_label", "comment",
+        "job" (the job's name, department and times) and "attendee" (the
+        fields returned by attendee.lookup).  By default every field except
+        "job" and "attendee" is returned.
+
+        To get the next page, pass the "cursor" from the previous page as the
+        second parameter.  The last page has no cursor.
+
+        Optionally takes the number of shifts per page as the third
+        parameter, which is capped at the server's maximum page size.
+        """
+        default_fields = sorted(set(self.export_fields).difference(['job', 'attendee']))
         with Session() as session:
-            query = session.query(Job).filter_by(department_id=department_id)
-            if start_time:
-                start_time = _parse_datetime(start_time)
-                query = query.filter(Job.start_time >= start_time)
-            if end_time:
-                end_time = _parse_datetime(end_time)
-                query = query.filter(Job.start_time <= end_time)
-            query = query.options(
-                    subqueryload(Job.department),
-                    subqueryload(Job.shifts).subqueryload(Shift.attendee))
-            return [job.to_dict(self.fields) for job in query]
+            return _export_page(
+                session.query(Shift), Shift, self.export_fields,
+                fields or default_fields, cursor, page_size)
 
     def assign(self, job_id, attendee_id):
         """
@@ -271,7 +505,46 @@ class JobLookup:
                 return {'error': message}
             else:
                 session.commit()
-                return session.job(job_id).to_dict(self.fields)
+                return _job_to_dict(session.job(job_id))
+
+    def assign_many(self, assignments):
+        """
+        Assigns many shifts at once; every shift which can be assigned is
+        saved in a single transaction.
+
+        Takes a list of [job id, attendee id] pairs as the only parameter.
+
+        Returns the pairs which were "assigned" and a list of "conflicts",
+        each of which gives the job id, attendee id, and the error explaining
+        why that shift couldn't be assigned.
+        """
+        with Session() as session:
+            return uber.assignments.assign_shifts(
+                session, [(attendee_id, job_id) for job_id, attendee_id in assignments]).to_dict()
+
+    @department_id_adapter
+    def autofill(self, department_id, max_hours=None, dry_run=False):
+        """
+        Fills the open slots of every job in the given department with the
+        department's volunteers, giving each slot to whichever eligible
+        volunteer has the fewest weighted hours.
+
+        Takes the department id as the first parameter.
+
+        Optionally takes the most weighted hours any volunteer may be given,
+        and whether this is a "dry_run", in which case the assignments are
+        returned but not saved.
+        """
+        try:
+            hours_limit = float(max_hours) if max_hours not in [None, ''] else None
+        except (TypeError, ValueError):
+            hours_limit = -1
+        if hours_limit is not None and not 0 <= hours_limit < float('inf'):
+            return {'error': 'max_hours must be a non-negative number of hours'}
+
+        with Session() as session:
+            return uber.assignments.autofill_department(
+                session, department_id, max_hours=hours_limit, dry_run=dry_run).to_dict()
 
     def unassign(self, shift_id):
         """
@@ -287,7 +560,7 @@ class JobLookup:
             except:
                 return {'error': 'Shift was already deleted'}
             else:
-                return session.job(shift.job_id).to_dict(self.fields)
+                return _job_to_dict(session.job(shift.job_id))
 
     @docstring_format(
         _format_opts(c.WORKED_STATUS_OPTS),
@@ -332,7 +605,126 @@ class JobLookup:
             except:
                 return {'error': 'Unexpected error setting status'}
             else:
-                return session.job(shift.job_id).to_dict(self.fields)
+                return _job_to_dict(session.job(shift.job_id))
+
+
+_job_to_dict = compile_to_dict(JobLookup.fields)
+
+
+@all_api_auth(c.API_READ)
+class ChangeFeed:
+    """
+    Lets other systems keep their own copy of our attendees, groups, jobs and
+    shifts up to date without downloading all of them over and over.  Call
+    changes.since without a cursor to get the current cursor, download
+    whatever you need, and from then on call changes.since with the cursor
+    from your last call to get only what was created, updated or deleted
+    since then.
+    """
+    fields = {
+        'Attendee': AttendeeLookup.fields,
+        'Group': {
+            'name': True,
+            'tables': True,
+            'leader_id': True,
+            'status_label': True,
+            'amount_paid': True,
+            'cost': True
+        },
+        'Job': {
+            'name': True,
+            'description': True,
+            'department_id': True,
+            'department_name': True,
+            'type_label': True,
+            'start_time': True,
+            'end_time': True,
+            'duration': True,
+            'weight': True,
+            'slots': True,
+            'extra15': True,
+            'restricted': True
+        },
+        'Shift': {
+            'job_id': True,
+            'attendee_id': True,
+            'worked': True,
+            'worked_label': True,
+            'rating': True
+        }
+    }
+
+    def since(self, cursor=None, models=None, limit=1000):
+        """
+        Returns the records which changed since the given cursor, which should
+        be the cursor returned by the previous call.  Without a cursor, this
+        returns only the current cursor.
+
+        Optionally takes the list of models to return changes for as the
+        second parameter: any of "Attendee", "Group", "Job" and "Shift", which
+        is the default.  Always pass the same models with the same cursor.
+
+        Optionally takes the most changes to return as the third parameter.
+        If there were more, "more" is true in the result and the next call
+        will return the rest.
+
+        Returns the new "cursor", "more", and "changes", which has the
+        "created", "updated" and "deleted" records of each model.  Deleted
+        records are only their ids.  A record which changed several times is
+        only returned once, as it is now.
+
+        Changes are only kept for c.CHANGE_LOG_RETENTION_DAYS, so a cursor
+        older than that returns an error; download everything again and
+        start over without a cursor.
+        """
+        models = listify(models or CHANGE_LOG_MODELS)
+        unknown = [model for model in models if model not in self.fields]
+        if unknown:
+            return {'error': 'Unknown models: {}'.format(', '.join(map(str, unknown)))}
+        try:
+            after = int(cursor) if cursor else None
+            limit = max(1, min(int(limit), 5000))
+        except ValueError:
+            return {'error': 'Invalid cursor or limit'}
+
+        with Session() as session:
+            if after is None:
+                latest = session.query(func.max(change_log.c.seq)).scalar()
+                return {'cursor': str(latest or 0), 'more': False, 'changes': {}}
+
+            oldest = session.query(func.min(change_log.c.seq)).scalar()
+            if oldest is not None and after < oldest - 1:
+                return {'error': 'Cursor is older than the change log; download everything again '
+                                 'and call changes.since without a cursor'}
+
+            rows = session.query(change_log.c.seq, change_log.c.model, change_log.c.fk_id, change_log.c.action) \
+                .filter(change_log.c.seq > after, change_log.c.model.in_(models)) \
+                .order_by(change_log.c.seq).limit(limit + 1).all()
+            more, rows = len(rows) > limit, rows[:limit]
+
+            first_action = OrderedDict()
+            for seq, model, fk_id, action in rows:
+                first_action.setdefault((model, fk_id), action)
+
+            changes = {model: {'created': [], 'updated': [], 'deleted': []} for model in models}
+            for model in models:
+                ids = [fk_id for (m, fk_id) in first_action if m == model]
+                found = set()
+                for i in range(0, len(ids), 500):
+                    for instance in _records_by_id(session, model, ids[i:i + 500]):
+                        found.add(instance.id)
+                        kind = 'created' if first_action[model, instance.id] == c.CREATED else 'updated'
+                        changes[model][kind].append(_change_feed_to_dict[model](instance))
+                changes[model]['deleted'] = [id for id in ids if id not in found]
+
+            return {
+                'cursor': str(rows[-1].seq if rows else after),
+                'more': more,
+                'changes': changes
+            }
+
+
+_change_feed_to_dict = {model: compile_to_dict(fields) for model, fields in ChangeFeed.fields.items()}
 
 
 @all_api_auth(c.API_READ)
@@ -381,3 +773,4 @@ if c.API_ENABLED:
     register_jsonrpc(JobLookup(), 'shifts')
     register_jsonrpc(DepartmentLookup(), 'dept')
     register_jsonrpc(ConfigLookup(), 'config')
+    register_jsonrpc(ChangeFeed(), 'changes')
@@ -0,0 +1,202 @@
+"""
+Bulk shift assignment.
+
+Session.assign() checks and commits one shift at a time, which is fine for a
+volunteer signing up for a job, but department heads filling hundreds of
+slots before the event would rather pick everyone at once.  ShiftAssigner
+loads the jobs and volunteers involved up front, locks the jobs, and then
+checks each assignment in memory against that state, including the shifts
+it has already added, so that every shift can be written in one transaction.
+Assignments which can't be made are collected in a conflict report instead of
+stopping the whole batch.
+
+The checks are the same ones Session.assign() makes, in the same order and
+with the same error messages.
+"""
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.orm import subqueryload
+
+from uber.models import Attendee, DeptMembership, Job, Shift
+
+
+__all__ = ['AssignmentReport', 'ShiftAssigner', 'assign_shifts', 'autofill_department']
+
+
+def _chunks(ids, size=500):
+    ids = sorted(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class AssignmentReport:
+    """
+    The outcome of a batch of assignments: "assigned" is a list of the
+    (attendee id, job id) pairs for which shifts were added and "conflicts" is
+    a list of (attendee id, job id, error) tuples for those which were not.
+    """
+    def __init__(self):
+        self.assigned = []
+        self.conflicts = []
+
+    def to_dict(self):
+        return {
+            'assigned': [{'attendee_id': a, 'job_id': j} for a, j in self.assigned],
+            'conflicts': [{'attendee_id': a, 'job_id': j, 'error': error} for a, j, error in self.conflicts]
+        }
+
+
+class ShiftAssigner:
+    """
+    Assigns shifts for the given jobs to the given attendees, checking each
+    assignment against preloaded state.  Nothing is committed; the caller
+    should commit the session to write every shift at once, or roll it back
+    to discard them (e.g. to preview an auto-fill).
+
+    The jobs are locked until the transaction ends, just like
+    Session.assign() does for a single job, so concurrent signups can't fill
+    the same slots.
+
+    Args:
+        session: The Session to load records and add shifts with.
+        jobs: A query or list of the Jobs which may be assigned.
+        attendees: A query or list of the Attendees who may be assigned.
+    """
+    def __init__(self, session, jobs, attendees):
+        self.session = session
+        self.report = AssignmentReport()
+
+        if isinstance(jobs, (list, tuple, set)):
+            jobs = self._load(Job, jobs)
+        if isinstance(attendees, (list, tuple, set)):
+            attendees = self._load(Attendee, attendees)
+
+        self.jobs = {job.id: job for job in jobs.options(
+            subqueryload(Job.department),
+            subqueryload(Job.required_roles))}
+        self.attendees = {attendee.id: attendee for attendee in attendees.options(
+            subqueryload(Attendee.dept_roles),
+            subqueryload(Attendee.shifts).subqueryload(Shift.job))}
+
+        session.lock_jobs(self.jobs)
+        self.taken = defaultdict(int)
+        for chunk in _chunks(self.jobs):
+            self.taken.update(session.query(Shift.job_id, func.count(Shift.id))
+                                     .filter(Shift.job_id.in_(chunk))
+                                     .group_by(Shift.job_id))
+
+        self.hours = {attendee.id: attendee.weighted_hours for attendee in self.attendees.values()}
+
+    def _load(self, model, ids):
+        ids = [id for id in ids if id]
+        if not ids:
+            return self.session.query(model).filter(model.id == None)  # noqa: E711
+        return self.session.query(model).filter(model.id.in_(ids))
+
+    def open_slots(self, job):
+        return max(0, job.slots - self.taken[job.id])
+
+    def check(self, attendee, job):
+        """
+        Returns the error Session.assign() would give for this assignment, or
+        None if it may be made.
+        """
+        if not attendee.has_required_roles(job):
+            return 'You cannot assign an attendee to this shift who ' \
+                'does not have the required roles: ' \
+                '{}'.format(job.required_roles_labels)
+
+        if not self.open_slots(job):
+            return 'All slots for this job have already been filled'
+
+        if not job.no_overlap(attendee):
+            return 'This volunteer is already signed up for a shift ' \
+                'during that time'
+
+    def assign(self, attendee_id, job_id):
+        """
+        Adds a shift for the given attendee and job if the assignment passes
+        check(), and records the outcome in the report.  Returns the error, if
+        any, like Session.assign() does.
+        """
+        attendee, job = self.attendees.get(attendee_id), self.jobs.get(job_id)
+        if not attendee or not job:
+            error = 'No such {}'.format('attendee' if not attendee else 'job')
+        else:
+            error = self.check(attendee, job)
+
+        if error:
+            self.report.conflicts.append((attendee_id, job_id, error))
+        else:
+            self._add_shift(attendee, job)
+        return error
+
+    def _add_shift(self, attendee, job):
+        # Appending to attendee.shifts clears the hours cached on the attendee,
+        # so later overlap checks take this shift into account.
+        self.session.add(Shift(attendee=attendee, job=job))
+        self.taken[job.id] += 1
+        self.hours[attendee.id] += job.weighted_hours
+        self.report.assigned.append((attendee.id, job.id))
+
+    def autofill(self, max_hours=None):
+        """
+        Greedily fills every open slot of our jobs.  Jobs which require roles
+        are filled first, since fewer volunteers can work them, and then the
+        jobs worth the most weighted hours.  Each slot goes to whichever
+        eligible volunteer currently has the fewest weighted hours, so the
+        work is spread out as evenly as weights and extra15 allow; volunteers
+        are never given more than max_hours, if it's given.
+        """
+        jobs = sorted(self.jobs.values(), key=lambda j: (not j.restricted, -j.weighted_hours, j.start_time, j.name))
+        for job in jobs:
+            for i in range(self.open_slots(job)):
+                candidates = [
+                    a for a in self.attendees.values()
+                    if (max_hours is None or self.hours[a.id] + job.weighted_hours <= max_hours)
+                    and not self.check(a, job)]
+                if not candidates:
+                    break
+                self._add_shift(min(candidates, key=lambda a: (self.hours[a.id], a.last_first, a.id)), job)
+        return self.report
+
+
+def assign_shifts(session, pairs, dry_run=False):
+    """
+    Adds a shift for each of the given (attendee id, job id) pairs, and commits
+    them all at once unless dry_run is True.  Returns an AssignmentReport.
+    """
+    pairs = list(pairs)
+    assigner = ShiftAssigner(session, {j for a, j in pairs}, {a for a, j in pairs})
+    for attendee_id, job_id in pairs:
+        assigner.assign(attendee_id, job_id)
+    return _finish(session, assigner.report, dry_run)
+
+
+def autofill_department(session, department_id, max_hours=None, dry_run=False):
+    """
+    Fills the open slots of every job in the given department with the
+    department's volunteers; see ShiftAssigner.autofill().  The shifts are
+    committed unless dry_run is True.  Returns an AssignmentReport.
+    """
+    jobs = session.query(Job).filter(Job.department_id == department_id)
+    attendees = session.query(Attendee).filter(
+        Attendee.staffing == True,  # noqa: E712
+        Attendee.dept_memberships.any(DeptMembership.department_id == department_id))
+    report = ShiftAssigner(session, jobs, attendees).autofill(max_hours)
+    return _finish(session, report, dry_run)
+
+
+def _finish(session, report, dry_run):
+    if dry_run:
+        session.rollback()
+    else:
+        # Our checks can't see shifts which other transactions add for the
+        # same volunteers after we load them, but the shift_hour table's
+        # primary key can, in which case none of our shifts are saved.
+        error = session.commit_shifts()
+        if error:
+            report.conflicts.extend((attendee_id, job_id, error) for attendee_id, job_id in report.assigned)
+            report.assigned = []
+    return report
@@ -0,0 +1,61 @@
+"""
+In-memory cache of what API calls are authenticated against.
+
+Every JSON-RPC call is authenticated either by its X-Auth-Token header or by
+the admin account logged into the browser session, and looking those up used
+to cost a query per call.  auth_by_token() and auth_by_session() in
+uber/api.py instead cache what they need to know about each token and account
+here for a few seconds.
+
+Whenever an ApiToken or AdminAccount is flushed, and again when that
+transaction is committed, the whole cache is discarded; see the session
+listeners in uber/models/__init__.py.  Revoking a token therefore takes
+effect immediately in this process, and within c.API_AUTH_CACHE_SECONDS in
+any other process.
+"""
+import time
+from threading import RLock
+
+from uber.config import c
+
+
+__all__ = ['AuthCache', 'auth_cache']
+
+
+class AuthCache:
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = RLock()
+        self.entries = {}
+        self.generation = 0
+
+    def get(self, key, load):
+        """
+        Returns the cached value for the given key, calling load() to look it
+        up if it's missing or expired.  Values loaded while the cache was
+        being invalidated are returned but not kept, since they may be from
+        before the change.
+        """
+        now = time.time()
+        with self.lock:
+            expires, value = self.entries.get(key, (0, None))
+            if expires > now:
+                return value
+            generation = self.generation
+
+        value = load()
+        with self.lock:
+            if generation == self.generation:
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()  # e.g. someone is trying lots of made up tokens
+                self.entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+auth_cache = AuthCache(c.API_AUTH_CACHE_SECONDS)
@@ -377,7 +377,8 @@ def send_pending_email_report(pending_email_categories, sender):
 
 
 # 86400 seconds = 1 day = 24 hours * 60 minutes * 60 seconds
-DaemonTask(notify_admins_of_any_pending_emails, interval=86400, name="mail pending notification")
+DaemonTask(instrumented_task("mail pending notification", notify_admins_of_any_pending_emails),
+           interval=86400, name="mail pending notification")
 
 
 def get_pending_email_data():
@@ -1,3 +1,5 @@
+from hashlib import sha1
+
 from uber.common import *
 
 
@@ -199,3 +201,43 @@ def needs_badge_num(attendee=None, badge_type=None):
                    and attendee.paid != c.NOT_PAID and attendee.badge_status != c.INVALID_STATUS
         else:
             return badge_type in c.PREASSIGNED_BADGE_TYPES
+
+
+def public_badge_stats():
+    """
+    Returns a snapshot of the badge counts and current badge price for our
+    public, unauthenticated endpoints, which our website and every open
+    prereg tab poll.  Each of these values runs COUNT queries, so rather than
+    computing them per request, the snapshot is kept in the result cache.
+    It doesn't depend on any models, so every process which shares the cache
+    directory uses whichever process's snapshot is newest, and it's only
+    recomputed about once every c.PUBLIC_STATS_CACHE_SECONDS overall.
+
+    Returns:
+        A dict with "badges_sold", "remaining_badges", "badge_price", and
+        "as_of", the unix timestamp of when the snapshot was taken.
+    """
+    def compute():
+        return {
+            'badges_sold': c.BADGES_SOLD,
+            'remaining_badges': c.REMAINING_BADGES,
+            'badge_price': c.BADGE_PRICE,
+            'as_of': int(datetime.utcnow().timestamp())
+        }
+
+    key = ResultCache.make_key('uber.public_badge_stats', {})
+    return result_cache.fetch(key, CachePolicy(ttl=c.PUBLIC_STATS_CACHE_SECONDS), compute)
+
+
+def public_stats_response(data):
+    """
+    Returns the given data, which should come from public_badge_stats(), as
+    JSON with an ETag and a Cache-Control header which let browsers and
+    proxies reuse it for as long as the snapshot is fresh.  Answers with a
+    304 if the client already has this response.
+    """
+    body = json.dumps(data, sort_keys=True)
+    cherrypy.response.headers['ETag'] = '"{}"'.format(sha1(body.encode('utf-8')).hexdigest())
+    cherrypy.response.headers['Cache-Control'] = 'public, max-age={}'.format(c.PUBLIC_STATS_CACHE_SECONDS)
+    cherrypy.lib.cptools.validate_etags()
+    return body
@@ -64,7 +64,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql.expression import FunctionElement, extract
 from sqlalchemy.orm.attributes import get_history, instance_state
 from sqlalchemy.schema import Column, ForeignKey, Index, MetaData, UniqueConstraint
-from sqlalchemy.orm import Query, relationship, joinedload, subqueryload, backref
+from sqlalchemy.orm import Query, relationship, joinedload, subqueryload, undefer, backref
 from sqlalchemy.types import Boolean, Integer, Float, TypeDecorator, Date, Numeric
 from sqlalchemy.util import immutabledict, classproperty
 
@@ -77,7 +77,13 @@ from uber.amazon_ses import AmazonSES, EmailMessage  # TODO: replace this after
 from uber.config import c, Config, SecretConfig
 from uber.jinja import *
 from uber.utils import *
+from uber.intervals import *
 from uber.reports import *
+from uber.result_cache import *
+from uber.versions import *
+from uber.auth_cache import *
+from uber.serializers import *
+from uber.metrics import *
 from uber.decorators import *
 from uber.models import *
 from uber.models.types import *
@@ -85,9 +91,13 @@ from uber.models.promo_code import *
 from uber.automated_emails_server import *
 from uber.automated_emails import *
 from uber.badge_funcs import *
+from uber.report_jobs import *
 from uber.menu import *
 from uber import model_checks
 from uber import custom_tags
 from uber import server
 from uber import sep_commands
+from uber import merch
+from uber import money
+from uber import assignments
 import uber.api
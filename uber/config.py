@@ -744,7 +744,8 @@ c.JOB_LOCATION_OPTS.sort(key=lambda tup: tup[1])
 c.JOB_PAGE_OPTS = (
     ('index',    'Calendar View'),
     ('signups',  'Signups View'),
-    ('staffers', 'Staffer Summary')
+    ('staffers', 'Staffer Summary'),
+    ('bulk_assign', 'Bulk Assignment')
 )
 c.WEIGHT_OPTS = (
     ('1.0', 'x1.0'),
@@ -205,19 +205,32 @@ def ajax_gettable(func):
     return returns_json
 
 
+def report_job_runner(wrapper):
+    """
+    Mark the innermost wrapper of a file-generating page handler so that the
+    report job queue can call it directly with set_headers=False, bypassing
+    the rendering and request-only decorators which are applied on top of it.
+    """
+    wrapper.report_job_runner = wrapper
+    return wrapper
+
+
 def multifile_zipfile(func):
     func.site_mappable = True
+    func.output_file_extension = 'zip'
 
+    @report_job_runner
     @wraps(func)
-    def zipfile_out(self, session):
+    def zipfile_out(self, session, set_headers=True):
         zipfile_writer = BytesIO()
         with zipfile.ZipFile(zipfile_writer, mode='w') as zip_file:
             func(self, zip_file, session)
 
         # must do this after creating the zip file as other decorators may have changed this
         # for example, if a .zip file is created from several .csv files, they may each set content-type.
-        cherrypy.response.headers['Content-Type'] = 'application/zip'
-        cherrypy.response.headers['Content-Disposition'] = 'attachment; filename=' + func.__name__ + '.zip'
+        if set_headers:
+            cherrypy.response.headers['Content-Type'] = 'application/zip'
+            cherrypy.response.headers['Content-Disposition'] = 'attachment; filename=' + func.__name__ + '.zip'
 
         return zipfile_writer.getvalue()
     return zipfile_out
@@ -237,6 +250,7 @@ def xlsx_file(func):
 
     func.output_file_extension = 'xlsx'
 
+    @report_job_runner
     @wraps(func)
     def xlsx_out(self, session, set_headers=True, **kwargs):
         rawoutput = BytesIO()
@@ -272,6 +286,7 @@ def csv_file(func):
 
     func.output_file_extension = 'csv'
 
+    @report_job_runner
     @wraps(func)
     def csvout(self, session, set_headers=True, **kwargs):
         writer = StringIO()
@@ -344,34 +359,92 @@ def credit_card(func):
     return charge
 
 
-def cached(func):
-    func.cached = True
-    return func
+def cached(func=None, *, ttl=15 * 60, stale=0, depends_on=(), per_account=None):
+    """
+    Mark a page handler as cacheable; see CachePolicy for what the arguments
+    mean.  This can be used either bare or with arguments, e.g.
+
+        @cached
+        def shirt_counts(self, session):
+            ...
+
+        @cached(ttl=300, stale=600, depends_on=[Attendee, Shift])
+        def staffing_overview(self, session, department_id=''):
+            ...
+
+    Results are keyed on the handler's arguments and the current admin's
+    access levels, so different parameters and access levels never share a
+    cached page.
+    """
+    def _decorator(func):
+        func.cached = CachePolicy(ttl=ttl, stale=stale, depends_on=depends_on, per_account=per_account)
+        return func
+
+    return _decorator if func is None else _decorator(func)
 
 
 def cached_page(func):
     innermost = get_innermost(func)
-    if hasattr(innermost, 'cached'):
-        from sideboard.lib import config as sideboard_config
-        func.lock = RLock()
+    policy = getattr(innermost, 'cached', None)
+    if not policy:
+        return func
+    elif not isinstance(policy, CachePolicy):
+        policy = CachePolicy()  # plugins which set func.cached = True themselves
+
+    name = func.__module__ + '.' + func.__name__
+    per_account = policy.per_account
+    if per_account is None:
+        per_account = not hasattr(innermost, 'output_file_extension')
+
+    def compute(key, args, kwargs):
+        generations = result_cache.snapshot(policy)
+        contents = func(*args, **kwargs)
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+        headers = {k: cherrypy.response.headers[k] for k in ['Content-Type', 'Content-Disposition']
+                   if k in cherrypy.response.headers}
+        result_cache.set(key, (contents, cherrypy.session.get('csrf_token'), headers), generations)
+        return contents
+
+    def from_cache(contents, csrf_token, headers):
+        cherrypy.response.headers.update(headers)
+
+        # rendered pages embed the CSRF token of whichever session rendered them
+        if csrf_token and csrf_token != cherrypy.session.get('csrf_token'):
+            ensure_csrf_token_exists()
+            contents = contents.replace(csrf_token.encode('utf-8'), cherrypy.session['csrf_token'].encode('utf-8'))
+        return contents
 
-        @wraps(func)
-        def with_caching(*args, **kwargs):
-            fpath = os.path.join(sideboard_config['root'], 'data', func.__module__ + '.' + func.__name__)
-            with func.lock:
-                if not os.path.exists(fpath) or datetime.now().timestamp() - os.stat(fpath).st_mtime > 60 * 15:
-                    contents = func(*args, **kwargs)
-                    with open(fpath, 'wb') as f:
-                        # Try to write assuming content is a byte first, then try it as a string
+    @wraps(func)
+    def with_caching(*args, **kwargs):
+        account_id = cherrypy.session.get('account_id') if per_account else None
+        params = {k: v for k, v in kwargs.items() if k not in ('session', 'csrf_token')}
+        params['_args'] = args[1:]
+        key = result_cache.make_key(name, params, sa.AdminAccount.access_set(), account_id)
+
+        entry, is_fresh = result_cache.get(key, policy)
+        if entry is not None:
+            if not is_fresh:
+                def revalidate():
+                    lock = result_cache.key_lock(key)
+                    if lock.acquire(blocking=False):
                         try:
-                            f.write(contents)
-                        except:
-                            f.write(bytes(contents, 'UTF-8'))
-                with open(fpath, 'rb') as f:
-                    return f.read()
-        return with_caching
-    else:
-        return func
+                            compute(key, args, kwargs)
+                        except Exception:
+                            log.error('unable to revalidate cached page {}', name, exc_info=True)
+                        finally:
+                            lock.release()
+
+                # regenerate in this thread after the stale page has been sent, so that the page
+                # is rendered with the same request, session and access levels as a normal hit
+                cherrypy.request.hooks.attach('on_end_request', revalidate)
+
+            return from_cache(*entry)
+
+        with result_cache.key_lock(key):
+            entry, is_fresh = result_cache.get(key, policy)
+            return from_cache(*entry) if is_fresh else compute(key, args, kwargs)
+    return with_caching
 
 
 def timed(func):
@@ -519,12 +592,30 @@ def restricted(func):
     return with_restrictions
 
 
+def instrumented(func):
+    """
+    Records the latency, status and response size of every call of this page
+    handler under its site section; see uber/metrics.py.
+    """
+    section, handler = get_module_name(func), func.__name__
+
+    @wraps(func)
+    def with_metrics(*args, **kwargs):
+        with metrics.track('page', section, handler) as outcome:
+            result = func(*args, **kwargs)
+            outcome['status'] = str(cherrypy.response.status or 200).split()[0]
+            if isinstance(result, (bytes, str)):
+                outcome['size'] = len(result)
+            return result
+    return with_metrics
+
+
 def set_renderable(func, access):
     """
     Return a function that is flagged correctly and is ready to be called by cherrypy as a request
     """
     func.restricted = getattr(func, 'restricted', access)
-    new_func = profile(timed(cached_page(sessionized(restricted(renderable(func))))))
+    new_func = profile(instrumented(timed(cached_page(sessionized(restricted(renderable(func)))))))
     new_func.exposed = True
     return new_func
 
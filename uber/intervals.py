@@ -0,0 +1,187 @@
+"""
+Interval indexes over job time ranges.
+
+Job.no_overlap() and several staffing reports need to know which jobs share
+an hour with some other job.  This used to be done by expanding every job into
+the set of datetimes returned by Job.hours and intersecting those sets, which
+gets slow when thousands of jobs are compared against thousands of volunteers.
+
+IntervalIndex instead keeps jobs sorted by start time, so that the jobs which
+overlap a given range can be found with a binary search.  Two jobs are treated
+as sharing an hour in exactly the cases where their Job.hours sets intersect:
+their time ranges overlap AND their start times are a whole number of hours
+apart.  The tests in uber/tests/test_intervals.py compare the two approaches.
+
+HourSlots is a compact form of the same sets of hours, which Job and Attendee
+cache so that checking whether a volunteer is free for a job is a bitwise AND.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from operator import attrgetter, itemgetter
+
+from pytz import UTC
+
+
+__all__ = ['HourSlots', 'IntervalIndex', 'exceeds_hours_in_window']
+
+
+ONE_HOUR = timedelta(hours=1)
+
+# HourSlots number hours from this point; it's arbitrary, since a bitmask only
+# ever needs to be as wide as the span of hours it covers.
+SLOT_ORIGIN = datetime(2000, 1, 1, tzinfo=UTC)
+
+
+def _on_same_hours(start, other_start):
+    return (other_start - start) % ONE_HOUR == timedelta(0)
+
+
+class IntervalIndex:
+    """
+    A static index of items which each cover a half-open [start, end) range of
+    time; by default these are Jobs and the range is [start_time, end_time).
+
+    Items are sorted by start time and we remember the longest range, so every
+    item overlapping [start, end) must start somewhere between start minus the
+    longest range and end; only that slice of the index is ever examined.
+    Items with empty ranges (e.g. jobs with a duration of zero) never overlap
+    anything, just as their Job.hours sets are empty.
+    """
+    def __init__(self, items, start=attrgetter('start_time'), end=attrgetter('end_time')):
+        entries = [(start(item), end(item), position, item) for position, item in enumerate(items)]
+        self.entries = sorted([e for e in entries if e[0] < e[1]], key=itemgetter(0, 2))
+        self.starts = [e[0] for e in self.entries]
+        self.longest = max([e[1] - e[0] for e in self.entries], default=timedelta(0))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _overlapping(self, start, end):
+        if start >= end or not self.entries:
+            return []
+
+        lo = bisect_left(self.starts, start - self.longest)
+        hi = bisect_left(self.starts, end)
+        return [e for e in self.entries[lo:hi] if e[1] > start]
+
+    def overlapping(self, start, end):
+        """
+        Returns the items whose ranges overlap [start, end), ordered by their
+        start times.
+        """
+        return [item for _, _, _, item in self._overlapping(start, end)]
+
+    def sharing_hours(self, job):
+        """
+        Returns the items which share at least one hour with the given job,
+        i.e. the items for which job.hours.intersection(item.hours) would be
+        non-empty, ordered by their start times.
+        """
+        return [item for item_start, _, _, item in self._overlapping(job.start_time, job.end_time)
+                if _on_same_hours(job.start_time, item_start)]
+
+    def at_hour(self, hour):
+        """
+        Returns the item which covers the given hour, or None.  If several items
+        do, the one given last to the constructor wins, which matches the way
+        Attendee.hour_map is built from Attendee.shifts.
+        """
+        matches = [e for e in self._overlapping(hour, hour + ONE_HOUR) if _on_same_hours(hour, e[0])]
+        return max(matches, key=itemgetter(2))[3] if matches else None
+
+
+class HourSlots:
+    """
+    An immutable set of hours, e.g. Job.hours or Attendee.hours, stored as
+    bitmasks so that unions and intersection tests are bitwise operations.
+
+    Hours are grouped by their "phase", i.e. how far past the hour they start,
+    since hours which start at different minutes can never be equal.  For each
+    phase we store a (base, mask) tuple, where bit i of the mask represents
+    the hour which starts base + i hours after SLOT_ORIGIN (plus the phase).
+    Nearly every job starts on the hour, so there's normally just one phase.
+    """
+    __slots__ = ['masks']
+
+    def __init__(self, masks=None):
+        self.masks = masks or {}
+
+    @classmethod
+    def from_range(cls, start, hours):
+        """
+        Returns the slots for the given number of hours beginning at start,
+        i.e. the same hours as Job(start_time=start, duration=hours).hours.
+        """
+        if not start or not hours or hours <= 0:
+            return cls()
+        index, phase = divmod(start - SLOT_ORIGIN, ONE_HOUR)
+        return cls({phase: (index, (1 << hours) - 1)})
+
+    @classmethod
+    def union(cls, slots):
+        masks = {}
+        for other in slots:
+            for phase, (base, mask) in other.masks.items():
+                if phase in masks:
+                    current_base, current_mask = masks[phase]
+                    new_base = min(base, current_base)
+                    mask = (mask << (base - new_base)) | (current_mask << (current_base - new_base))
+                    base = new_base
+                masks[phase] = (base, mask)
+        return cls(masks)
+
+    def __or__(self, other):
+        return HourSlots.union([self, other])
+
+    def __bool__(self):
+        return bool(self.masks)
+
+    def __len__(self):
+        return sum(bin(mask).count('1') for base, mask in self.masks.values())
+
+    def __contains__(self, hour):
+        index, phase = divmod(hour - SLOT_ORIGIN, ONE_HOUR)
+        if phase not in self.masks:
+            return False
+        base, mask = self.masks[phase]
+        return index >= base and bool((mask >> (index - base)) & 1)
+
+    def __iter__(self):
+        for phase, (base, mask) in sorted(self.masks.items()):
+            i = 0
+            while mask >> i:
+                if (mask >> i) & 1:
+                    yield SLOT_ORIGIN + phase + (base + i) * ONE_HOUR
+                i += 1
+
+    def intersects(self, other):
+        for phase, (base, mask) in self.masks.items():
+            if phase in other.masks:
+                other_base, other_mask = other.masks[phase]
+                if base >= other_base:
+                    if (mask << (base - other_base)) & other_mask:
+                        return True
+                elif mask & (other_mask << (other_base - base)):
+                    return True
+        return False
+
+
+def exceeds_hours_in_window(hours, window_starts, window, threshold):
+    """
+    Returns True if, for any of the given window_starts, at least threshold of
+    the given hours fall on one of the window hours following that start time,
+    i.e. are in [start + timedelta(hours=i) for i in range(window)].
+
+    Args:
+        hours: A sorted list of datetimes, e.g. sorted(attendee.hours).
+        window_starts: The datetimes at which each window begins.
+        window: The number of hours in each window.
+        threshold: How many of the hours must fall within a single window.
+    """
+    length = timedelta(hours=window)
+    for start in window_starts:
+        lo = bisect_left(hours, start)
+        hi = bisect_left(hours, start + length)
+        if hi - lo >= threshold and len([h for h in hours[lo:hi] if _on_same_hours(start, h)]) >= threshold:
+            return True
+    return False
@@ -81,6 +81,7 @@ c.MENU = MenuItem(name='Root', submenu=[
         MenuItem(name='Departments', href='../departments/', access=c.PEOPLE),
         MenuItem(name='Department Checklists', href='../dept_checklist/overview', access=c.PEOPLE),
         MenuItem(name='Feed of Database Changes', href='../registration/feed', access=c.PEOPLE),
+        MenuItem(name='Background Reports', href='../reports/', access=[c.STATS, c.MONEY, c.PEOPLE]),
     ]),
 
     MenuItem(name='People', access=[c.PEOPLE, c.REG_AT_CON], submenu=[
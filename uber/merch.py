@@ -0,0 +1,153 @@
+"""
+SQL-backed merch accounting.
+
+The shirt reports used to load every valid attendee along with their groups,
+department memberships and shifts, and then evaluate properties such as
+Attendee.num_staff_shirts_owed for each one.  The functions in this module
+express those same properties as SQL expressions so that the counts can be
+computed with a single grouped query per report.  The expressions below must
+be kept in sync with the corresponding properties on Attendee; the tests in
+uber/tests/test_merch_counts.py compare the two.
+"""
+from collections import defaultdict, OrderedDict
+from datetime import datetime
+
+from pytz import UTC
+from sqlalchemy import and_, func, or_
+from sqlalchemy.sql import case, literal
+
+from uber.config import c
+from uber.models import Attendee
+
+
+def _valid_badge():
+    # Matches the filter used by Session.all_attendees()
+    return Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])
+
+
+def _count_if(condition):
+    return case([(condition, 1)], else_=0)
+
+
+def has_ribbon(ribbon):
+    """
+    SQL equivalent of "ribbon in attendee.ribbon_ints".  Ribbons are stored as
+    a comma separated list of integers.
+    """
+    return literal(',').concat(Attendee.ribbon).concat(',').like('%,{},%'.format(ribbon))
+
+
+def gets_staff_shirt():
+    return Attendee.badge_type == c.STAFF_BADGE
+
+
+def paid_for_a_shirt():
+    return Attendee.amount_extra >= c.SHIRT_LEVEL
+
+
+def volunteer_event_shirt_eligible():
+    if c.STAFF_ELIGIBLE_FOR_SWAG_SHIRT:
+        return or_(gets_staff_shirt(), has_ribbon(c.VOLUNTEER_RIBBON))
+    return and_(Attendee.badge_type != c.STAFF_BADGE, has_ribbon(c.VOLUNTEER_RIBBON))
+
+
+def replacement_staff_shirts():
+    return _count_if(and_(
+        gets_staff_shirt(),
+        Attendee.second_shirt.in_([c.UNKNOWN, c.STAFF_AND_EVENT_SHIRT])))
+
+
+def num_event_shirts_owed():
+    return _count_if(paid_for_a_shirt()) + _count_if(volunteer_event_shirt_eligible()) + replacement_staff_shirts()
+
+
+def num_staff_shirts_owed():
+    return case([(gets_staff_shirt(), c.SHIRTS_PER_STAFFER - replacement_staff_shirts())], else_=0)
+
+
+def _size_labels():
+    labels = ['size unknown'] + [label for val, label in c.SHIRT_OPTS][1:]
+    choices = Attendee.get_field('shirt').type.choices
+
+    def label(shirt):
+        shirt_label = choices.get(shirt) or 'size unknown'
+        return 'size unknown' if shirt_label == c.SHIRTS[c.NO_SHIRT] else shirt_label
+
+    def sort(counts):
+        return sorted(counts.items(), key=lambda tup: labels.index(tup[0]))
+
+    return label, sort
+
+
+def shirt_manufacturing_counts(session):
+    """
+    Returns the same categories as the summary.shirt_manufacturing_counts page
+    has always shown: a list of (name, [(size label, count), ...]) tuples.
+    """
+    label, sort = _size_labels()
+    counts = defaultdict(lambda: defaultdict(int))
+
+    rows = session.query(
+            Attendee.shirt,
+            func.sum(num_staff_shirts_owed()),
+            func.sum(num_event_shirts_owed())) \
+        .filter(_valid_badge()) \
+        .group_by(Attendee.shirt)
+
+    for shirt, staff_shirts, event_shirts in rows:
+        counts['staff'][label(shirt)] += int(staff_shirts or 0)
+        counts['event'][label(shirt)] += int(event_shirts or 0)
+
+    categories = []
+    if c.SHIRTS_PER_STAFFER > 0:
+        categories.append(('Staff Uniform Shirts', sort(counts['staff'])))
+
+    categories.append(('Event Shirts', sort(counts['event'])))
+    return categories
+
+
+def shirt_counts(session):
+    """
+    Returns a tuple of (categories, sales_by_week) with the same structure the
+    summary.shirt_counts page has always shown.
+    """
+    label, sort = _size_labels()
+    status = lambda got_merch: 'picked_up' if got_merch else 'outstanding'
+    counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+    rows = session.query(
+            Attendee.shirt,
+            Attendee.got_merch,
+            func.sum(num_staff_shirts_owed()),
+            func.sum(num_event_shirts_owed()),
+            func.sum(_count_if(or_(volunteer_event_shirt_eligible(), replacement_staff_shirts() == 1))),
+            func.sum(_count_if(paid_for_a_shirt()))) \
+        .filter(_valid_badge()) \
+        .group_by(Attendee.shirt, Attendee.got_merch)
+
+    for shirt, got_merch, staff_shirts, event_shirts, free_shirts, paid_shirts in rows:
+        for category, count in [
+                ('all_staff_shirts', staff_shirts),
+                ('all_event_shirts', event_shirts),
+                ('free_event_shirts', free_shirts),
+                ('paid_event_shirts', paid_shirts)]:
+            if count or category.startswith('all_'):
+                counts[category][label(shirt)][status(got_merch)] += int(count or 0)
+
+    sales_by_week = OrderedDict([(i, 0) for i in range(50)])
+    end = min(datetime.now(UTC), c.ESCHATON)
+    for registered, in session.query(Attendee.registered).filter(_valid_badge(), paid_for_a_shirt()):
+        sales_by_week[(end - registered).days // 7] += 1
+
+    for week in range(48, -1, -1):
+        sales_by_week[week] += sales_by_week[week + 1]
+
+    categories = [
+        ('Free Event Shirts', sort(counts['free_event_shirts'])),
+        ('Paid Event Shirts', sort(counts['paid_event_shirts'])),
+        ('All Event Shirts', sort(counts['all_event_shirts'])),
+    ]
+    if c.SHIRTS_PER_STAFFER > 0:
+        categories.append(('Staff Shirts', sort(counts['all_staff_shirts'])))
+
+    return categories, sales_by_week
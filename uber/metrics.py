@@ -0,0 +1,150 @@
+"""
+Latency, status, response size and in-flight metrics for everything which
+does work on behalf of a request or a schedule: page handlers, JSON-RPC
+methods, and daemon tasks.
+
+Page handlers are recorded by @instrumented in set_renderable(), JSON-RPC
+methods by register_jsonrpc() in uber/server.py, and daemon tasks by
+instrumented_task().  Everything is labelled with its kind ("page",
+"jsonrpc" or "task"), its section (the site section, the JSON-RPC service,
+or the task name) and its handler, and devtools/metrics serves it all in the
+Prometheus text format.  Like our other in-memory state, each process keeps
+its own metrics, so scrape each process separately.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from threading import RLock
+
+
+__all__ = ['Histogram', 'Metrics', 'instrumented_task', 'metrics']
+
+
+# The upper bounds of the histogram buckets, in seconds and bytes respectively.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns a list of (upper bound, number of observations no larger than
+        it) for every bucket, ending with ('+Inf', count).
+        """
+        total, result = 0, []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.sizes = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+            self.statuses = defaultdict(int)
+            self.in_flight = defaultdict(int)
+
+    @contextmanager
+    def track(self, kind, section, handler):
+        """
+        Records how long the body of this "with" block takes.  It yields a
+        dict in which the block may set the "status" and the "size" of its
+        response in bytes.  The status defaults to "ok", or to the status of
+        the exception if the block raises one (e.g. an HTTPRedirect or
+        HTTPError), or else to "error".
+        """
+        outcome = {'status': 'ok', 'size': None}
+        with self.lock:
+            self.in_flight[kind, section] += 1
+        start = time.perf_counter()
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome['status'] = getattr(e, 'status', None) or 'error'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.in_flight[kind, section] -= 1
+                self.latency[kind, section, handler].observe(elapsed)
+                self.statuses[kind, section, handler, str(outcome['status'])] += 1
+                if outcome['size'] is not None:
+                    self.sizes[kind, section, handler].observe(outcome['size'])
+
+    def instrument(self, kind, section, handler):
+        """
+        Decorator which records every call of the function with track().
+        """
+        def decorator(func):
+            @wraps(func)
+            def with_metrics(*args, **kwargs):
+                with self.track(kind, section, handler):
+                    return func(*args, **kwargs)
+            return with_metrics
+        return decorator
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            lines.append('# HELP uber_in_flight Number of requests or tasks currently being handled.')
+            lines.append('# TYPE uber_in_flight gauge')
+            for (kind, section), count in sorted(self.in_flight.items()):
+                lines.append('uber_in_flight{} {}'.format(_labels(kind=kind, section=section), count))
+
+            lines.append('# HELP uber_handled_total Number of requests or tasks handled, by status.')
+            lines.append('# TYPE uber_handled_total counter')
+            for (kind, section, handler, status), count in sorted(self.statuses.items()):
+                labels = _labels(kind=kind, section=section, handler=handler, status=status)
+                lines.append('uber_handled_total{} {}'.format(labels, count))
+
+            for name, description, histograms in [
+                    ('uber_latency_seconds', 'Time taken to handle each request or task.', self.latency),
+                    ('uber_response_bytes', 'Size of each page response.', self.sizes)]:
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for (kind, section, handler), histogram in sorted(histograms.items()):
+                    labels = dict(kind=kind, section=section, handler=handler)
+                    for bound, count in histogram.cumulative():
+                        lines.append('{}_bucket{} {}'.format(name, _labels(le=bound, **labels), count))
+                    lines.append('{}_sum{} {}'.format(name, _labels(**labels), histogram.sum))
+                    lines.append('{}_count{} {}'.format(name, _labels(**labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def instrumented_task(name, func):
+    """
+    Returns func wrapped to record each of its runs as the daemon task with
+    the given name; pass the result to DaemonTask.
+    """
+    return metrics.instrument('task', name, getattr(func, '__name__', name))(func)
@@ -1,8 +1,10 @@
+import json
 import re
 import uuid
 from collections import defaultdict
 from datetime import date, datetime, timedelta
 from functools import wraps
+from hashlib import sha1
 from itertools import chain
 from uuid import uuid4
 
@@ -11,7 +13,7 @@ import cherrypy
 import six
 import sqlalchemy
 from dateutil import parser as dateparser
-from sideboard.lib import listify, log, on_startup, stopped
+from sideboard.lib import listify, log, on_startup, serializer, stopped
 from sideboard.lib.sa import check_constraint_naming_convention, \
     declarative_base, JSON, SessionManager, UTCDateTime, UUID
 from sqlalchemy import and_, func, or_, not_
@@ -23,12 +25,16 @@ from sqlalchemy.schema import MetaData
 from sqlalchemy.types import Boolean, Integer, Float, Date, Numeric
 from sqlalchemy.util import immutabledict
 
+from uber.auth_cache import auth_cache
 from uber.config import c, create_namespace_uuid
 from uber.decorators import cached_classproperty, classproperty, \
     cost_property, department_id_adapter, presave_adjustment, suffix_property
 from uber.models.types import Choice, DefaultColumn as Column, MultiChoice
+from uber.result_cache import CachePolicy, ResultCache, result_cache
+from uber.serializers import compile_to_dict
 from uber.utils import check_csrf, get_real_badge_type, DeptChecklistConf, \
     HTTPRedirect
+from uber.versions import ALL_ATTENDEES, ALL_DEPARTMENTS, STAFFER_ROSTER, version_stamps
 
 
 # Consistent naming conventions are necessary for alembic to be able to
@@ -489,16 +495,27 @@ from uber.models.group import *  # noqa: F401,E402,F403
 from uber.models.tracking import *  # noqa: F401,E402,F403
 from uber.models.types import *  # noqa: F401,E402,F403
 from uber.models.api import *  # noqa: F401,E402,F403
+from uber.models.report import *  # noqa: F401,E402,F403
 
 # Explicitly import models used by the Session class to quiet flake8
 from uber.models.admin import AdminAccount, WatchList  # noqa: E402
-from uber.models.department import Job, Shift, Department  # noqa: E402
+from uber.models.api import ApiToken  # noqa: E402
+from uber.models.tracking import CHANGE_LOG_LOCK_ID, CHANGE_LOG_MODELS, change_log  # noqa: E402
+from uber.models.department import Job, Shift, Department, DeptMembership, DeptRole  # noqa: E402
+from uber.models.department import job_required_role, refresh_attendee_hours, refresh_job_columns  # noqa: E402
+from uber.models.department import refresh_shift_hours  # noqa: E402
 from uber.models.attendee import Attendee  # noqa: E402
 from uber.models.email import Email  # noqa: E402
 from uber.models.group import Group  # noqa: E402
 from uber.models.tracking import Tracking  # noqa: E402
 
 
+_signup_job_to_dict = compile_to_dict([
+    'name', 'department_name', 'description', 'weight',
+    'start_time_local', 'end_time_local', 'duration',
+    'weighted_hours', 'restricted', 'extra15', 'taken'])
+
+
 class Session(SessionManager):
     # This looks strange, but `sqlalchemy.create_engine` will throw an error
     # if it's passed arguments that aren't supported by the given DB engine.
@@ -648,21 +665,78 @@ class Session(SessionManager):
                 }
 
         def jobs_for_signups(self):
-            fields = [
-                'name', 'department_name', 'description', 'weight',
-                'start_time_local', 'end_time_local', 'duration',
-                'weighted_hours', 'restricted', 'extra15', 'taken']
             jobs = self.logged_in_volunteer().possible_and_current
             restricted_hours = set()
             for job in jobs:
                 if job.required_roles:
                     restricted_hours.add(frozenset(job.hours))
             return [
-                job.to_dict(fields)
+                _signup_job_to_dict(job)
                 for job in jobs
                 if (job.required_roles
                     or frozenset(job.hours) not in restricted_hours)]
 
+        def signups_version(self, attendee):
+            """
+            Returns the newest version stamp of everything which
+            jobs_for_signups() depends on for this volunteer: the volunteer
+            themselves, the departments they're in, and the departments of
+            the jobs they've already signed up for.  At the con every job is
+            open to every volunteer, so this depends on all departments.
+            """
+            keys = [('attendee', attendee.id)]
+            if c.AT_THE_CON:
+                keys.append(ALL_DEPARTMENTS)
+            else:
+                memberships = self.query(DeptMembership.department_id) \
+                    .filter(DeptMembership.attendee_id == attendee.id)
+                shift_depts = self.query(Job.department_id) \
+                    .join(Shift, Shift.job_id == Job.id) \
+                    .filter(Shift.attendee_id == attendee.id)
+                keys.extend(('department', id) for id, in memberships.union(shift_depts))
+            return version_stamps.current(keys)
+
+        def versioned_jobs_for_signups(self, version, since=None):
+            """
+            Returns the logged in volunteer's jobs_for_signups() as of the
+            given version stamp, which should come from signups_version().
+            Results are cached by volunteer and version, so polling is cheap
+            until something the volunteer can see has changed.
+
+            If since is the version of an earlier result which is still
+            cached, only the jobs which were added or changed since then are
+            returned, along with the ids of the jobs which were removed.
+
+            Returns:
+                A dict with the current "version" and the "jobs".  Partial
+                results also have "since" and "removed" keys.  Full results
+                have an "etag" key, which is a hash of the jobs.
+            """
+            volunteer = self.logged_in_volunteer()
+            policy = CachePolicy(ttl=5 * 60)
+
+            def key(version):
+                return ResultCache.make_key('uber.signups.jobs', {'attendee_id': volunteer.id, 'version': version})
+
+            def compute():
+                jobs = self.jobs_for_signups()
+                etag = sha1(json.dumps(jobs, cls=serializer, sort_keys=True).encode('utf-8')).hexdigest()
+                return {'version': version, 'jobs': jobs, 'etag': etag}
+
+            current = result_cache.fetch(key(version), policy, compute)
+            previous, is_fresh = result_cache.get(key(since), policy) if since else (None, False)
+            if previous is None:
+                return current
+
+            previous_jobs = {job['id']: job for job in previous['jobs']}
+            current_ids = {job['id'] for job in current['jobs']}
+            return {
+                'version': version,
+                'since': previous['version'],
+                'jobs': [job for job in current['jobs'] if previous_jobs.get(job['id']) != job],
+                'removed': [id for id in previous_jobs if id not in current_ids]
+            }
+
         def guess_attendee_watchentry(self, attendee):
             or_clauses = [
                 func.lower(WatchList.first_names).contains(
@@ -1003,13 +1077,183 @@ class Session(SessionManager):
                     .subqueryload(Attendee.group)) \
                 .order_by(Job.start_time, Job.name)
 
+        def schedule_grid(self, department_id=None):
+            """
+            Returns everything the jobs.index schedule page shows about a
+            department's jobs (or every job, if no department is given),
+            built in one pass over one query.
+
+            Rather than loading Job instances along with their shifts and
+            the attendees who work them, this selects only the columns the
+            schedule needs plus the number of shifts for each job, so its
+            cost doesn't grow with the number of signups.  Jobs are returned
+            as dicts, ordered like Session.jobs(); the shifts themselves can
+            be fetched for a single job with jobs.job_shifts.
+
+            Returns:
+                A dict with these keys:
+                    jobs: Every job.
+                    setup, teardown, normal: The jobs of each type, where
+                        normal is everything which isn't setup or teardown.
+                    times: A list of (start, end, jobs) tuples for each hour
+                        of the event, with the regular jobs starting then.
+                    totals: For "all" jobs and for each of the three types
+                        above, a dict with the number of "jobs", "slots",
+                        "taken" slots, "total_hours" and "signup_hours".
+            """
+            shift_counts = self.query(Shift.job_id, func.count(Shift.id).label('taken')).join(Shift.job)
+            jobs = self.query(
+                Job.id, Job.name, Job.type, Job.start_time, Job.duration, Job.weight,
+                Job.slots, Job.extra15, Job.restricted, Job.department_id,
+                Job.weighted_hours.label('weighted_hours'))
+            if department_id:
+                shift_counts = shift_counts.filter(Job.department_id == department_id)
+                jobs = jobs.filter(Job.department_id == department_id)
+            shift_counts = shift_counts.group_by(Shift.job_id).subquery()
+            jobs = jobs.add_columns(func.coalesce(shift_counts.c.taken, 0).label('taken')) \
+                .outerjoin(shift_counts, shift_counts.c.job_id == Job.id) \
+                .order_by(Job.start_time, Job.name)
+
+            times = [c.EPOCH + timedelta(hours=i) for i in range(c.CON_LENGTH)]
+            by_start = defaultdict(list)
+            grid = {'jobs': [], 'setup': [], 'teardown': [], 'normal': []}
+            totals = {key: defaultdict(int) for key in ['all', 'setup', 'teardown', 'normal']}
+            for row in jobs:
+                job = row._asdict()
+                job['end_time'] = row.start_time + timedelta(hours=row.duration)
+                job['start_time_local'] = row.start_time.astimezone(c.EVENT_TIMEZONE)
+                job['end_time_local'] = job['end_time'].astimezone(c.EVENT_TIMEZONE)
+
+                kind = {c.SETUP: 'setup', c.TEARDOWN: 'teardown'}.get(row.type, 'normal')
+                grid['jobs'].append(job)
+                grid[kind].append(job)
+                if row.type == c.REGULAR:
+                    by_start[job['start_time_local']].append(job)
+
+                for key in ['all', kind]:
+                    totals[key]['jobs'] += 1
+                    totals[key]['slots'] += row.slots
+                    totals[key]['taken'] += row.taken
+                    totals[key]['total_hours'] += row.weighted_hours * row.slots
+                    totals[key]['signup_hours'] += row.weighted_hours * row.taken
+
+            grid['times'] = [(t, t + timedelta(hours=1), by_start[t]) for t in times]
+            grid['totals'] = {key: dict(counts) for key, counts in totals.items()}
+            return grid
+
+        def available_volunteers(self, jobs, staffing_only=False):
+            """
+            Returns a dict mapping the id of each of the given jobs to the
+            same list of attendees as Job.available_volunteers, i.e. the
+            volunteers who may work that job and are free to do so, ordered
+            by Attendee.last_first.
+
+            Checking each job separately runs its own query and then lazy
+            loads the shifts of every candidate, so this instead loads the
+            memberships, roles and shifts of every candidate for all of the
+            jobs at once, in the same handful of queries however many jobs
+            there are.  The overlap checks then only use the hours cached
+            from those preloaded shifts.
+
+            Args:
+                jobs: The Jobs to find volunteers for.
+                staffing_only: Restrict result to attendees where
+                    staffing==True.
+            """
+            jobs = list(jobs)
+            if not jobs:
+                return {}
+
+            dept_ids = {job.department_id for job in jobs}
+            job_ids = {job.id for job in jobs}
+
+            required_roles = defaultdict(set)
+            for job_id, role_id in self.query(job_required_role.c.job_id, job_required_role.c.dept_role_id) \
+                    .join(Job, Job.id == job_required_role.c.job_id) \
+                    .filter(Job.department_id.in_(dept_ids)):
+                if job_id in job_ids:
+                    required_roles[job_id].add(role_id)
+
+            role_ids = set(chain.from_iterable(required_roles.values()))
+            members = defaultdict(set)
+            for attendee_id, department_id in self.query(DeptMembership.attendee_id, DeptMembership.department_id) \
+                    .filter(DeptMembership.department_id.in_(dept_ids)):
+                members[department_id].add(attendee_id)
+
+            held_roles = defaultdict(set)
+            if role_ids:
+                for attendee_id, role_id in self.query(
+                        DeptMembership.attendee_id, dept_membership_dept_role.c.dept_role_id) \
+                        .join(dept_membership_dept_role,
+                              DeptMembership.id == dept_membership_dept_role.c.dept_membership_id) \
+                        .filter(dept_membership_dept_role.c.dept_role_id.in_(role_ids)):
+                    held_roles[attendee_id].add(role_id)
+
+            candidates = [Attendee.dept_memberships.any(DeptMembership.department_id.in_(dept_ids))]
+            if role_ids:
+                candidates.append(Attendee.dept_roles.any(DeptRole.id.in_(role_ids)))
+
+            query = self.query(Attendee).filter(or_(*candidates))
+            if staffing_only:
+                query = query.filter(Attendee.staffing == True)  # noqa: E712
+
+            attendees = query.options(subqueryload(Attendee.shifts).subqueryload(Shift.job)) \
+                .order_by(Attendee.last_first).all()
+
+            volunteers = {}
+            for job in jobs:
+                if required_roles[job.id]:
+                    eligible = [a for a in attendees if required_roles[job.id].issubset(held_roles[a.id])]
+                else:
+                    eligible = [a for a in attendees if a.id in members[job.department_id]]
+                volunteers[job.id] = [a for a in eligible if job.no_overlap(a)]
+            return volunteers
+
+        def staffer_roster(self, prefix='', limit=20):
+            """
+            Returns the volunteers whose first or last name starts with the
+            given prefix, for the typeahead used to pick a volunteer on the
+            shift assignment pages, rather than embedding every volunteer
+            in those pages.  Both prefix matches use the name indexes on
+            the attendee table.
+
+            Results are cached by prefix and by the STAFFER_ROSTER version
+            stamp, so repeated lookups are free until someone's name or
+            staffing status could have changed.
+
+            Returns:
+                A dict with the "version" the result is from, the matching
+                "staffers" as a list of dicts with their "id" and title-cased
+                "full_name", ordered by name and at most limit long, and an
+                "etag" which is a hash of the staffers.
+            """
+            prefix = prefix.strip().lower()
+            version = version_stamps.current([STAFFER_ROSTER])
+            key = ResultCache.make_key('uber.staffer_roster', {'prefix': prefix, 'limit': limit, 'version': version})
+
+            def compute():
+                query = self.query(Attendee.id, Attendee.first_name, Attendee.last_name) \
+                    .filter(Attendee.staffing == True)  # noqa: E712
+                if prefix:
+                    query = query.filter(or_(
+                        func.lower(Attendee.first_name + ' ' + Attendee.last_name).startswith(prefix),
+                        func.lower(Attendee.last_name).startswith(prefix)))
+                staffers = [{
+                    'id': id,
+                    'full_name': '{} {}'.format(first_name, last_name).title()
+                } for id, first_name, last_name in query.order_by(Attendee.full_name, Attendee.id).limit(limit)]
+                etag = sha1(json.dumps(staffers, sort_keys=True).encode('utf-8')).hexdigest()
+                return {'version': version, 'staffers': staffers, 'etag': etag}
+
+            return result_cache.fetch(key, CachePolicy(ttl=5 * 60), compute)
+
         def staffers_for_dropdown(self):
-            query = self.query(Attendee.id, Attendee.full_name)
-            return [{
-                'id': id,
-                'full_name': full_name.title()}
-                for id, full_name in query.filter_by(staffing=True)
-                                          .order_by(Attendee.full_name)]
+            """
+            Returns every volunteer in the same format as staffer_roster().
+            Our own pages use the typeahead instead, but plugins still call
+            this.
+            """
+            return self.staffer_roster(limit=None)['staffers']
 
         @department_id_adapter
         def dept_heads(self, department_id=None):
@@ -1179,7 +1423,10 @@ class Session(SessionManager):
                     'does not have the required roles: ' \
                     '{}'.format(job.required_roles_labels)
 
-            if job.slots <= len(job.shifts):
+            # Many volunteers may try to take the last slot at once, so we
+            # count the shifts only after nobody else can add one.
+            self.lock_job(job.id)
+            if job.slots <= self.query(Shift).filter(Shift.job_id == job.id).count():
                 return 'All slots for this job have already been filled'
 
             if not job.no_overlap(attendee):
@@ -1187,7 +1434,93 @@ class Session(SessionManager):
                     'during that time'
 
             self.add(Shift(attendee=attendee, job=job))
-            self.commit()
+            # Another transaction may have signed this volunteer up for a
+            # different job at the same time since we checked.
+            return self.commit_shifts()
+
+        def commit_shifts(self):
+            """
+            Commits this session, unless the shift_hour table's primary key
+            rejects it because it would give a volunteer two shifts in the
+            same hour, in which case everything is rolled back.  Use this
+            instead of commit() wherever shifts are added or moved.
+            :return: 'None' on success, error message on failure
+            """
+            try:
+                self.commit()
+            except IntegrityError as e:
+                self.rollback()
+                if 'shift_hour' not in str(e):
+                    raise
+                return 'This volunteer is already signed up for a shift ' \
+                    'during that time'
+
+        def double_booked(self, job):
+            """
+            Returns the volunteers signed up for this job who also have
+            another shift during its current start_time and duration, e.g.
+            because the job is being moved.  Saving the job would give them
+            two shifts at once, which the shift_hour table rejects.
+            """
+            if not job.start_time or not job.duration or not job.id:
+                return []
+
+            other_hour = and_(
+                shift_hour.c.attendee_id == Shift.attendee_id,
+                shift_hour.c.shift_id != Shift.id,
+                shift_hour.c.hour > job.start_time - timedelta(hours=1),
+                shift_hour.c.hour < job.start_time + timedelta(hours=job.duration))
+            # The job's unsaved changes would be flushed by the query, and it's
+            # exactly that flush which could fail.
+            with self.no_autoflush:
+                return self.query(Attendee).join(Shift, Shift.attendee_id == Attendee.id) \
+                    .filter(Shift.job_id == job.id, sqlalchemy.exists().where(other_hour)) \
+                    .order_by(Attendee.full_name).all()
+
+        def free_volunteers_at(self, hour, department_id=None):
+            """
+            Returns a query of the staffing volunteers who aren't working any
+            shift at the given time, optionally only those in the given
+            department, e.g. to find someone to cover a shift at the con.
+            Each hour of a shift is a row in the shift_hour table, so this
+            is a lookup on its (attendee_id, hour) primary key for each
+            volunteer.
+            """
+            busy = sqlalchemy.exists().where(and_(
+                shift_hour.c.attendee_id == Attendee.id,
+                shift_hour.c.hour > hour - timedelta(hours=1),
+                shift_hour.c.hour <= hour))
+
+            query = self.query(Attendee).filter(Attendee.staffing == True, not_(busy))  # noqa: E712
+            if department_id:
+                query = query.filter(Attendee.dept_memberships.any(department_id=department_id))
+            return query.order_by(Attendee.full_name)
+
+        def lock_job(self, job_id):
+            """
+            Blocks until no other transaction can add a shift to this job, and
+            holds that lock until this transaction ends.  Postgres locks the
+            job row with SELECT ... FOR UPDATE.  SQLite has no row locks, so
+            we instead take its database-wide write lock with a no-op UPDATE.
+            """
+            self.lock_jobs([job_id])
+
+        def lock_jobs(self, job_ids):
+            """
+            Like lock_job(), for many jobs at once.  Rows are locked in order
+            of id, so that two transactions locking overlapping sets of jobs
+            can't deadlock.
+            """
+            job_ids = sorted(job_ids)
+            for i in range(0, len(job_ids), 500):
+                chunk = job_ids[i:i + 500]
+                if c.SQLALCHEMY_URL.startswith('sqlite'):
+                    self.execute(Job.__table__.update()
+                                              .where(Job.id.in_(chunk))
+                                              .values(slots=Job.slots))
+                else:
+                    self.query(Job.id).filter(Job.id.in_(chunk)) \
+                        .order_by(Job.id).with_for_update().all()
 
         def affiliates(self):
             amounts = defaultdict(
@@ -1419,12 +1752,265 @@ def _track_changes(session, context, instances='deprecated'):
                 Tracking.track(action, instance)
 
 
+def _log_changes(session, context):
+    """
+    Records a change_log row for each instance in this flush, which is
+    written by _write_change_log() once the transaction is committed.
+    """
+    session.info.setdefault('change_log_rows', []).extend({
+        'model': instance.__class__.__name__,
+        'fk_id': instance.id,
+        'action': action
+    } for action, instances in [
+        (c.CREATED, session.new),
+        (c.UPDATED, [i for i in session.dirty if session.is_modified(i)]),
+        (c.DELETED, session.deleted)
+    ] for instance in instances if instance.__class__.__name__ in CHANGE_LOG_MODELS)
+
+
+def _write_change_log(session):
+    """
+    Writes the change_log rows of this transaction just before it commits.
+    The changes.since API method hands out the highest seq it has returned
+    as a cursor, so no transaction may commit a row with a lower seq after
+    that.  On Postgres, each transaction therefore takes an advisory lock
+    before it writes its rows and holds it until it has committed, so that
+    seqs are given out in the order transactions commit.  SQLite only lets
+    one transaction write at a time, so it already works that way.
+    """
+    session.flush()
+    rows = session.info.pop('change_log_rows', None)
+    if rows:
+        if not c.SQLALCHEMY_URL.startswith('sqlite'):
+            session.execute(sqlalchemy.select([func.pg_advisory_xact_lock(CHANGE_LOG_LOCK_ID)]))
+        session.execute(change_log.insert(), rows)
+
+
+def _discard_change_log(session, *args):
+    session.info.pop('change_log_rows', None)
+
+
+def _invalidate_result_cache(session, context, instances='deprecated'):
+    """
+    Discards cached results which depend on the models in this flush, and
+    records those models so that _invalidate_result_cache_on_commit() can
+    discard them again once the transaction commits.  Other requests can
+    still read the old committed data between our flush and our commit,
+    and would otherwise cache it under the generations bumped here.
+    """
+    model_names = {instance.__class__.__name__ for instance in chain(session.new, session.dirty, session.deleted)}
+    session.info.setdefault('result_cache_models', set()).update(model_names)
+    result_cache.invalidate(model_names)
+
+
+def _invalidate_result_cache_on_commit(session):
+    model_names = session.info.pop('result_cache_models', None)
+    if model_names:
+        result_cache.invalidate(model_names)
+
+
+def _discard_result_cache_changes(session, *args):
+    session.info.pop('result_cache_models', None)
+
+
+def _invalidate_auth_cache(session, context):
+    """
+    Discards cached API authentication once an ApiToken or AdminAccount is
+    flushed, and again once that change is committed, so that nothing read
+    in between is cached either.
+    """
+    if any(isinstance(instance, (ApiToken, AdminAccount))
+           for instance in chain(session.new, session.dirty, session.deleted)):
+        session.info['auth_changed'] = True
+        auth_cache.invalidate()
+
+
+def _invalidate_auth_cache_on_commit(session):
+    if session.info.pop('auth_changed', False):
+        auth_cache.invalidate()
+
+
+def _discard_auth_changes(session, *args):
+    session.info.pop('auth_changed', None)
+
+
+def _collect_attendee_hours_changes(session, context, instances='deprecated'):
+    """
+    Records which attendees' rows in the attendee_dept_hours rollup need to be
+    recomputed after this flush.  This runs before the flush so that we can
+    still find the volunteers who are signed up for a job that's being deleted.
+    """
+    attendee_ids = session.info.setdefault('hours_attendee_ids', set())
+    shifts = session.info.setdefault('hours_shifts', [])
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Shift):
+            # Shifts created as Shift(attendee=attendee, job=job) don't have
+            # an attendee_id until they're flushed, so we read it afterwards.
+            shifts.append(instance)
+            attendee_ids.add(instance.attendee_id)
+            attendee_ids.update(get_history(instance, 'attendee_id').deleted or [])
+        elif isinstance(instance, Job) and (instance in session.deleted or any(
+                get_history(instance, attr).has_changes()
+                for attr in ['weight', 'duration', 'extra15', 'department_id'])):
+            attendee_ids.update(attendee_id for attendee_id, in session.execute(
+                sqlalchemy.select([Shift.attendee_id]).where(Shift.job_id == instance.id)))
+
+
+def _refresh_attendee_hours(session, context):
+    shifts = session.info.pop('hours_shifts', [])
+    attendee_ids = session.info.pop('hours_attendee_ids', set()) | {shift.attendee_id for shift in shifts}
+    attendee_ids.discard(None)
+    if attendee_ids:
+        refresh_attendee_hours(session, attendee_ids)
+
+
+def _collect_shift_hour_changes(session, context, instances='deprecated'):
+    """
+    Records which shifts' rows in the shift_hour table need to be recomputed
+    after this flush.  This runs before the flush so that we can still find
+    the shifts of a job that's being deleted.
+    """
+    shifts = session.info.setdefault('hour_shifts', [])
+    shift_ids = session.info.setdefault('hour_shift_ids', set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Shift):
+            if instance in session.new:
+                shifts.append(instance)  # new shifts don't have an id until they're inserted
+            elif instance in session.deleted or any(
+                    get_history(instance, attr).has_changes() for attr in ['attendee_id', 'job_id']):
+                shift_ids.add(instance.id)
+        elif isinstance(instance, Job) and instance not in session.new and (instance in session.deleted or any(
+                get_history(instance, attr).has_changes() for attr in ['start_time', 'duration'])):
+            shift_ids.update(shift_id for shift_id, in session.execute(
+                sqlalchemy.select([Shift.id]).where(Shift.job_id == instance.id)))
+
+
+def _refresh_shift_hours(session, context):
+    shifts = session.info.pop('hour_shifts', [])
+    shift_ids = session.info.pop('hour_shift_ids', set()) | {shift.id for shift in shifts}
+    if shift_ids:
+        refresh_shift_hours(session, shift_ids)
+
+
+def _collect_job_column_changes(session, context, instances='deprecated'):
+    """
+    Records which jobs' denormalized department_name and restricted columns
+    need to be recomputed after this flush.  This runs before the flush so that
+    we can still find the jobs which required a role that's being deleted.
+    """
+    jobs = session.info.setdefault('denormalized_jobs', [])
+    job_ids = session.info.setdefault('denormalized_job_ids', set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Job) and instance not in session.deleted and (instance in session.new or any(
+                get_history(instance, attr).has_changes()
+                for attr in ['department', 'department_id', 'required_roles', 'department_name', 'restricted'])):
+            jobs.append(instance)  # new jobs don't have an id until they're inserted
+        elif isinstance(instance, Department) and instance not in session.new \
+                and get_history(instance, 'name').has_changes():
+            job_ids.update(job_id for job_id, in session.execute(
+                sqlalchemy.select([Job.id]).where(Job.department_id == instance.id)))
+        elif isinstance(instance, DeptRole) and instance in session.deleted:
+            job_ids.update(job_id for job_id, in session.execute(
+                sqlalchemy.select([job_required_role.c.job_id])
+                .where(job_required_role.c.dept_role_id == instance.id)))
+
+
+def _refresh_job_columns(session, context):
+    jobs = session.info.pop('denormalized_jobs', [])
+    other_job_ids = session.info.pop('denormalized_job_ids', set())
+    job_ids = other_job_ids | {job.id for job in jobs}
+    if job_ids:
+        refresh_job_columns(session, job_ids)
+        if other_job_ids:
+            # The jobs themselves weren't flushed, so _log_changes() didn't see them.
+            session.info.setdefault('change_log_rows', []).extend(
+                {'model': 'Job', 'fk_id': job_id, 'action': c.UPDATED} for job_id in other_job_ids)
+        for instance in list(session.identity_map.values()):
+            if isinstance(instance, Job) and instance.id in job_ids:
+                session.expire(instance, ['department_name', 'restricted'])
+
+
+def _collect_version_changes(session, context, instances='deprecated'):
+    """
+    Records which departments and attendees should get new version stamps
+    once this transaction is committed.  Changes to a shift count against both
+    the volunteer and the department of the shift's job, since other volunteers
+    in that department can see whether the job has open slots.  Changes to a
+    volunteer count against the departments of their shifts, since
+    shifts.lookup returns the names and contact info of who's working them.
+    """
+    keys = session.info.setdefault('version_keys', set())
+    job_ids = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Job):
+            keys.update(('department', id) for id in
+                        [instance.department_id] + list(get_history(instance, 'department_id').deleted or []))
+        elif isinstance(instance, Shift):
+            keys.update(('attendee', id) for id in
+                        [instance.attendee_id] + list(get_history(instance, 'attendee_id').deleted or []))
+            job_ids.update([instance.job_id] + list(get_history(instance, 'job_id').deleted or []))
+            if instance.job_id is None and instance.job is not None:
+                keys.add(('department', instance.job.department_id))
+        elif isinstance(instance, Department):
+            keys.add(('department', instance.id))
+        elif isinstance(instance, (Attendee, DeptMembership)):
+            keys.add(('attendee', instance.id if isinstance(instance, Attendee) else instance.attendee_id))
+
+        if isinstance(instance, Attendee) and (instance in session.new or instance in session.deleted or any(
+                get_history(instance, attr).has_changes() for attr in ['first_name', 'last_name', 'staffing'])):
+            keys.add(STAFFER_ROSTER)
+
+    job_ids.discard(None)
+    if job_ids:
+        keys.update(('department', id) for id, in session.execute(
+            sqlalchemy.select([Job.department_id]).where(Job.id.in_(job_ids))))
+
+    volunteer_ids = [instance.id for instance in session.dirty
+                     if isinstance(instance, Attendee) and instance.staffing and session.is_modified(instance)]
+    if volunteer_ids:
+        keys.update(('department', id) for id, in session.execute(
+            sqlalchemy.select([Job.department_id]).distinct()
+            .where(and_(Job.id == Shift.job_id, Shift.attendee_id.in_(volunteer_ids)))))
+    keys.discard(('department', None))
+    keys.discard(('attendee', None))
+    if any(isinstance(instance, Attendee) for instance in session.new):
+        keys.add(ALL_ATTENDEES)  # new attendees don't have an id until they're inserted
+
+
+def _bump_versions(session):
+    keys = session.info.pop('version_keys', None)
+    if keys:
+        version_stamps.bump(keys)
+
+
+def _discard_version_changes(session, *args):
+    session.info.pop('version_keys', None)
+
+
 def register_session_listeners():
     """
     The order in which we register these listeners matters.
     """
     listen(Session.session_factory, 'before_flush', _presave_adjustments)
+    listen(Session.session_factory, 'before_flush', _collect_attendee_hours_changes)
+    listen(Session.session_factory, 'before_flush', _collect_shift_hour_changes)
+    listen(Session.session_factory, 'before_flush', _collect_job_column_changes)
+    listen(Session.session_factory, 'before_flush', _collect_version_changes)
+    listen(Session.session_factory, 'after_flush_postexec', _refresh_attendee_hours)
+    listen(Session.session_factory, 'after_flush_postexec', _refresh_shift_hours)
+    listen(Session.session_factory, 'after_flush_postexec', _refresh_job_columns)
     listen(Session.session_factory, 'after_flush', _track_changes)
+    listen(Session.session_factory, 'after_flush', _log_changes)
+    listen(Session.session_factory, 'after_flush', _invalidate_result_cache)
+    listen(Session.session_factory, 'after_flush', _invalidate_auth_cache)
+    listen(Session.session_factory, 'before_commit', _write_change_log)
+    listen(Session.session_factory, 'after_commit', _bump_versions)
+    listen(Session.session_factory, 'after_commit', _invalidate_result_cache_on_commit)
+    listen(Session.session_factory, 'after_commit', _invalidate_auth_cache_on_commit)
+    listen(Session.session_factory, 'after_rollback', _discard_version_changes)
+    listen(Session.session_factory, 'after_rollback', _discard_auth_changes)
+    listen(Session.session_factory, 'after_rollback', _discard_result_cache_changes)
+    listen(Session.session_factory, 'after_rollback', _discard_change_log)
 
 
 register_session_listeners()
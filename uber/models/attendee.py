@@ -1,12 +1,12 @@
 import json
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from uuid import uuid4
 
 from pytz import UTC
 from sideboard.lib import cached_property, listify, log
 from sideboard.lib.sa import CoerceUTF8 as UnicodeText, \
     UTCDateTime, UUID
-from sqlalchemy import case, func, or_
+from sqlalchemy import and_, case, exists, func, not_, or_, select
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, subqueryload
 from sqlalchemy.schema import ForeignKey, Index, UniqueConstraint
@@ -16,6 +16,7 @@ from uber.config import c
 from uber.custom_tags import safe_string
 from uber.decorators import classproperty, cost_property, \
     department_id_adapter, predelete_adjustment, presave_adjustment, render
+from uber.intervals import HourSlots, IntervalIndex
 from uber.models import MagModel
 from uber.models.group import Group
 from uber.models.types import default_relationship as relationship, utcnow, \
@@ -253,7 +254,20 @@ class Attendee(MagModel, TakesPaymentMixin):
     dept_checklist_items = relationship(
         'DeptChecklistItem', backref=backref('attendee', lazy='subquery'))
 
-    _attendee_table_args = [Index('ix_attendee_paid_group_id', paid, group_id)]
+    _attendee_table_args = [
+        Index('ix_attendee_paid_group_id', paid, group_id),
+
+        # Prefix indexes for the typeahead in Session.staffer_roster().
+        # Postgres only uses an index for LIKE 'prefix%' in a non-C locale
+        # if the index was built with text_pattern_ops.
+        Index(
+            'ix_attendee_full_name_prefix',
+            func.lower(first_name + ' ' + last_name).label('full_name_prefix'),
+            postgresql_ops={'full_name_prefix': 'text_pattern_ops'}),
+        Index(
+            'ix_attendee_last_name_prefix',
+            func.lower(last_name).label('last_name_prefix'),
+            postgresql_ops={'last_name_prefix': 'text_pattern_ops'})]
     if not c.SQLALCHEMY_URL.startswith('sqlite'):
         _attendee_table_args.append(UniqueConstraint(
             'badge_num', deferrable=True, initially='DEFERRED'))
@@ -820,40 +834,141 @@ class Attendee(MagModel, TakesPaymentMixin):
 
     @property
     def hour_map(self):
-        all_hours = {}
-        for shift in self.shifts:
-            for hour in shift.job.hours:
-                all_hours[hour] = shift.job
-        return all_hours
+        def _hour_map():
+            all_hours = {}
+            for shift in self.shifts:
+                for hour in shift.job.hours:
+                    all_hours[hour] = shift.job
+            return all_hours
+        return self._cached_from_shifts('hour_map', _hour_map)
+
+    @property
+    def hour_slots(self):
+        return self._cached_from_shifts('hour_slots', lambda: HourSlots.union(
+            shift.job.hour_slots for shift in self.shifts))
+
+    @property
+    def extra15_slots(self):
+        """
+        The hours of this attendee's shifts which run 15 minutes long.
+        """
+        return self._cached_from_shifts('extra15_slots', lambda: HourSlots.union(
+            shift.job.hour_slots for shift in self.shifts if shift.job.extra15))
+
+    @property
+    def job_intervals(self):
+        return self._cached_from_shifts('job_intervals', lambda: IntervalIndex(
+            [shift.job for shift in self.shifts]))
+
+    def _cached_from_shifts(self, name, compute):
+        """
+        Caches values derived from this attendee's shifts until the shifts
+        change; see the listeners at the bottom of uber/models/department.py.
+        """
+        cache = self.__dict__.setdefault('_shift_cache', {})
+        if name not in cache:
+            cache[name] = compute()
+        return cache[name]
+
+    def _clear_shift_cache(self, *args, **kwargs):
+        self.__dict__.pop('_shift_cache', None)
+
+    def _candidate_jobs(self, session):
+        """
+        Returns a query of the jobs in this attendee's departments (or every
+        job, at the con) which still have open slots and whose required roles
+        this attendee has, without loading any shifts to find out.
+        """
+        from uber.models.department import dept_membership_dept_role, \
+            job_required_role, DeptMembership, Job, Shift
+
+        job_filters = [] if c.AT_THE_CON else [
+            Job.department_id == DeptMembership.department_id,
+            DeptMembership.attendee_id == self.id]
+
+        shift_count = select([func.count(Shift.id)]) \
+            .where(Shift.job_id == Job.id) \
+            .correlate(Job.__table__) \
+            .as_scalar()
+
+        held_roles = select([dept_membership_dept_role.c.dept_role_id]) \
+            .select_from(dept_membership_dept_role.join(
+                DeptMembership,
+                dept_membership_dept_role.c.dept_membership_id == DeptMembership.id)) \
+            .where(DeptMembership.attendee_id == self.id) \
+            .correlate(None)
+
+        missing_role = exists().where(and_(
+            job_required_role.c.job_id == Job.id,
+            job_required_role.c.dept_role_id.notin_(held_roles)))
+
+        return session.query(Job) \
+            .filter(*job_filters) \
+            .filter(Job.slots > shift_count, not_(missing_role)) \
+            .order_by(Job.start_time, Job.department_id)
+
+    def _shift_hours(self, session):
+        """
+        Returns the hours of this attendee's shifts, looked up in the
+        shift_hour table rather than by loading our shifts and their jobs.
+        """
+        from uber.models.department import shift_hour
+        return [hour for hour, in session.query(shift_hour.c.hour).filter(shift_hour.c.attendee_id == self.id)]
+
+    def _overlapping_jobs_filter(self, hours):
+        """
+        Returns a filter which excludes the jobs which start in one of the
+        given hours, since those certainly share that hour.  This takes one
+        bind parameter per hour, however long the jobs are.  Jobs which start
+        earlier and run into one of our hours still have to be checked with
+        job.hour_slots, since finding those in SQL would take date arithmetic
+        on start_time and duration, which our databases don't do alike.
+        """
+        from uber.models.department import Job
+        return [Job.start_time.notin_(hours)] if hours else []
 
     @cached_property
     def available_jobs(self):
         if not self.dept_memberships and not c.AT_THE_CON:
             return []
 
-        def _get_available_jobs(session, attendee_id):
-            from uber.models.department import DeptMembership, Job, Shift
-            job_filters = [] if c.AT_THE_CON else [
-                Job.department_id == DeptMembership.department_id,
-                DeptMembership.attendee_id == self.id]
-            return session.query(Job) \
-                .outerjoin(Job.shifts) \
-                .filter(*job_filters) \
-                .group_by(Job.id) \
-                .having(func.count(Shift.id) < Job.slots) \
+        def _get_available_jobs(session):
+            from uber.models.department import Job
+            return self._candidate_jobs(session) \
                 .options(
                     subqueryload(Job.shifts),
-                    subqueryload(Job.required_roles)) \
-                .order_by(Job.start_time, Job.department_id).all()
+                    subqueryload(Job.required_roles)).all()
 
         if self.session:
-            jobs = _get_available_jobs(self.session, self.id)
+            return _get_available_jobs(self.session)
         else:
             from uber.models import Session
             with Session() as session:
-                jobs = _get_available_jobs(session, self.id)
+                return _get_available_jobs(session)
+
+    @cached_property
+    def assignable_jobs(self):
+        """
+        The available_jobs which don't overlap any of our shifts, i.e. those
+        an admin could actually assign us to, found with the shift_hour table
+        rather than by checking each job against our shifts.
+        """
+        assert self.session, (
+            '{}.assignable_jobs property may only be accessed for '
+            'objects attached to a session'.format(self.__class__.__name__))
+
+        if not self.dept_memberships and not c.AT_THE_CON:
+            return []
 
-        return [job for job in jobs if self.has_required_roles(job)]
+        from uber.models.department import Job
+        hours = self._shift_hours(self.session)
+        busy = HourSlots.union(HourSlots.from_range(hour, 1) for hour in hours)
+        jobs = self._candidate_jobs(self.session) \
+            .filter(*self._overlapping_jobs_filter(hours)) \
+            .options(
+                subqueryload(Job.shifts),
+                subqueryload(Job.required_roles))
+        return [job for job in jobs if not job.hour_slots.intersects(busy)]
 
     @cached_property
     def possible(self):
@@ -864,33 +979,24 @@ class Attendee(MagModel, TakesPaymentMixin):
         if not self.dept_memberships and not c.AT_THE_CON:
             return []
         else:
-            from uber.models.department import DeptMembership, Job
-            job_filters = [] if c.AT_THE_CON else [
-                Job.department_id == DeptMembership.department_id,
-                DeptMembership.attendee_id == self.id]
-
-            job_query = self.session.query(Job) \
+            from uber.models.department import Department, Job
+            job_filters = self._overlapping_jobs_filter(self._shift_hours(self.session))
+            if not self.can_work_setup:
+                job_filters.append(or_(Job.type != c.SETUP, Department.is_setup_approval_exempt == True))  # noqa: E712
+            if not self.can_work_teardown:
+                job_filters.append(or_(Job.type != c.TEARDOWN, Department.is_teardown_approval_exempt == True))  # noqa: E712
+
+            job_query = self._candidate_jobs(self.session) \
+                .join(Department, Job.department_id == Department.id) \
                 .filter(*job_filters) \
                 .options(
                     subqueryload(Job.department),
-                    subqueryload(Job.shifts),
-                    subqueryload(Job.department),
-                    subqueryload(Job.required_roles)) \
-                .order_by(Job.start_time, Job.department_id)
-
-            return [
-                job for job in job_query
-                if job.slots > len(job.shifts)
-                and job.no_overlap(self)
-                and (
-                    job.type != c.SETUP
-                    or self.can_work_setup
-                    or job.department.is_setup_approval_exempt)
-                and (
-                    job.type != c.TEARDOWN
-                    or self.can_work_teardown
-                    or job.department.is_teardown_approval_exempt)
-                and (not job.required_roles or self.has_required_roles(job))]
+                    subqueryload(Job.required_roles))
+
+            # Jobs which start before one of our shifts and run into it, and
+            # the extra15 checks for shifts right before or after one of ours,
+            # are all that's left to check.
+            return [job for job in job_query if job.no_overlap(self)]
 
     @property
     def possible_opts(self):
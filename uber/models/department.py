@@ -6,6 +6,8 @@ from sideboard.lib import cached_property
 from sideboard.lib.sa import CoerceUTF8 as UnicodeText, \
     UTCDateTime, UUID
 from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.event import listen
+from sqlalchemy.sql import case
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, column_property
 from sqlalchemy.schema import ForeignKey, Table, UniqueConstraint
@@ -13,6 +15,7 @@ from sqlalchemy.types import Boolean, Float, Integer
 
 from uber.config import c
 from uber.decorators import classproperty
+from uber.intervals import HourSlots
 from uber.models import MagModel
 from uber.models.attendee import Attendee
 from uber.models.types import default_relationship as relationship, \
@@ -23,7 +26,8 @@ from uber.utils import comma_and
 __all__ = [
     'dept_membership_dept_role', 'job_required_role', 'Department',
     'DeptChecklistItem', 'DeptMembership', 'DeptMembershipRequest',
-    'DeptRole', 'Job', 'Shift']
+    'DeptRole', 'Job', 'Shift', 'attendee_dept_hours', 'refresh_attendee_hours',
+    'refresh_job_columns', 'refresh_shift_hours', 'shift_hour', 'stale_job_columns']
 
 
 # Many to many association table to represent the DeptRoles fulfilled
@@ -305,6 +309,13 @@ class Job(MagModel):
     extra15 = Column(Boolean, default=False)
     department_id = Column(UUID, ForeignKey('department.id'))
 
+    # These duplicate Department.name and whether this job has any required
+    # roles, so that loading jobs doesn't run two correlated subqueries per
+    # row.  They're recomputed by refresh_job_columns() after every flush
+    # which might change them; see uber/models/__init__.py.
+    department_name = Column(UnicodeText)
+    restricted = Column(Boolean, default=False, index=True)
+
     required_roles = relationship(
         'DeptRole',
         backref='jobs',
@@ -314,11 +325,6 @@ class Job(MagModel):
 
     _repr_attr_names = ['name']
 
-    # Using a column_property for department_name *might* be more efficient,
-    # due to our prevelant usage of the department_name property.
-    department_name = column_property(
-        select([Department.name], Department.id == department_id))
-
     @classproperty
     def extra_apply_attrs(cls):
         return set(['required_roles_ids']).union(
@@ -344,22 +350,38 @@ class Job(MagModel):
             hours.add(self.start_time + timedelta(hours=i))
         return hours
 
+    @property
+    def hour_slots(self):
+        """
+        The same hours as Job.hours, cached until start_time or duration change.
+        """
+        key = (self.start_time, self.duration)
+        cached = self.__dict__.get('_hour_slots')
+        if not cached or cached[0] != key:
+            cached = self.__dict__['_hour_slots'] = (key, HourSlots.from_range(*key))
+        return cached[1]
+
     @property
     def end_time(self):
         return self.start_time + timedelta(hours=self.duration)
 
     def no_overlap(self, attendee):
+        if self.hour_slots.intersects(attendee.hour_slots):
+            return False
+
         before = self.start_time - timedelta(hours=1)
+        if before in attendee.extra15_slots:
+            job_before = attendee.job_intervals.at_hour(before)
+            if job_before.extra15 and self.department_id != job_before.department_id:
+                return False
+
         after = self.start_time + timedelta(hours=self.duration)
-        return not self.hours.intersection(attendee.hours) and (
-            before not in attendee.hour_map
-            or not attendee.hour_map[before].extra15
-            or self.department_id == attendee.hour_map[before].department_id
-        ) and (
-            after not in attendee.hour_map
-            or not self.extra15
-            or self.department_id == attendee.hour_map[after].department_id
-        )
+        if self.extra15 and after in attendee.hour_slots:
+            job_after = attendee.job_intervals.at_hour(after)
+            if self.department_id != job_after.department_id:
+                return False
+
+        return True
 
     @property
     def slots_taken(self):
@@ -377,11 +399,15 @@ class Job(MagModel):
     def is_teardown(self):
         return self.start_time >= c.ESCHATON
 
-    @property
+    @hybrid_property
     def real_duration(self):
         return self.duration + (0.25 if self.extra15 else 0)
 
-    @property
+    @real_duration.expression
+    def real_duration(cls):
+        return cls.duration + case([(cls.extra15 == True, 0.25)], else_=0)  # noqa: E712
+
+    @hybrid_property
     def weighted_hours(self):
         return self.weight * self.real_duration
 
@@ -437,17 +463,10 @@ class Job(MagModel):
     def available_volunteers(self):
         """
         Returns a list of volunteers who are allowed to sign up for
-        this Job and have the free time to work it.
+        this Job and have the free time to work it.  Use
+        Session.available_volunteers() when checking many jobs at once.
         """
-        return [
-            s for s in self._potential_volunteers(order_by=Attendee.last_first)
-            if self.no_overlap(s)]
-
-
-# Using a column_property for restricted *might* be more efficient,
-# due to our prevelant usage of the restricted property.
-Job.restricted = column_property(exists().where(
-    Job.id == job_required_role.c.job_id).correlate(Job))
+        return self.session.available_volunteers([self])[self.id]
 
 
 class Shift(MagModel):
@@ -460,3 +479,158 @@ class Shift(MagModel):
     @property
     def name(self):
         return "{}'s {!r} shift".format(self.attendee.full_name, self.job.name)
+
+
+# Attendees cache the hours of their shifts (see Attendee._cached_from_shifts)
+# so these listeners discard that cache whenever those shifts might change.
+def _clear_shift_caches(job, *args):
+    for shift in job.__dict__.get('shifts', []):
+        attendee = shift.__dict__.get('attendee')
+        if attendee is not None:
+            attendee._clear_shift_cache()
+
+
+def _clear_shift_attendee_cache(job, shift, *args):
+    attendee = shift.__dict__.get('attendee')
+    if attendee is not None:
+        attendee._clear_shift_cache()
+
+
+for event in ['append', 'remove']:
+    listen(Attendee.shifts, event, Attendee._clear_shift_cache)
+    listen(Job.shifts, event, _clear_shift_attendee_cache)
+
+for event in ['expire', 'refresh']:
+    listen(Attendee, event, Attendee._clear_shift_cache)
+
+for attr in [Job.start_time, Job.duration, Job.extra15]:
+    listen(attr, 'set', _clear_shift_caches)
+
+
+# Rollup of the weighted hours each attendee has signed up for and worked in
+# each department.  This is maintained by refresh_attendee_hours() whenever
+# shifts or jobs are flushed, so that staffing reports can filter and sort on
+# hours in SQL instead of loading every shift and job for every volunteer.
+attendee_dept_hours = Table(
+    'attendee_dept_hours',
+    MagModel.metadata,
+    Column('attendee_id', UUID, ForeignKey('attendee.id', ondelete='cascade'), primary_key=True),
+    Column('department_id', UUID, ForeignKey('department.id', ondelete='cascade'), primary_key=True),
+    Column('weighted_hours', Float, default=0),
+    Column('worked_hours', Float, default=0))
+
+
+def refresh_attendee_hours(connection, attendee_ids):
+    """
+    Recomputes the attendee_dept_hours rows for the given attendees from their
+    current shifts.  The connection may be either a Session or a Connection.
+    """
+    attendee_ids = sorted({id for id in attendee_ids if id})
+    for i in range(0, len(attendee_ids), 500):
+        chunk = attendee_ids[i:i + 500]
+        rows = connection.execute(
+            select([
+                Shift.attendee_id,
+                Job.department_id,
+                func.sum(Job.weighted_hours),
+                func.sum(case([(Shift.worked == c.SHIFT_WORKED, Job.weighted_hours)], else_=0))])
+            .select_from(Shift.__table__.join(Job.__table__, Shift.job_id == Job.id))
+            .where(Shift.attendee_id.in_(chunk))
+            .group_by(Shift.attendee_id, Job.department_id)).fetchall()
+
+        connection.execute(attendee_dept_hours.delete().where(attendee_dept_hours.c.attendee_id.in_(chunk)))
+        if rows:
+            connection.execute(attendee_dept_hours.insert(), [{
+                'attendee_id': attendee_id,
+                'department_id': department_id,
+                'weighted_hours': weighted_hours or 0,
+                'worked_hours': worked_hours or 0
+            } for attendee_id, department_id, weighted_hours, worked_hours in rows])
+
+
+# One row for each hour of every shift, i.e. each of the shift's job.hours.
+# Since an attendee may only occupy each hour once, the database itself
+# rejects a volunteer being signed up for two shifts at the same time, even
+# when two transactions sign them up for different jobs at once, and finding
+# who is busy at a given hour is an index lookup.  This is maintained by
+# refresh_shift_hours() whenever shifts or their jobs' times are flushed.
+shift_hour = Table(
+    'shift_hour',
+    MagModel.metadata,
+    Column('attendee_id', UUID, ForeignKey('attendee.id', ondelete='cascade'), primary_key=True),
+    Column('hour', UTCDateTime, primary_key=True, index=True),
+    Column('shift_id', UUID, ForeignKey('shift.id', ondelete='cascade'), index=True))
+
+
+def refresh_shift_hours(connection, shift_ids):
+    """
+    Recomputes the shift_hour rows for the given shifts from their current
+    attendee and job; shifts which no longer exist simply lose their rows.
+    The connection may be either a Session or a Connection.  This raises an
+    IntegrityError if any of these shifts overlaps another shift of the same
+    attendee.
+    """
+    shift_ids = sorted({id for id in shift_ids if id})
+    for i in range(0, len(shift_ids), 500):
+        chunk = shift_ids[i:i + 500]
+        rows = connection.execute(
+            select([Shift.id, Shift.attendee_id, Job.start_time, Job.duration])
+            .select_from(Shift.__table__.join(Job.__table__, Shift.job_id == Job.id))
+            .where(Shift.id.in_(chunk))).fetchall()
+
+        connection.execute(shift_hour.delete().where(shift_hour.c.shift_id.in_(chunk)))
+        hours = [{
+            'attendee_id': attendee_id,
+            'hour': start_time + timedelta(hours=k),
+            'shift_id': shift_id
+        } for shift_id, attendee_id, start_time, duration in rows if attendee_id for k in range(duration)]
+        if hours:
+            connection.execute(shift_hour.insert(), hours)
+
+
+def _job_department_name():
+    return select([Department.name]).where(Department.id == Job.department_id).as_scalar()
+
+
+def _job_restricted():
+    return exists().where(job_required_role.c.job_id == Job.id)
+
+
+def refresh_job_columns(connection, job_ids):
+    """
+    Recomputes the denormalized Job.department_name and Job.restricted columns
+    for the given jobs.  The connection may be either a Session or a Connection.
+    """
+    job_ids = sorted({id for id in job_ids if id})
+    for i in range(0, len(job_ids), 500):
+        connection.execute(
+            Job.__table__.update()
+            .where(Job.id.in_(job_ids[i:i + 500]))
+            .values(department_name=_job_department_name(), restricted=_job_restricted()))
+
+
+def stale_job_columns(session):
+    """
+    Returns a query of the ids of the jobs whose denormalized department_name
+    or restricted columns disagree with their department and required roles.
+    These should only exist if the database was modified outside of our ORM.
+    """
+    return session.query(Job.id).filter(or_(
+        Job.department_name != func.coalesce(_job_department_name(), ''),
+        Job.restricted != _job_restricted()))
+
+
+def _attendee_hours_rollup(column):
+    return Attendee.__table__.c.nonshift_hours + select([func.coalesce(func.sum(column), 0)]) \
+        .where(attendee_dept_hours.c.attendee_id == Attendee.__table__.c.id) \
+        .correlate(Attendee.__table__) \
+        .as_scalar()
+
+
+# SQL equivalents of Attendee.weighted_hours and Attendee.worked_hours.  These
+# are deferred, so queries which need them should use undefer().
+Attendee.weighted_hours_rollup = column_property(
+    _attendee_hours_rollup(attendee_dept_hours.c.weighted_hours), deferred=True)
+
+Attendee.worked_hours_rollup = column_property(
+    _attendee_hours_rollup(attendee_dept_hours.c.worked_hours), deferred=True)
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+from pytz import UTC
+from sideboard.lib.sa import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
+from sqlalchemy.schema import ForeignKey
+from sqlalchemy.types import Integer
+
+from uber.config import c
+from uber.models import MagModel
+from uber.models.tracking import Tracking
+from uber.models.types import Choice, DefaultColumn as Column
+
+
+__all__ = ['ReportJob']
+
+
+class ReportJob(MagModel):
+    """
+    A @csv_file, @xlsx_file or @multifile_zipfile page handler which has been
+    submitted to run in the background.  The finished output is written to
+    disk at artifact_path and can be downloaded later by anyone with access to
+    the original page.
+    """
+    admin_account_id = Column(
+        UUID, ForeignKey('admin_account.id', ondelete='SET NULL'),
+        nullable=True)
+    section = Column(UnicodeText)
+    handler = Column(UnicodeText)
+    params = Column(UnicodeText, default='{}')
+    fingerprint = Column(UnicodeText, index=True)
+    status = Column(Choice(c.REPORT_JOB_STATUS_OPTS), default=c.REPORT_QUEUED)
+    progress = Column(Integer, default=0)
+    filename = Column(UnicodeText)
+    content_type = Column(UnicodeText)
+    artifact_path = Column(UnicodeText)
+    error = Column(UnicodeText)
+    submitted_time = Column(UTCDateTime, default=lambda: datetime.now(UTC))
+    started_time = Column(UTCDateTime, nullable=True, default=None)
+    completed_time = Column(UTCDateTime, nullable=True, default=None)
+
+    @property
+    def path(self):
+        return '/{}/{}'.format(self.section, self.handler)
+
+    @property
+    def is_pending(self):
+        return self.status in (c.REPORT_QUEUED, c.REPORT_RUNNING)
+
+    @property
+    def is_downloadable(self):
+        return self.status == c.REPORT_COMPLETE \
+            and bool(self.artifact_path) \
+            and os.path.exists(self.artifact_path)
+
+    def status_dict(self):
+        return {
+            'id': self.id,
+            'path': self.path,
+            'status': self.status,
+            'status_label': self.status_label,
+            'progress': self.progress,
+            'error': self.error,
+            'downloadable': self.is_downloadable
+        }
+
+
+# Progress updates would otherwise flood the tracking table
+Tracking.UNTRACKED.append(ReportJob)
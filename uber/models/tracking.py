@@ -1,6 +1,6 @@
 import json
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from threading import current_thread
 from urllib.parse import parse_qsl
 
@@ -8,15 +8,23 @@ import cherrypy
 from pytz import UTC
 from sideboard.lib import log, serializer
 from sideboard.lib.sa import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
+from sqlalchemy import and_, func
+from sqlalchemy.schema import Table
+from sqlalchemy.types import Integer
 
 from uber.config import c
 from uber.models import MagModel
 from uber.models.admin import AdminAccount
 from uber.models.email import Email
 from uber.models.types import Choice, DefaultColumn as Column, MultiChoice
+from uber.serializers import compile_to_dict
 
 
-__all__ = ['PageViewTracking', 'Tracking']
+__all__ = ['CHANGE_LOG_MODELS', 'PageViewTracking', 'Tracking', 'change_log', 'prune_change_log']
+
+
+# Serializes each tracked instance with its default to_dict() fields.
+_snapshot = compile_to_dict()
 
 
 class PageViewTracking(MagModel):
@@ -179,7 +187,7 @@ class Tracking(MagModel):
                 links=links,
                 action=action,
                 data=data,
-                snapshot=json.dumps(instance.to_dict(), cls=serializer)
+                snapshot=json.dumps(_snapshot(instance), cls=serializer)
             ))
         if instance.session:
             _insert(instance.session)
@@ -190,3 +198,41 @@ class Tracking(MagModel):
 
 
 Tracking.UNTRACKED = [Tracking, Email, PageViewTracking]
+
+
+# A log of every Attendee, Group, Job and Shift which was created, updated or
+# deleted, written by session listeners when each transaction commits; see
+# _log_changes() in uber/models/__init__.py.  Unlike Tracking, rows are
+# numbered in the order their transactions committed, so sync clients can ask
+# for everything which changed since the last row they saw; see the
+# changes.since API method.  Rows older than c.CHANGE_LOG_RETENTION_DAYS are
+# deleted by prune_change_log().
+change_log = Table(
+    'change_log',
+    MagModel.metadata,
+    Column('seq', Integer, primary_key=True),
+    Column('model', UnicodeText),
+    Column('fk_id', UUID),
+    Column('action', Choice(c.TRACKING_OPTS)),
+    Column('when', UTCDateTime, default=lambda: datetime.now(UTC)))
+
+CHANGE_LOG_MODELS = ['Attendee', 'Group', 'Job', 'Shift']
+
+# The Postgres advisory lock which transactions hold while writing to the
+# change_log and committing; the number itself is arbitrary.
+CHANGE_LOG_LOCK_ID = 4409571803
+
+
+def prune_change_log():
+    """
+    Deletes the change_log rows which are older than
+    c.CHANGE_LOG_RETENTION_DAYS.  Sync clients whose cursor is older than
+    that have to start over; see the changes.since API method.  The newest
+    row is always kept, since SQLite would otherwise number the next row 1
+    again and every existing cursor would skip past it.
+    """
+    from uber.models import Session
+    with Session() as session:
+        cutoff = datetime.now(UTC) - timedelta(days=c.CHANGE_LOG_RETENTION_DAYS)
+        newest = session.query(func.max(change_log.c.seq)).scalar()
+        session.execute(change_log.delete().where(and_(change_log.c.when < cutoff, change_log.c.seq < newest)))
@@ -0,0 +1,129 @@
+"""
+SQL-backed money rollups for the budget pages.
+
+The budget pages used to iterate over every Attendee and Sale, and load every
+paid Group along with all of its attendees, just to add up a handful of
+numbers.  The functions in this module compute those same sums with grouped
+queries.  Badge prices which depend on config and promo codes can't be
+expressed in SQL, so only the attendees without a stored price are loaded and
+priced with Attendee.badge_cost.
+
+Results are stored in the result cache and discarded whenever one of the
+models they are derived from is flushed.
+"""
+from collections import defaultdict
+
+from sqlalchemy import and_, func, not_, or_
+from sqlalchemy.orm import subqueryload
+from sqlalchemy.sql import case
+
+from uber.config import c
+from uber.models import Attendee, Group, MPointsForCash, PromoCode, Sale
+from uber.result_cache import CachePolicy, ResultCache, result_cache
+
+
+BUDGET_POLICY = CachePolicy(ttl=15 * 60, depends_on=[Attendee, Group, PromoCode, Sale])
+
+MPOINTS_POLICY = CachePolicy(ttl=15 * 60, depends_on=[Attendee, Group, MPointsForCash])
+
+
+def _cached(name, policy, compute):
+    key = ResultCache.make_key('uber.money.' + name, {})
+    return result_cache.fetch(key, policy, compute)
+
+
+def _has_stored_price():
+    """
+    True for attendees whose Attendee.badge_cost is simply one of the stored
+    price columns.  Everyone else has their price calculated in Python.
+    """
+    has_base_price = Attendee.base_badge_price != 0
+    if c.BADGE_PROMO_CODES_ENABLED:
+        has_base_price = and_(has_base_price, Attendee.promo_code_id == None)  # noqa: E711
+    return or_(Attendee.overridden_price != None, has_base_price)  # noqa: E711
+
+
+def group_badge_cost(session, *group_filters):
+    """
+    Returns the sum of Group.badge_cost for every group matching the filters.
+    """
+    attendees = session.query(Attendee) \
+        .join(Group, Attendee.group_id == Group.id) \
+        .filter(Attendee.paid == c.PAID_BY_GROUP, *group_filters)
+
+    stored_price = case(
+        [(Attendee.overridden_price != None, Attendee.overridden_price)],  # noqa: E711
+        else_=Attendee.base_badge_price)
+
+    total = attendees.filter(_has_stored_price()).with_entities(func.sum(stored_price)).scalar() or 0
+    calculated = attendees.filter(not_(_has_stored_price())) \
+        .options(subqueryload(Attendee.group), subqueryload(Attendee.promo_code))
+
+    return total + sum(attendee.badge_cost for attendee in calculated)
+
+
+def table_cost(session, *group_filters):
+    """
+    Returns the sum of Group.table_cost for every group matching the filters.
+    """
+    query = session.query(Group.tables, func.count(Group.id)).filter(*group_filters).group_by(Group.tables)
+    return sum(Group(tables=tables).table_cost * count for tables, count in query)
+
+
+def prereg_money(session):
+    def compute():
+        preregs = defaultdict(int)
+        attendee_money, extra_money = session.query(
+            func.sum(Attendee.amount_paid - Attendee.amount_extra),
+            func.sum(Attendee.amount_extra)).one()
+
+        preregs['Attendee'] = attendee_money or 0
+        preregs['extra'] = extra_money or 0
+
+        paid_groups = [Group.amount_paid > 0]
+        preregs['group_badges'] = group_badge_cost(session, Group.tables == 0, *paid_groups)
+        preregs['dealer_tables'] = table_cost(session, Group.tables > 0, *paid_groups)
+        preregs['dealer_badges'] = group_badge_cost(session, Group.tables > 0, *paid_groups)
+        return preregs
+
+    return _cached('prereg_money', BUDGET_POLICY, compute)
+
+
+def sale_money(session):
+    def compute():
+        return dict(session.query(Sale.what, func.sum(Sale.cash)).group_by(Sale.what))
+
+    return _cached('sale_money', BUDGET_POLICY, compute)
+
+
+def mpoints_by_group(session):
+    """
+    Returns a list of (total, group, mpoint uses) tuples, sorted by total in
+    descending order.  Groups and uses are returned as plain dicts so that they
+    can be cached; the budget/mpoints.html template doesn't care either way.
+    """
+    def compute():
+        totals = dict(session.query(Attendee.group_id, func.sum(MPointsForCash.amount))
+                             .select_from(MPointsForCash)
+                             .outerjoin(Attendee, MPointsForCash.attendee_id == Attendee.id)
+                             .group_by(Attendee.group_id))
+
+        groups, uses = {}, defaultdict(list)
+        query = session.query(MPointsForCash) \
+            .options(subqueryload(MPointsForCash.attendee).subqueryload(Attendee.group)) \
+            .order_by(MPointsForCash.when)
+
+        for mpu in query:
+            group = mpu.attendee and mpu.attendee.group
+            group_id = group.id if group else None
+            groups[group_id] = {'id': group.id, 'name': group.name} if group else None
+            uses[group_id].append({
+                'amount': mpu.amount,
+                'when': mpu.when,
+                'attendee': mpu.attendee and {'id': mpu.attendee.id, 'full_name': mpu.attendee.full_name}
+            })
+
+        return sorted([(totals.get(group_id) or 0, group, uses[group_id]) for group_id, group in groups.items()],
+                      key=lambda tup: tup[0], reverse=True)
+
+    return _cached('mpoints_by_group', MPOINTS_POLICY, compute)
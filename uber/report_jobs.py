@@ -0,0 +1,183 @@
+import queue
+
+from uber.common import *
+
+
+class ReportJobQueue:
+    """
+    Runs @csv_file, @xlsx_file and @multifile_zipfile page handlers in a
+    bounded pool of background worker threads instead of inside the HTTP
+    request, so that heavy reports don't compete with reg desk traffic.
+
+    Each submitted report is tracked in the report_job table and its output is
+    written to disk, where it can be downloaded later.  Submitting a report
+    which is identical to one that is already waiting, running, or which
+    finished within the last c.REPORT_JOB_FRESH_MINUTES just returns the
+    existing job instead of running the report again.
+    """
+
+    content_types = {
+        'csv': 'application/csv',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'zip': 'application/zip'
+    }
+
+    def __init__(self, workers, queue_size):
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.current = local()
+        DaemonTask(self.work, threads=workers, name='report jobs')
+
+    @property
+    def artifact_dir(self):
+        from sideboard.lib import config as sideboard_config
+        return os.path.join(sideboard_config['root'], 'data', 'reports')
+
+    @staticmethod
+    def get_handler(section, handler):
+        root = getattr(uber.server.Root, section, None)
+        method = getattr(root, handler, None)
+        assert getattr(method, 'report_job_runner', None), \
+            '{}/{} cannot be run as a background report'.format(section, handler)
+        return root, method
+
+    @staticmethod
+    def can_run(method, access_set):
+        return bool(set(getattr(method, 'restricted', None) or []).intersection(access_set))
+
+    @staticmethod
+    def fingerprint(section, handler, params):
+        return sha512(json.dumps([section, handler, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def available_reports(self, access_set):
+        """
+        Returns a list of (section, handler) tuples for every report which the
+        given access levels allow and which can be run without parameters.
+        """
+        reports = []
+        for section in sorted(name for name in dir(uber.server.Root) if not name.startswith('_')):
+            root = getattr(uber.server.Root, section)
+            for name in sorted(dir(root)):
+                method = getattr(root, name, None)
+                if getattr(method, 'report_job_runner', None) \
+                        and getattr(method, 'site_mappable', False) \
+                        and self.can_run(method, access_set):
+                    reports.append((section, name))
+        return reports
+
+    def existing_job(self, session, fingerprint):
+        fresh_since = datetime.now(UTC) - timedelta(minutes=c.REPORT_JOB_FRESH_MINUTES)
+        jobs = session.query(ReportJob).filter(
+            ReportJob.fingerprint == fingerprint,
+            or_(ReportJob.status.in_([c.REPORT_QUEUED, c.REPORT_RUNNING]),
+                and_(ReportJob.status == c.REPORT_COMPLETE, ReportJob.completed_time >= fresh_since))
+        ).order_by(ReportJob.submitted_time.desc())
+
+        for job in jobs:
+            if job.is_pending or job.is_downloadable:
+                return job
+
+    def submit(self, session, section, handler, params=None, admin_account_id=None):
+        """
+        Queue up the given report and return its ReportJob, or return an
+        identical job which is already waiting, running, or freshly finished.
+
+        Raises:
+            queue.Full: If there are already c.REPORT_JOB_QUEUE_SIZE reports
+                waiting to be run.
+        """
+        self.get_handler(section, handler)
+        params = params or {}
+        fingerprint = self.fingerprint(section, handler, params)
+        job = self.existing_job(session, fingerprint)
+        if job:
+            return job
+
+        job = ReportJob(
+            admin_account_id=admin_account_id,
+            section=section,
+            handler=handler,
+            params=json.dumps(params, sort_keys=True),
+            fingerprint=fingerprint)
+        session.add(job)
+        session.commit()
+
+        try:
+            self.pending.put_nowait(job.id)
+        except queue.Full:
+            session.delete(job)
+            session.commit()
+            raise
+        return job
+
+    def set_progress(self, fraction):
+        """
+        Report handlers may call this to update the progress of the report
+        job they're running in; this does nothing inside a regular request.
+        """
+        job_id = getattr(self.current, 'job_id', None)
+        if job_id:
+            with Session() as session:
+                session.report_job(job_id).progress = max(0, min(99, int(100 * fraction)))
+
+    def work(self):
+        try:
+            job_id = self.pending.get(timeout=1)
+        except queue.Empty:
+            return
+
+        try:
+            with metrics.track('task', 'report jobs', 'run'):
+                self.run(job_id)
+        finally:
+            self.pending.task_done()
+
+    def run(self, job_id):
+        with Session() as session:
+            job = session.report_job(job_id)
+            job.status, job.started_time = c.REPORT_RUNNING, datetime.now(UTC)
+            section, handler, params = job.section, job.handler, json.loads(job.params)
+
+        self.current.job_id = job_id
+        try:
+            root, method = self.get_handler(section, handler)
+            runner = method.report_job_runner
+            with request_cached_context(clear_cache_on_start=True):
+                with Session() as session:
+                    output = runner(root, session, set_headers=False, **params)
+
+            extension = getattr(runner, 'output_file_extension', '')
+            artifact_path = os.path.join(self.artifact_dir, '{}.{}'.format(job_id, extension))
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            with open(artifact_path, 'wb') as f:
+                f.write(output if isinstance(output, bytes) else output.encode('utf-8'))
+        except Exception:
+            log.error('report job {} for {}/{} failed', job_id, section, handler, exc_info=True)
+            with Session() as session:
+                job = session.report_job(job_id)
+                job.status, job.error = c.REPORT_FAILED, traceback.format_exc()
+                job.completed_time = datetime.now(UTC)
+        else:
+            with Session() as session:
+                job = session.report_job(job_id)
+                job.status, job.progress = c.REPORT_COMPLETE, 100
+                job.artifact_path = artifact_path
+                job.filename = '{}.{}'.format(handler, extension)
+                job.content_type = self.content_types.get(extension, 'application/octet-stream')
+                job.completed_time = datetime.now(UTC)
+        finally:
+            self.current.job_id = None
+
+
+report_jobs = ReportJobQueue(c.REPORT_JOB_WORKERS, c.REPORT_JOB_QUEUE_SIZE)
+
+
+@on_startup
+def _fail_orphaned_report_jobs():
+    """
+    Jobs which were waiting or running when the server last shut down will
+    never finish, so mark them as failed rather than deduplicating against them.
+    """
+    with Session() as session:
+        for job in session.query(ReportJob).filter(ReportJob.status.in_([c.REPORT_QUEUED, c.REPORT_RUNNING])):
+            job.status, job.error = c.REPORT_FAILED, 'The server was restarted before this report finished.'
+            job.completed_time = datetime.now(UTC)
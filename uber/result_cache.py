@@ -0,0 +1,241 @@
+import os
+import pickle
+import time
+from collections import defaultdict, OrderedDict
+from hashlib import sha512
+from threading import RLock, get_ident
+from uuid import uuid4
+
+from sideboard.lib import log
+
+from uber.config import c
+
+
+__all__ = ['CachePolicy', 'ResultCache', 'result_cache']
+
+
+class CachePolicy:
+    """
+    Describes how the result of a single page handler should be cached.
+
+    Args:
+        ttl: Number of seconds a cached result is considered fresh.
+        stale: Number of additional seconds a result which is older than ttl
+            may still be served while a new copy is generated after the
+            response has been sent.  Zero disables stale-while-revalidate.
+        depends_on: Names of the model classes (e.g. 'Attendee') the result
+            is derived from.  Whenever an instance of any of these is
+            created, updated or deleted, the cached result is discarded.
+        per_account: If True, the current admin account id is included in
+            the cache key.  Defaults to True for rendered pages, since the
+            page header shows the logged-in admin's name and departments, and
+            to False for @csv_file, @xlsx_file and @multifile_zipfile output.
+    """
+    def __init__(self, ttl=15 * 60, stale=0, depends_on=(), per_account=None):
+        self.ttl = ttl
+        self.stale = stale
+        self.depends_on = frozenset(getattr(m, '__name__', m) for m in depends_on)
+        self.per_account = per_account
+
+
+class ResultCache:
+    """
+    Stores rendered page results keyed on the handler, its arguments and the
+    access levels of the current admin.  The most recently used entries are
+    kept in memory and every entry is also written to disk, so results survive
+    restarts and are shared by every thread.
+
+    Flush invalidation is handled with a generation counter per model name;
+    each entry remembers the generations of the models it depends on, and is
+    treated as missing if any of them has since been bumped.  These counters
+    are kept in memory and start over whenever the process does, so entries
+    also record a random epoch which is different for every process, and an
+    entry which depends on any models is only used by the process which
+    wrote it.  Entries which don't depend on any models are shared by every
+    process through the disk; once the copy a process has in memory is no
+    longer fresh, it reads the disk again in case another process has
+    already written a fresher one.
+
+    Files on disk which haven't been written for max_age seconds are deleted,
+    as are the oldest files beyond max_files, at most once a minute.
+    """
+    prune_interval = 60
+
+    def __init__(self, max_entries, max_age=24 * 60 * 60, max_files=10000):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.generations = defaultdict(int)
+        self.epoch = uuid4().hex
+        self.last_pruned = 0
+        self.lock = RLock()
+        self.key_locks = [RLock() for i in range(64)]
+
+    @property
+    def cache_dir(self):
+        from sideboard.lib import config as sideboard_config
+        return os.path.join(sideboard_config['root'], 'data', 'cache')
+
+    @staticmethod
+    def make_key(name, params, access=(), account_id=None):
+        parts = [name, sorted((k, str(v)) for k, v in params.items()), sorted(access), account_id]
+        return sha512(repr(parts).encode('utf-8')).hexdigest()
+
+    def key_lock(self, key):
+        """
+        Returns the lock which should be held while (re)computing the result
+        for the given key, so that concurrent requests don't all do the same
+        expensive work at once.
+        """
+        return self.key_locks[int(key[:8], 16) % len(self.key_locks)]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            log.warning('unable to read result cache entry {}', key, exc_info=True)
+            return None
+
+        if not isinstance(entry, tuple) or len(entry) != 4:
+            return None  # written by an older version of this class
+        return entry
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key, policy):
+        """
+        Returns a tuple of (result, is_fresh), or (None, False) if there's no
+        usable cached result for this key.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None or not self._check(entry, policy)[1]:
+            # Another process sharing our cache directory may have written a
+            # fresher copy since we last read this entry from disk.
+            loaded = self._load(key)
+            if loaded is not None and (entry is None or loaded[0] > entry[0]):
+                entry = loaded
+                self._remember(key, entry)
+
+        return self._check(entry, policy)
+
+    def _check(self, entry, policy):
+        if entry is None:
+            return None, False
+
+        created, epoch, generations, result = entry
+        if generations and epoch != self.epoch:
+            return None, False
+        if any(self.generations[name] != gen for name, gen in generations.items()):
+            return None, False
+
+        age = time.time() - created
+        if age <= policy.ttl:
+            return result, True
+        elif age <= policy.ttl + policy.stale:
+            return result, False
+        else:
+            return None, False
+
+    def snapshot(self, policy):
+        """
+        Call this BEFORE computing a result and pass the return value to set(),
+        so that a flush which happens while the result is being computed still
+        invalidates it.
+        """
+        with self.lock:
+            return {name: self.generations[name] for name in policy.depends_on}
+
+    def set(self, key, result, generations):
+        entry = (time.time(), self.epoch, generations, result)
+        self._remember(key, entry)
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self._path(key), get_ident())
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            log.warning('unable to write result cache entry {}', key, exc_info=True)
+
+        if time.time() - self.last_pruned >= self.prune_interval:
+            self.prune()
+
+    def prune(self):
+        """
+        Deletes the files on disk which are older than max_age seconds, and
+        then the oldest files until there are at most max_files left.
+        """
+        self.last_pruned = time.time()
+        try:
+            paths = [self._path(filename) for filename in os.listdir(self.cache_dir)]
+        except FileNotFoundError:
+            return
+
+        files = []
+        for path in paths:
+            try:
+                files.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass  # another thread or process already deleted it
+        files.sort()
+
+        expired = [path for mtime, path in files if mtime < self.last_pruned - self.max_age]
+        # Recent .tmp files are entries which are still being written.
+        current = [path for mtime, path in files[len(expired):] if not path.endswith('.tmp')]
+        excess = current[:max(0, len(current) - self.max_files)]
+        for path in expired + excess:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, key, policy, compute):
+        """
+        Returns the cached result for this key if it's still fresh, otherwise
+        calls compute() and caches whatever it returns.  This is for caching
+        intermediate data rather than whole pages, so stale results are never
+        returned, since there's no response to revalidate after.
+        """
+        result, is_fresh = self.get(key, policy)
+        if is_fresh:
+            return result
+
+        with self.key_lock(key):
+            result, is_fresh = self.get(key, policy)
+            if not is_fresh:
+                generations = self.snapshot(policy)
+                result = compute()
+                self.set(key, result, generations)
+            return result
+
+    def invalidate(self, model_names):
+        with self.lock:
+            for name in model_names:
+                self.generations[name] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if os.path.isdir(self.cache_dir):
+                for filename in os.listdir(self.cache_dir):
+                    os.remove(self._path(filename))
+
+
+result_cache = ResultCache(c.RESULT_CACHE_SIZE, c.RESULT_CACHE_MAX_HOURS * 60 * 60, c.RESULT_CACHE_MAX_FILES)
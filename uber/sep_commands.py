@@ -151,6 +151,27 @@ def resave_all_staffers():
     print("Done!")
 
 
+@entry_point
+def check_job_columns():
+    """
+    Checks the denormalized department_name and restricted columns of every job
+    against the job's department and required roles, and repairs any which
+    disagree.  These are kept up to date whenever jobs, departments, or roles
+    are saved, so this should only find problems if the database was modified
+    by hand.
+
+    SAFETY: This -should- be safe to run at any time.
+    """
+    Session.initialize_db(modify_tables=False, drop=False)
+    with Session() as session:
+        job_ids = [id for id, in stale_job_columns(session)]
+        print("Found {} job(s) with stale department_name or restricted columns".format(len(job_ids)))
+        if job_ids:
+            refresh_job_columns(session, job_ids)
+            print("Repaired: " + ', '.join(job_ids))
+    print("Done!")
+
+
 @entry_point
 def insert_admin():
     Session.initialize_db(initialize=True)
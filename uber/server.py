@@ -1,3 +1,5 @@
+from hashlib import sha1
+
 from sideboard.jsonrpc import _make_jsonrpc_handler
 from sideboard.server import jsonrpc_reset
 from uber.common import *
@@ -90,23 +92,75 @@ class StaticViews:
         return cherrypy.lib.static.serve_fileobj(content, name=content_filename, content_type=guessed_content_type)
 
 
-class AngularJavascript:
-    @cherrypy.expose
-    def magfest_js(self):
-        """
-        We have several Angular apps which need to be able to access our constants like c.ATTENDEE_BADGE and such.
-        We also need those apps to be able to make HTTP requests with CSRF tokens, so we set that default.
-        """
-        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+class AngularConstants:
+    """
+    Sorts the attributes of c which our Angular apps can use into plain
+    config values, which never change once the server has started, and
+    properties, which are evaluated on every access and some of which (the
+    ones marked @dynamic) run database queries.
+
+    This is done once rather than walking dir(c) on every request, and the
+    plain values are rendered into a javascript bundle whose URL contains a
+    hash of its contents, so browsers can cache it indefinitely.
+    """
+    # Properties of c which describe the current request rather than the event.
+    request_attrs = ['CSRF_TOKEN', 'QUERY_STRING', 'PAGE_PATH', 'PAGE', 'HTTP_METHOD']
+
+    def __init__(self):
+        self.lock = RLock()
+        self.static = None
 
-        consts = {}
+    def _build(self):
+        static, properties, dynamic = {}, [], []
         for attr in dir(c):
+            fget = getattr(getattr(Config, attr, None), 'fget', None)
+            if fget:
+                (dynamic if getattr(fget, '_dynamic', None) else properties).append(attr)
+            else:
+                try:
+                    value = getattr(c, attr, None)
+                except Exception:
+                    continue
+                if isinstance(value, (bool, int, str)):
+                    static[attr] = value
+
+        bundle = '\n'.join([
+            'angular.module("magfest", [])',
+            '.constant("c", {})'.format(json.dumps(static, indent=4, sort_keys=True)),
+            '.constant("magconsts", {})'.format(json.dumps(static, indent=4, sort_keys=True)),
+            '.factory("dynamicConsts", function ($http) {',
+            '   return $http.get("../angular/dynamic_consts").then(function (response) { return response.data; });',
+            '})',
+            '.run(function ($http) {',
+            '   var meta = document.querySelector("meta[name=csrf-token]");',
+            '   if (meta) {',
+            '       $http.defaults.headers.common["CSRF-Token"] = meta.getAttribute("content");',
+            '   }',
+            '});'
+        ])
+        self.properties, self.dynamic = properties, dynamic
+        self.bundle, self.bundle_name = bundle, sha1(bundle.encode('utf-8')).hexdigest()[:16] + '.js'
+        self.static = static
+
+    def ensure_built(self):
+        with self.lock:
+            if self.static is None:
+                self._build()
+        return self
+
+    def evaluate(self, names):
+        values = {}
+        for attr in names:
             try:
-                consts[attr] = getattr(c, attr, None)
-            except:
-                pass
+                value = getattr(c, attr, None)
+            except Exception:
+                continue
+            if isinstance(value, (bool, int, str)):
+                values[attr] = value
+        return values
 
-        js_consts = json.dumps({k: v for k, v in consts.items() if isinstance(v, (bool, int, str))}, indent=4)
+    def legacy_js(self, consts):
+        js_consts = json.dumps(consts, indent=4)
         return '\n'.join([
             'angular.module("magfest", [])',
             '.constant("c", {})'.format(js_consts),
@@ -116,6 +170,34 @@ class AngularJavascript:
             '});'
         ])
 
+
+angular_constants = AngularConstants()
+on_startup(angular_constants.ensure_built)
+
+
+@JinjaEnv.jinja_export
+def angular_constants_url():
+    """
+    Returns the URL of the cacheable bundle of our constants for Angular
+    apps.  Pages which use it should have a csrf-token meta tag, which the
+    bundle reads to set the CSRF-Token header on every request.
+    """
+    return '../angular/constants/' + angular_constants.ensure_built().bundle_name
+
+
+class AngularJavascript:
+    @cherrypy.expose
+    def magfest_js(self):
+        """
+        We have several Angular apps which need to be able to access our constants like c.ATTENDEE_BADGE and such.
+        We also need those apps to be able to make HTTP requests with CSRF tokens, so we set that default.
+
+        Pages should use the cacheable bundle from angular_constants_url() instead where they can.
+        """
+        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        consts = angular_constants.ensure_built()
+        return consts.legacy_js(dict(consts.static, **consts.evaluate(consts.properties + consts.dynamic)))
+
     @cherrypy.expose
     def static_magfest_js(self):
         """
@@ -126,28 +208,37 @@ class AngularJavascript:
         properties that generate database queries.
         """
         cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        consts = angular_constants.ensure_built()
+        return consts.legacy_js(dict(consts.static, **consts.evaluate(consts.properties)))
 
-        consts = {}
-        for attr in dir(c):
-            try:
-                prop = getattr(Config, attr, None)
-                if prop:
-                    fget = getattr(prop, 'fget', None)
-                    if fget and getattr(fget, '_dynamic', None):
-                        continue
-                consts[attr] = getattr(c, attr, None)
-            except Exception:
-                pass
+    @cherrypy.expose
+    def constants(self, name=''):
+        """
+        Serves the bundle of our plain config values for Angular apps, which
+        never changes while the server is running, so it can be cached
+        forever under its content hash.  Old hashes redirect to the current
+        bundle.
+        """
+        consts = angular_constants.ensure_built()
+        if name != consts.bundle_name:
+            raise HTTPRedirect('{}/angular/constants/{}'.format(c.PATH, consts.bundle_name))
 
-        js_consts = json.dumps({k: v for k, v in consts.items() if isinstance(v, (bool, int, str))}, indent=4)
-        return '\n'.join([
-            'angular.module("magfest", [])',
-            '.constant("c", {})'.format(js_consts),
-            '.constant("magconsts", {})'.format(js_consts),
-            '.run(function ($http) {',
-            '   $http.defaults.headers.common["CSRF-Token"] = "{}";'.format(c.CSRF_TOKEN),
-            '});'
-        ])
+        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        cherrypy.response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return consts.bundle
+
+    @cherrypy.expose
+    def dynamic_consts(self):
+        """
+        Returns the properties of c which the constants bundle leaves out,
+        such as the badge counts and current prices, as JSON.  These are only
+        cached by the browser for a short time.
+        """
+        consts = angular_constants.ensure_built()
+        names = [name for name in consts.properties + consts.dynamic if name not in consts.request_attrs]
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        cherrypy.response.headers['Cache-Control'] = 'private, max-age=30'
+        return json.dumps(consts.evaluate(names), cls=serializer).encode('utf-8')
 
 
 @all_renderable()
@@ -170,15 +261,34 @@ cherrypy.tree.mount(Root(), c.PATH, c.APPCONF)
 static_overrides(join(c.MODULE_ROOT, 'static'))
 
 
+class _InstrumentedService:
+    """
+    Stands in for a JSON-RPC service when handling calls, recording each
+    call of each of its methods in our metrics.
+    """
+    def __init__(self, name, service):
+        self._name = name
+        self._service = service
+
+    def __getattr__(self, method_name):
+        method = getattr(self._service, method_name)
+        if callable(method):
+            method = metrics.instrument('jsonrpc', self._name, method_name)(method)
+            setattr(self, method_name, method)
+        return method
+
+
 jsonrpc_services = {}
+_instrumented_services = {}
 
 
 def register_jsonrpc(service, name=None):
     name = name or service.__name__
     assert name not in jsonrpc_services, '{} has already been registered'.format(name)
     jsonrpc_services[name] = service
+    _instrumented_services[name] = _InstrumentedService(name, service)
 
-jsonrpc_handler = _make_jsonrpc_handler(jsonrpc_services, precall=jsonrpc_reset)
+jsonrpc_handler = _make_jsonrpc_handler(_instrumented_services, precall=jsonrpc_reset)
 cherrypy.tree.mount(jsonrpc_handler, join(c.PATH, 'jsonrpc'), c.APPCONF)
 
 
@@ -189,9 +299,11 @@ def reg_checks():
     check_placeholders()
 
 # Registration checks are run every six hours
-DaemonTask(reg_checks, interval=21600, name="mail reg checks")
+DaemonTask(instrumented_task("mail reg checks", reg_checks), interval=21600, name="mail reg checks")
+
+DaemonTask(instrumented_task("send emails", SendAllAutomatedEmailsJob.send_all_emails), interval=300, name="send emails")
 
-DaemonTask(SendAllAutomatedEmailsJob.send_all_emails, interval=300, name="send emails")
+DaemonTask(instrumented_task("prune change log", prune_change_log), interval=86400, name="prune change log")
 
 # TODO: this should be replaced by something a little cleaner, but it can be a useful debugging tool
 # DaemonTask(lambda: log.error(Session.engine.pool.status()), interval=5)
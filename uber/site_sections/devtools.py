@@ -47,6 +47,23 @@ class Root:
             'diagnostics_data': gather_diagnostics_status_information(),
         }
 
+    @unrestricted
+    def metrics(self):
+        """
+        Serves our page, JSON-RPC and daemon task metrics in the Prometheus
+        text format; see uber/metrics.py.  Admins with access to this section
+        can view it in the browser, and Prometheus can scrape it with an API
+        token with read access in the X-Auth-Token header.
+        """
+        from uber.api import auth_by_token
+        if auth_by_token({c.API_READ}):
+            access = AdminAccount.access_set() if cherrypy.session.get('account_id') else set()
+            if c.ACCOUNTS not in access:
+                raise cherrypy.HTTPError(403, 'You need an API token or Account Management access to view metrics')
+
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return metrics.render()
+
     def badge_number_consistency_check(self, session, run_check=None):
         errors = []
 
@@ -36,6 +36,22 @@ def update_counts(job, counts):
         counts['regular_signups'] += job.weighted_hours * len(job.shifts)
 
 
+def _bulk_assign_page(session, department_id, message, max_hours='', selected=(), conflicts=()):
+    jobs = [job for job in session.jobs(department_id).all() if job.slots_untaken] if department_id else []
+    volunteers = session.available_volunteers(jobs, staffing_only=True)
+    names = dict(session.query(Attendee.id, Attendee.full_name)
+                        .filter(Attendee.id.in_({a for a, j, error in conflicts}))) if conflicts else {}
+    return {
+        'message': message,
+        'department_id': department_id,
+        'max_hours': max_hours,
+        'jobs': [(job, volunteers[job.id]) for job in jobs],
+        'selected': selected,
+        'conflicts': [(names.get(a, a), session.query(Job).get(j) if j else None, error)
+                      for a, j, error in conflicts]
+    }
+
+
 @all_renderable(c.PEOPLE)
 class Root:
 
@@ -49,22 +65,35 @@ class Root:
 
         department_id = None if department_id == 'All' else department_id
         department = session.query(Department).get(department_id) if department_id else None
-        jobs = session.jobs(department_id).all()
-        by_start = defaultdict(list)
-        for job in jobs:
-            if job.type == c.REGULAR:
-                by_start[job.start_time_local].append(job)
-        times = [c.EPOCH + timedelta(hours=i) for i in range(c.CON_LENGTH)]
-        return {
+        grid = session.schedule_grid(department_id)
+        return dict(grid, **{
             'department_id': department_id,
             'department': department,
-            'setup': [j for j in jobs if j.type == c.SETUP],
-            'teardown': [j for j in jobs if j.type == c.TEARDOWN],
-            'normal': [j for j in jobs if j.type != c.SETUP and j.type != c.TEARDOWN],
-            'checklist': department_id and session.checklist_status('creating_shifts', department_id),
-            'times': [(t, t + timedelta(hours=1), by_start[t]) for i, t in enumerate(times)],
-            'jobs': jobs
-        }
+            'checklist': department_id and session.checklist_status('creating_shifts', department_id)
+        })
+
+    @ajax_gettable
+    def job_shifts(self, session, id):
+        """
+        The shifts of a single job, which the schedule page loads when they're
+        needed rather than loading every shift of every job up front.
+        """
+        job = session.query(Job).filter_by(id=id).options(
+            subqueryload(Job.shifts).subqueryload(Shift.attendee)).first()
+        return job_dict(job) if job else {'error': 'No such job'}
+
+    @ajax_gettable
+    def staffer_roster(self, session, q=''):
+        """
+        Looked up by the volunteer typeahead on the signups and everywhere
+        pages.  Responses carry an ETag so that repeated lookups of an
+        unchanged roster can be answered with a 304.
+        """
+        result = session.staffer_roster(q)
+        cherrypy.response.headers['ETag'] = '"{}"'.format(result['etag'])
+        cherrypy.response.headers['Cache-Control'] = 'private, no-cache'
+        cherrypy.lib.cptools.validate_etags()
+        return {k: v for k, v in result.items() if k != 'etag'}
 
     @department_id_adapter
     def signups(self, session, department_id=None, message=''):
@@ -76,7 +105,6 @@ class Root:
         return {
             'message': message,
             'department_id': department_id,
-            'attendees': session.staffers_for_dropdown(),
             'jobs': [job_dict(job) for job in session.jobs(department_id)],
             'checklist': department_id and session.checklist_status('postcon_hours', department_id)
         }
@@ -85,7 +113,6 @@ class Root:
         return {
             'message': message,
             'show_restricted': show_restricted,
-            'attendees': session.staffers_for_dropdown(),
             'jobs': [job_dict(job) for job in session.jobs()
                                                      .filter(Job.start_time > localized_now() - timedelta(hours=2))
                                                      .filter_by(**{} if show_restricted else {'restricted': False})]
@@ -132,6 +159,11 @@ class Root:
                                   allowed=['department_id', 'start_time', 'type'] + list(defaults.keys()))
         if cherrypy.request.method == 'POST':
             message = check(job)
+            if not message and not job.is_new:
+                double_booked = session.double_booked(job)
+                if double_booked:
+                    message = 'This would give {} two shifts at the same time; unassign them from this job ' \
+                        'or their other shift first'.format(comma_and([a.full_name for a in double_booked]))
             if not message:
                 session.add(job)
                 if params.get('id') == 'None':
@@ -159,12 +191,60 @@ class Root:
             'defaults': 'defaults' in locals() and defaults
         }
 
-    def staffers_by_job(self, session, id, message=''):
+    @department_id_adapter
+    def bulk_assign(self, session, department_id=None, message=''):
+        """
+        Lets department heads pick volunteers for many of their department's
+        open slots and assign them all at once, or have an auto-fill propose
+        assignments for them to review first.
+        """
+        if not department_id:
+            department_id = cherrypy.session.get('prev_department_id') or c.DEFAULT_DEPARTMENT_ID
+        department_id = None if department_id == 'All' else department_id
+        return _bulk_assign_page(session, department_id, message)
+
+    @csrf_protected
+    @department_id_adapter
+    def bulk_autofill(self, session, department_id, max_hours=''):
+        try:
+            hours_limit = float(max_hours) if max_hours.strip() else None
+        except ValueError:
+            hours_limit = -1
+
+        selected = set()
+        if hours_limit is not None and not 0 <= hours_limit < float('inf'):
+            message = 'Max hours must be a number of hours, or blank for no limit'
+        else:
+            report = uber.assignments.autofill_department(session, department_id, max_hours=hours_limit, dry_run=True)
+            selected = set(report.assigned)
+            message = 'Auto-fill proposed {} shift(s); review them and click "Assign Selected" ' \
+                'to save them'.format(len(selected))
+        return render('jobs/bulk_assign.html', _bulk_assign_page(
+            session, department_id, message, max_hours=max_hours, selected=selected))
+
+    @csrf_protected
+    @department_id_adapter
+    def bulk_assign_selected(self, session, department_id, assignments=()):
+        pairs = [tuple(reversed(assignment.split(':'))) for assignment in listify(assignments)]
+        report = uber.assignments.assign_shifts(session, pairs)
+        conflicts = report.conflicts
+        message = '{} shift(s) assigned, {} could not be'.format(len(report.assigned), len(conflicts))
+        selected = {(attendee_id, job_id) for attendee_id, job_id, error in conflicts}
+        return render('jobs/bulk_assign.html', _bulk_assign_page(
+            session, department_id, message, selected=selected, conflicts=conflicts))
+
+    def staffers_by_job(self, session, id, message='', free_only=''):
         job = session.job(id)
+        if free_only:
+            volunteers = session.available_volunteers([job], staffing_only=True)[job.id]
+            attendees = [(a.id, a.full_name) for a in sorted(volunteers, key=lambda a: a.full_name)]
+        else:
+            attendees = job.capable_volunteers_opts
         return {
             'job':       job,
             'message':   message,
-            'attendees': job.capable_volunteers_opts
+            'free_only': free_only,
+            'attendees': attendees
         }
 
     @csrf_protected
@@ -247,14 +327,14 @@ class Root:
     @department_id_adapter
     def add_volunteers_by_dept(self, session, message='', department_id=None):
         department_id = department_id or c.DEFAULT_DEPARTMENT_ID
+        jobs = [job for job in session.jobs(department_id) if job.slots_untaken]
+        volunteers = session.available_volunteers(jobs, staffing_only=True)
         return {
             'message': message,
             'department_id': department_id,
-            'not_already_here': [
-                (a.id, a.full_name)
-                for a in session.query(Attendee)
-                                .filter(Attendee.email != '',
-                                         ~Attendee.dept_memberships.any(department_id=department_id))
-                                .order_by(Attendee.full_name).all()
-            ]
+            'open_jobs': [(job, volunteers[job.id]) for job in jobs],
+            'not_already_here': session.query(Attendee.id, Attendee.full_name)
+                                       .filter(Attendee.email != '',
+                                               ~Attendee.dept_memberships.any(department_id=department_id))
+                                       .order_by(Attendee.full_name).all()
         }
@@ -57,7 +57,10 @@ class Root:
         raise HTTPRedirect(c.KIOSK_REDIRECT_URL)
 
     def check_prereg(self):
-        return json.dumps({'force_refresh': not c.AT_THE_CON and (c.AFTER_PREREG_TAKEDOWN or c.BADGES_SOLD >= c.MAX_BADGE_SALES)})
+        badges_sold = public_badge_stats()['badges_sold']
+        return public_stats_response({
+            'force_refresh': not c.AT_THE_CON and (c.AFTER_PREREG_TAKEDOWN or badges_sold >= c.MAX_BADGE_SALES)
+        })
 
     def check_if_preregistered(self, session, message='', **params):
         if 'email' in params:
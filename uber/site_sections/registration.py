@@ -809,7 +809,7 @@ class Root:
             'shifts': {s.id: s.to_dict(attrs) for s in attendee.shifts},
             'jobs': [
                 (job.id, '({}) [{}] {}'.format(job.timespan(), job.department_name, job.name))
-                for job in attendee.available_jobs
+                for job in attendee.assignable_jobs
                 if job.start_time + timedelta(hours=job.duration + 2) > localized_now()]
         }
 
@@ -895,13 +895,40 @@ class Root:
         raise HTTPRedirect('feed?page={}&who={}&what={}&action={}&message={}', page, who, what, action, message)
 
     def staffers(self, session, message='', order='first_name'):
-        staffers = session.staffers().all()
+        staffer_filter = [Attendee.staffing == True, Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])]
+        sort_by = {
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'full_name': 'full_name',
+            'last_first': 'last_first',
+            'badge_num': 'badge_num',
+            'badge_type': 'badge_type',
+            'paid': 'paid',
+            'checked_in': 'checked_in',
+            'weighted_hours': 'weighted_hours_rollup',
+            'worked_hours': 'worked_hours_rollup'
+        }
+        if order.lstrip('-') not in sort_by:
+            order = 'first_name'
+        staffers = session.query(Attendee) \
+            .filter(*staffer_filter) \
+            .options(
+                subqueryload(Attendee.assigned_depts),
+                undefer('weighted_hours_rollup'),
+                undefer('worked_hours_rollup')) \
+            .order(('-' if order.startswith('-') else '') + sort_by[order.lstrip('-')]) \
+            .all()
+
+        taken_hours = session.query(func.sum(attendee_dept_hours.c.weighted_hours)) \
+            .join(Attendee, attendee_dept_hours.c.attendee_id == Attendee.id) \
+            .filter(*staffer_filter).scalar()
+
         return {
             'order': Order(order),
             'message': message,
-            'taken_hours': sum([s.weighted_hours - s.nonshift_hours for s in staffers], 0.0),
-            'total_hours': sum([j.weighted_hours * j.slots for j in session.query(Job).all()], 0.0),
-            'staffers': sorted(staffers, reverse=order.startswith('-'), key=lambda s: getattr(s, order.lstrip('-')))
+            'taken_hours': taken_hours or 0.0,
+            'total_hours': session.query(func.sum(Job.weighted_hours * Job.slots)).scalar() or 0.0,
+            'staffers': staffers
         }
 
     def review(self, session):
@@ -961,17 +988,18 @@ class Root:
     @unrestricted
     def stats(self):
         cherrypy.response.headers["Access-Control-Allow-Origin"] = "*"
-        return json.dumps({
-            'badges_sold': c.BADGES_SOLD,
-            'remaining_badges': c.REMAINING_BADGES,
-            'badges_price': c.BADGE_PRICE,
-            'server_current_timestamp': int(datetime.utcnow().timestamp()),
+        stats = public_badge_stats()
+        return public_stats_response({
+            'badges_sold': stats['badges_sold'],
+            'remaining_badges': stats['remaining_badges'],
+            'badges_price': stats['badge_price'],
+            'server_current_timestamp': stats['as_of'],
             'warn_if_server_browser_time_mismatch': c.WARN_IF_SERVER_BROWSER_TIME_MISMATCH
         })
 
     @unrestricted
     def price(self):
         cherrypy.response.headers["Access-Control-Allow-Origin"] = "*"
-        return json.dumps({
-            'badges_price': c.BADGE_PRICE
+        return public_stats_response({
+            'badges_price': public_badge_stats()['badge_price']
         })
@@ -0,0 +1,62 @@
+from uber.common import *
+
+
+@all_renderable(c.STATS, c.MONEY, c.PEOPLE)
+class Root:
+    def index(self, session, message=''):
+        access_set = AdminAccount.access_set()
+        jobs = []
+        for job in session.query(ReportJob).order_by(ReportJob.submitted_time.desc()).limit(100):
+            try:
+                root, method = report_jobs.get_handler(job.section, job.handler)
+            except AssertionError:
+                continue  # the plugin providing this report is no longer installed
+            if report_jobs.can_run(method, access_set):
+                jobs.append(job)
+
+        return {
+            'message': message,
+            'reports': report_jobs.available_reports(access_set),
+            'jobs': jobs
+        }
+
+    @csrf_protected
+    def submit(self, session, section, handler, **params):
+        root, method = report_jobs.get_handler(section, handler)
+        if not report_jobs.can_run(method, AdminAccount.access_set()):
+            raise HTTPRedirect('index?message={}', 'You do not have access to that report')
+
+        try:
+            job = report_jobs.submit(session, section, handler, params, cherrypy.session['account_id'])
+        except queue.Full:
+            raise HTTPRedirect('index?message={}', 'Too many reports are waiting to run; please try again in a few minutes')
+
+        if job.is_downloadable:
+            message = 'An identical report finished recently and is ready to download'
+        else:
+            message = '{} has been queued'.format(job.path)
+
+        raise HTTPRedirect('index?message={}', message)
+
+    @ajax_gettable
+    def status(self, session, id):
+        job = session.report_job(id)
+        root, method = report_jobs.get_handler(job.section, job.handler)
+        if not report_jobs.can_run(method, AdminAccount.access_set()):
+            return {'error': 'You do not have access to this report'}
+        return job.status_dict()
+
+    def download(self, session, id):
+        job = session.report_job(id)
+        root, method = report_jobs.get_handler(job.section, job.handler)
+        if not report_jobs.can_run(method, AdminAccount.access_set()):
+            return 'You do not have access to this report'
+        elif not job.is_downloadable:
+            raise HTTPRedirect('index?message={}', 'That report is not ready to download')
+
+        with open(job.artifact_path, 'rb') as f:
+            output = f.read()
+
+        cherrypy.response.headers['Content-Type'] = job.content_type
+        cherrypy.response.headers['Content-Disposition'] = 'attachment; filename=' + job.filename
+        return output
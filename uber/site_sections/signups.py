@@ -98,15 +98,29 @@ class Root:
 
     @check_shutdown
     @ajax_gettable
-    def jobs(self, session):
-        return {'jobs': session.jobs_for_signups()}
+    def jobs(self, session, since=None):
+        """
+        Polled by the signups page.  Responses carry an ETag so that an
+        unchanged list of jobs can be answered with a 304, and clients which
+        pass the "version" of their last response as "since" get only the jobs
+        which changed; see Session.versioned_jobs_for_signups().
+        """
+        version = session.signups_version(session.logged_in_volunteer())
+        result = session.versioned_jobs_for_signups(version, since)
+        if 'etag' in result:
+            cherrypy.response.headers['ETag'] = '"{}"'.format(result['etag'])
+            cherrypy.response.headers['Cache-Control'] = 'private, no-cache'
+            cherrypy.lib.cptools.validate_etags()
+        return {k: v for k, v in result.items() if k != 'etag'}
 
     @check_shutdown
     @ajax
     def sign_up(self, session, job_id):
+        volunteer = session.logged_in_volunteer()
         return {
-            'error': session.assign(session.logged_in_volunteer().id, job_id),
-            'jobs': session.jobs_for_signups()
+            'error': session.assign(volunteer.id, job_id),
+            'jobs': session.jobs_for_signups(),
+            'version': session.signups_version(volunteer)
         }
 
     @check_shutdown
@@ -119,7 +133,10 @@ class Root:
         except:
             pass
         finally:
-            return {'jobs': session.jobs_for_signups()}
+            return {
+                'jobs': session.jobs_for_signups(),
+                'version': session.signups_version(session.logged_in_volunteer())
+            }
 
     @unrestricted
     def login(self, session, message='',  first_name='', last_name='', email='', zip_code='', original_location=None):
@@ -16,6 +16,7 @@ def generate_staff_badges(start_badge, end_badge, out, session):
 
 @all_renderable(c.STATS)
 class Root:
+    @cached(ttl=5 * 60, stale=15 * 60, depends_on=[Attendee, Group])
     def index(self, session):
         counts = defaultdict(OrderedDict)
         counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
@@ -116,8 +117,11 @@ class Root:
     def food_restrictions(self, session):
         all_fr = session.query(FoodRestrictions).all()
         guests = session.query(Attendee).filter_by(badge_type=c.GUEST_BADGE).count()
-        volunteers = len([a for a in session.query(Attendee).filter_by(staffing=True).all()
-                            if a.badge_type == c.STAFF_BADGE or a.weighted_hours or not a.takes_shifts])
+        has_hours = or_(Attendee.badge_type == c.STAFF_BADGE, Attendee.weighted_hours_rollup != 0)
+        volunteers = session.query(Attendee).filter_by(staffing=True).filter(has_hours).count() + len([
+            a for a in session.query(Attendee).filter_by(staffing=True).filter(not_(has_hours))
+                              .options(subqueryload(Attendee.assigned_depts))
+            if not a.takes_shifts])
         return {
             'guests': guests,
             'volunteers': volunteers,
@@ -138,29 +142,35 @@ class Root:
             'current': [a for a in session.staffers() if any(shift.rating == c.RATED_BAD for shift in a.shifts)]
         }
 
+    @cached(ttl=5 * 60, stale=15 * 60, depends_on=[Attendee, DeptMembership, Department, Job, Shift])
     def staffing_overview(self, session):
-        attendees = session.staffers().options(subqueryload(Attendee.dept_memberships)).all()
-        attendees_by_dept = defaultdict(list)
-        for attendee in attendees:
-            for dept_membership in attendee.dept_memberships:
-                attendees_by_dept[dept_membership.department_id].append(attendee)
+        staffer_filter = [Attendee.staffing == True, Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])]
 
-        jobs = session.jobs().all()
-        jobs_by_dept = defaultdict(list)
-        for job in jobs:
-            jobs_by_dept[job.department_id].append(job)
+        assigned_by_dept = dict(
+            session.query(DeptMembership.department_id, func.count(DeptMembership.attendee_id))
+                   .join(Attendee, DeptMembership.attendee_id == Attendee.id)
+                   .filter(*staffer_filter)
+                   .group_by(DeptMembership.department_id))
+
+        total_hours_by_dept = dict(
+            session.query(Job.department_id, func.sum(Job.weighted_hours * Job.slots))
+                   .group_by(Job.department_id))
+
+        taken_hours_by_dept = dict(
+            session.query(attendee_dept_hours.c.department_id, func.sum(attendee_dept_hours.c.weighted_hours))
+                   .group_by(attendee_dept_hours.c.department_id))
 
         departments = session.query(Department).order_by(Department.name)
 
         return {
-            'hour_total': sum(j.weighted_hours * j.slots for j in jobs),
-            'shift_total': sum(j.weighted_hours * len(j.shifts) for j in jobs),
-            'volunteers': len(attendees),
+            'hour_total': sum(total_hours_by_dept.values()),
+            'shift_total': sum(taken_hours_by_dept.values()),
+            'volunteers': session.query(Attendee).filter(*staffer_filter).count(),
             'departments': [{
                 'department': dept,
-                'assigned': len(attendees_by_dept[dept.id]),
-                'total_hours': sum(j.weighted_hours * j.slots for j in jobs_by_dept[dept.id]),
-                'taken_hours': sum(j.weighted_hours * len(j.shifts) for j in jobs_by_dept[dept.id])
+                'assigned': assigned_by_dept.get(dept.id, 0),
+                'total_hours': total_hours_by_dept.get(dept.id, 0),
+                'taken_hours': taken_hours_by_dept.get(dept.id, 0)
             } for dept in departments]
         }
 
@@ -309,7 +319,8 @@ class Root:
 
         Plugins can override badge_zipfile_contents to do something different/event-specific.
         """
-        for badge_report_fn in self.badge_zipfile_contents:
+        for index, badge_report_fn in enumerate(self.badge_zipfile_contents):
+            report_jobs.set_progress(index / len(self.badge_zipfile_contents))
             # run the report function, but don't output headers because
             # 1) we'll do it with the zipfile
             # 2) we don't set headers until the very end when everything is 100% good
@@ -333,10 +344,14 @@ class Root:
     @csv_file
     def volunteers_with_worked_hours(self, out, session):
         out.writerow(['Badge #', 'Full Name', 'E-mail Address', 'Weighted Hours Scheduled', 'Weighted Hours Worked'])
-        for a in session.query(Attendee).all():
-            if a.worked_hours > 0:
-                out.writerow([a.badge_num, a.full_name, a.email, a.weighted_hours, a.worked_hours])
+        query = session.query(Attendee) \
+            .filter(Attendee.worked_hours_rollup > 0) \
+            .options(undefer('weighted_hours_rollup'), undefer('worked_hours_rollup'))
 
+        for a in query:
+            out.writerow([a.badge_num, a.full_name, a.email, a.weighted_hours_rollup, a.worked_hours_rollup])
+
+    @cached(ttl=15 * 60, stale=60 * 60, depends_on=[Attendee])
     def shirt_manufacturing_counts(self, session):
         """
         This report should be the definitive report about the count and sizes of
@@ -348,55 +363,13 @@ class Root:
             - volunteers (non-staff who get one for free)
             - attendees (who can pre-order them)
         """
-        counts = defaultdict(lambda: defaultdict(int))
-        labels = ['size unknown'] + [label for val, label in c.SHIRT_OPTS][1:]
-        sort = lambda d: sorted(d.items(), key=lambda tup: labels.index(tup[0]))
-        label = lambda s: 'size unknown' if s == c.SHIRTS[c.NO_SHIRT] else s
-
-        for attendee in session.all_attendees():
-            shirt_label = attendee.shirt_label or 'size unknown'
-            counts['staff'][label(shirt_label)] += attendee.num_staff_shirts_owed
-            counts['event'][label(shirt_label)] += attendee.num_event_shirts_owed
-
-        categories = []
-        if c.SHIRTS_PER_STAFFER > 0:
-            categories.append(('Staff Uniform Shirts', sort(counts['staff'])))
-
-        categories.append(('Event Shirts', sort(counts['event'])))
-
         return {
-            'categories': categories,
+            'categories': uber.merch.shirt_manufacturing_counts(session),
         }
 
+    @cached(ttl=15 * 60, stale=60 * 60, depends_on=[Attendee])
     def shirt_counts(self, session):
-        counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        labels = ['size unknown'] + [label for val, label in c.SHIRT_OPTS][1:]
-        sort = lambda d: sorted(d.items(), key=lambda tup: labels.index(tup[0]))
-        label = lambda s: 'size unknown' if s == c.SHIRTS[c.NO_SHIRT] else s
-        status = lambda got_merch: 'picked_up' if got_merch else 'outstanding'
-        sales_by_week = OrderedDict([(i, 0) for i in range(50)])
-
-        for attendee in session.all_attendees():
-            shirt_label = attendee.shirt_label or 'size unknown'
-            counts['all_staff_shirts'][label(shirt_label)][status(attendee.got_merch)] += attendee.num_staff_shirts_owed
-            counts['all_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += attendee.num_event_shirts_owed
-            if attendee.volunteer_event_shirt_eligible or attendee.replacement_staff_shirts:
-                counts['free_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += 1
-            if attendee.paid_for_a_shirt:
-                counts['paid_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += 1
-                sales_by_week[(min(datetime.now(UTC), c.ESCHATON) - attendee.registered).days // 7] += 1
-
-        for week in range(48, -1, -1):
-            sales_by_week[week] += sales_by_week[week + 1]
-
-        categories = [
-            ('Free Event Shirts', sort(counts['free_event_shirts'])),
-            ('Paid Event Shirts', sort(counts['paid_event_shirts'])),
-            ('All Event Shirts', sort(counts['all_event_shirts'])),
-        ]
-        if c.SHIRTS_PER_STAFFER > 0:
-            categories.append(('Staff Shirts', sort(counts['all_staff_shirts'])))
-
+        categories, sales_by_week = uber.merch.shirt_counts(session)
         return {
             'sales_by_week': sales_by_week,
             'categories': categories,
@@ -406,36 +379,34 @@ class Root:
         return {'attendees': session.query(Attendee).filter(Attendee.extra_merch != '').order_by(Attendee.full_name).all()}
 
     def restricted_untaken(self, session):
-        untaken = defaultdict(lambda: defaultdict(list))
+        untaken = defaultdict(list)
         for job in session.jobs():
             if job.restricted and job.slots_taken < job.slots:
-                for hour in job.hours:
-                    untaken[job.department_id][hour].append(job)
+                untaken[job.department_id].append(job)
+        untaken = {department_id: IntervalIndex(jobs) for department_id, jobs in untaken.items()}
+
         flagged = []
         for attendee in session.staffers():
             if not attendee.is_dept_head:
+                trusted = [untaken[dept.id] for dept in attendee.assigned_depts
+                           if dept.id in untaken and attendee.trusted_in(dept)]
                 overlapping = defaultdict(set)
                 for shift in attendee.shifts:
                     if not shift.job.restricted:
-                        for dept in attendee.assigned_depts:
-                            for hour in shift.job.hours:
-                                if attendee.trusted_in(dept) and hour in untaken[dept]:
-                                    overlapping[shift.job].update(untaken[dept][hour])
+                        for jobs in trusted:
+                            overlapping_jobs = jobs.sharing_hours(shift.job)
+                            if overlapping_jobs:
+                                overlapping[shift.job].update(overlapping_jobs)
                 if overlapping:
                     flagged.append([attendee, sorted(overlapping.items(), key=lambda tup: tup[0].start_time)])
         return {'flagged': flagged}
 
     def consecutive_threshold(self, session):
-        def exceeds_threshold(start_time, attendee):
-            time_slice = [start_time + timedelta(hours=i) for i in range(18)]
-            return len([h for h in attendee.hours if h in time_slice]) >= 12
+        window_starts = [start_time for start_time, desc in c.START_TIME_OPTS[::6]]
         flagged = []
-        for attendee in session.staffers():
-            if attendee.staffing and attendee.weighted_hours >= 12:
-                for start_time, desc in c.START_TIME_OPTS[::6]:
-                    if exceeds_threshold(start_time, attendee):
-                        flagged.append(attendee)
-                        break
+        for attendee in session.staffers().filter(Attendee.weighted_hours_rollup >= 12):
+            if attendee.staffing and exceeds_hours_in_window(sorted(attendee.hours), window_starts, 18, 12):
+                flagged.append(attendee)
         return {'flagged': flagged}
 
     def setup_teardown_neglect(self, session):
@@ -448,20 +419,25 @@ class Root:
         }
 
     def volunteers_owed_refunds(self, session):
-        attendees = session.all_attendees().filter(Attendee.paid.in_([c.HAS_PAID, c.PAID_BY_GROUP, c.REFUNDED])).all()
+        attendees = session.query(Attendee) \
+            .filter(Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS])) \
+            .filter(Attendee.paid.in_([c.HAS_PAID, c.PAID_BY_GROUP, c.REFUNDED])) \
+            .filter(or_(Attendee.staffing == True, Attendee.weighted_hours_rollup >= c.HOURS_FOR_REFUND)) \
+            .options(subqueryload(Attendee.group), undefer('weighted_hours_rollup'), undefer('worked_hours_rollup')) \
+            .order_by(Attendee.full_name, Attendee.id).all()
         is_unrefunded = lambda a: a.paid == c.HAS_PAID or a.paid == c.PAID_BY_GROUP and a.group and a.group.amount_paid\
                                                           and not a.group.amount_refunded
         return {
             'attendees': [(
                 'Volunteers Owed Refunds',
-                [a for a in attendees if is_unrefunded(a) and a.worked_hours >= c.HOURS_FOR_REFUND]
+                [a for a in attendees if is_unrefunded(a) and a.worked_hours_rollup >= c.HOURS_FOR_REFUND]
             ), (
                 'Volunteers Already Refunded',
                 [a for a in attendees if not is_unrefunded(a) and a.staffing]
             ), (
                 'Volunteers Who Can Be Refunded Once Their Shifts Are Marked',
-                [a for a in attendees if is_unrefunded(a) and a.worked_hours < c.HOURS_FOR_REFUND
-                                                          and a.weighted_hours >= c.HOURS_FOR_REFUND]
+                [a for a in attendees if is_unrefunded(a) and a.worked_hours_rollup < c.HOURS_FOR_REFUND
+                                                          and a.weighted_hours_rollup >= c.HOURS_FOR_REFUND]
             )]
         }
 
@@ -10,10 +10,31 @@ angular.module('signups', ['ngRoute', 'magfest'])
             nextTimeout: 1000,
             currentTimeout: null,
             jobs: [],
+            version: null,
             set: function (jobs) {
                 self.jobs.splice.apply(self.jobs, [0, self.jobs.length].concat(jobs));
                 self._sumWeightedHours();
             },
+            _merge: function (changed, removed) {
+                var byId = {};
+                angular.forEach(self.jobs, function (job) {
+                    byId[job.id] = job;
+                });
+                angular.forEach(removed, function (id) {
+                    delete byId[id];
+                });
+                angular.forEach(changed, function (job) {
+                    byId[job.id] = job;
+                });
+                var jobs = [];
+                angular.forEach(byId, function (job) {
+                    jobs.push(job);
+                });
+                jobs.sort(function (a, b) {
+                    return a.start_time_local < b.start_time_local ? -1 : a.start_time_local > b.start_time_local ? 1 : 0;
+                });
+                self.set(jobs);
+            },
             _sumWeightedHours: function () {
                 self.jobs.weightedHours = 0;
                 angular.forEach(self.jobs, function (job) {
@@ -24,7 +45,12 @@ angular.module('signups', ['ngRoute', 'magfest'])
             },
             _success: function (response) {
                 self.nextTimeout = 1000;
-                self.set(response.jobs);
+                if (response.since !== undefined) {
+                    self._merge(response.jobs, response.removed);
+                } else {
+                    self.set(response.jobs);
+                }
+                self.version = response.version;
                 if (response.error) {
                     $window.alert(response.error);
                 }
@@ -38,7 +64,8 @@ angular.module('signups', ['ngRoute', 'magfest'])
             refresh: function () {
                 $http({
                     method: 'get',
-                    url: 'jobs'
+                    url: 'jobs',
+                    params: self.version ? {since: self.version} : {}
                 }).success(self._success).error(self._error);
             },
             signUp: function (jobId) {
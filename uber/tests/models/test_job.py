@@ -124,3 +124,333 @@ class TestAvailableStaffers:
     def test_staffers_by_job_restricted(self, session):
         attendees = session.job_six.capable_volunteers
         assert attendees == [session.staff_four]
+
+
+class TestHoursRollup:
+    def assert_rollup_matches(self, session, attendee):
+        session.expire_all()
+        rollup = session.query(Attendee.weighted_hours_rollup, Attendee.worked_hours_rollup) \
+            .filter(Attendee.id == attendee.id).one()
+        assert rollup == (attendee.weighted_hours, attendee.worked_hours)
+
+    def test_assign(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        assert session.query(attendee_dept_hours.c.weighted_hours).filter(
+            attendee_dept_hours.c.attendee_id == session.staff_one.id).scalar() > 0
+        session.commit()
+        assert session.staff_one.weighted_hours > 0
+        self.assert_rollup_matches(session, session.staff_one)
+
+    def test_bulk_assign(self, session):
+        report = uber.assignments.assign_shifts(session, [
+            (session.staff_three.id, session.job_one.id),
+            (session.staff_three.id, session.job_five.id)])
+        assert len(report.assigned) == 2
+        assert session.query(attendee_dept_hours).filter(
+            attendee_dept_hours.c.attendee_id == session.staff_three.id).count() == 2
+        self.assert_rollup_matches(session, session.staff_three)
+
+    def test_mark_worked(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        session.commit()
+        session.staff_one.shifts[0].worked = c.SHIFT_WORKED
+        session.commit()
+        assert session.staff_one.worked_hours > 0
+        self.assert_rollup_matches(session, session.staff_one)
+
+    def test_job_changes(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        session.commit()
+        session.job_one.weight = 2.0
+        session.job_one.extra15 = True
+        session.commit()
+        self.assert_rollup_matches(session, session.staff_one)
+
+    def test_unassign(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        session.commit()
+        session.delete(session.staff_one.shifts[0])
+        session.commit()
+        self.assert_rollup_matches(session, session.staff_one)
+
+    def test_per_department(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        session.commit()
+        hours = session.query(attendee_dept_hours.c.weighted_hours).filter(
+            attendee_dept_hours.c.attendee_id == session.staff_one.id,
+            attendee_dept_hours.c.department_id == session.job_one.department_id).scalar()
+        assert hours == session.staff_one.weighted_hours_in(session.job_one.department_id)
+
+
+class TestShiftCache:
+    def test_cleared_when_shifts_change(self, session):
+        attendee = session.staff_two
+        before = attendee.hour_slots
+
+        shift = Shift(attendee=attendee, job=session.job_one)
+        assert session.job_one.hour_slots.intersects(attendee.hour_slots)
+
+        attendee.shifts.remove(shift)
+        assert set(attendee.hour_slots) == set(before)
+
+    def test_cleared_when_job_moves(self, session):
+        assert not session.assign(session.staff_two.id, session.job_one.id)
+        session.commit()
+        attendee = session.staff_two
+        assert session.job_one.start_time in attendee.hour_slots
+
+        session.job_one.start_time += timedelta(days=1)
+        assert session.job_one.start_time in attendee.hour_slots
+
+
+def python_possible(attendee):
+    jobs = attendee.session.query(Job).all() if c.AT_THE_CON else [
+        job for job in attendee.session.query(Job).all()
+        if job.department_id in [m.department_id for m in attendee.dept_memberships]]
+    return sorted([
+        job for job in jobs
+        if job.slots > len(job.shifts)
+        and not job.hours.intersection(attendee.hours)
+        and job.no_overlap(attendee)
+        and (job.type != c.SETUP or attendee.can_work_setup or job.department.is_setup_approval_exempt)
+        and (job.type != c.TEARDOWN or attendee.can_work_teardown or job.department.is_teardown_approval_exempt)
+        and attendee.has_required_roles(job)], key=lambda job: (job.start_time, job.department_id))
+
+
+class TestPossible:
+    @pytest.fixture(params=[False, True])
+    def at_the_con(self, request, monkeypatch):
+        monkeypatch.setattr(c, 'AT_THE_CON', request.param)
+
+    def test_matches_python(self, session, at_the_con):
+        assert not session.assign(session.staff_four.id, session.job_one.id)
+        session.commit()
+        for attendee in [session.staff_one, session.staff_two, session.staff_three, session.staff_four]:
+            session.expire_all()
+            assert attendee.possible == python_possible(attendee)
+
+    def test_excludes_overlapping_jobs(self, session):
+        assert not session.assign(session.staff_four.id, session.job_four.id)
+        session.commit()
+        session.expire_all()
+        assert session.job_one not in session.staff_four.possible
+        assert session.job_two not in session.staff_four.possible
+
+
+def python_available_volunteers(job, staffing_only=False):
+    attendees = job.session.query(Attendee).order_by(Attendee.last_first).all()
+    return [
+        attendee for attendee in attendees
+        if (attendee.staffing or not staffing_only)
+        and (attendee.has_required_roles(job) if job.required_roles
+             else job.department_id in [m.department_id for m in attendee.dept_memberships])
+        and job.no_overlap(attendee)]
+
+
+class TestBatchAvailableVolunteers:
+    @pytest.fixture(autouse=True)
+    def assignments(self, session):
+        for staffer, job in [('staff_one', 'job_one'), ('staff_four', 'job_four'), ('staff_three', 'job_two')]:
+            assert not session.assign(getattr(session, staffer).id, getattr(session, job).id)
+        session.commit()
+        session.expire_all()
+
+    @pytest.mark.parametrize('staffing_only', [False, True])
+    def test_matches_python(self, session, staffing_only):
+        jobs = session.query(Job).all()
+        volunteers = session.available_volunteers(jobs, staffing_only=staffing_only)
+        assert set(volunteers) == {job.id for job in jobs}
+        for job in jobs:
+            assert volunteers[job.id] == python_available_volunteers(job, staffing_only)
+
+    def test_single_job_property(self, session):
+        assert session.job_six.available_volunteers == python_available_volunteers(session.job_six)
+
+    def test_no_jobs(self, session):
+        assert session.available_volunteers([]) == {}
+
+
+class TestConcurrentAssign:
+    @pytest.fixture
+    def contested_job(self):
+        with Session() as session:
+            job = Job(
+                name='Contested Job',
+                department=session.department(name='Arcade'),
+                start_time=c.EPOCH + timedelta(days=1),
+                duration=1,
+                slots=3)
+            volunteers = [
+                Attendee(placeholder=True, staffing=True, first_name='Eager', last_name=str(i))
+                for i in range(20)]
+            session.add_all([job] + volunteers)
+            session.commit()
+            return job.id, [a.id for a in volunteers]
+
+    def test_slots_are_never_exceeded(self, contested_job):
+        job_id, attendee_ids = contested_job
+        barrier = threading.Barrier(len(attendee_ids))
+        errors = []
+
+        def sign_up(attendee_id):
+            barrier.wait()
+            with Session() as session:
+                errors.append(session.assign(attendee_id, job_id))
+
+        threads = [threading.Thread(target=sign_up, args=(id,)) for id in attendee_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == len(attendee_ids)
+        assert errors.count(None) == 3
+        assert all(error == 'All slots for this job have already been filled' for error in errors if error)
+        with Session() as session:
+            assert session.query(Shift).filter_by(job_id=job_id).count() == 3
+
+
+class TestDenormalizedColumns:
+    def test_initial_values(self, session):
+        assert not stale_job_columns(session).all()
+        assert session.job_six.restricted and not session.job_one.restricted
+        assert session.job_one.department_name == session.job_one.department.name
+
+    def test_new_job(self, session):
+        job = Job(name='New Job', department=session.dept_arcade, start_time=c.EPOCH, duration=1, slots=1,
+                  required_roles=session.job_six.required_roles)
+        session.add(job)
+        session.commit()
+        assert job.restricted and job.department_name == 'Arcade'
+
+    def test_department_renamed(self, session):
+        job_ids = [job.id for job in session.dept_arcade.jobs]
+        session.dept_arcade.name = 'Retro Arcade'
+        session.commit()
+        session.expunge_all()
+        assert job_ids and all(session.job(id).department_name == 'Retro Arcade' for id in job_ids)
+
+    def test_required_roles_removed(self, session):
+        session.job_six.required_roles = []
+        session.commit()
+        assert not session.job_six.restricted
+
+    def test_required_role_deleted(self, session):
+        for role in list(session.job_six.required_roles):
+            session.delete(role)
+        session.commit()
+        assert not session.job_six.restricted
+
+    def test_stale_columns_are_found_and_repaired(self, session):
+        session.execute(Job.__table__.update().where(Job.id == session.job_one.id).values(restricted=True))
+        session.execute(Job.__table__.update().where(Job.id == session.job_two.id).values(department_name='Nowhere'))
+        assert {id for id, in stale_job_columns(session)} == {session.job_one.id, session.job_two.id}
+        refresh_job_columns(session, [session.job_one.id, session.job_two.id])
+        assert not stale_job_columns(session).all()
+
+
+class TestScheduleGrid:
+    def test_matches_jobs(self, session):
+        assert not session.assign(session.staff_three.id, session.job_four.id)
+        assert not session.assign(session.staff_four.id, session.job_six.id)
+        session.job_five.type = c.SETUP
+        session.commit()
+
+        for department_id in [None, session.dept_console.id]:
+            jobs = session.jobs(department_id).all()
+            grid = session.schedule_grid(department_id)
+            assert [job['id'] for job in grid['jobs']] == [job.id for job in jobs]
+            for job, row in zip(jobs, grid['jobs']):
+                assert row['taken'] == len(job.shifts)
+                assert row['weighted_hours'] == job.weighted_hours
+                assert row['start_time_local'] == job.start_time_local
+                assert row['end_time_local'] == job.end_time_local
+
+            assert [j['id'] for j in grid['setup']] == [j.id for j in jobs if j.type == c.SETUP]
+            assert [j['id'] for j in grid['normal']] == [j.id for j in jobs if j.type not in [c.SETUP, c.TEARDOWN]]
+            assert grid['totals']['all']['slots'] == sum(j.slots for j in jobs)
+            assert grid['totals']['all']['taken'] == sum(len(j.shifts) for j in jobs)
+            assert grid['totals']['all']['signup_hours'] == sum(j.weighted_hours * len(j.shifts) for j in jobs)
+
+            by_start = {start: [j['id'] for j in starting] for start, end, starting in grid['times']}
+            for job in jobs:
+                if job.type == c.REGULAR:
+                    assert job.id in by_start[job.start_time_local]
+
+    def test_empty_department(self, session):
+        department = Department(name='Empty', description='Empty')
+        session.add(department)
+        session.commit()
+        grid = session.schedule_grid(department.id)
+        assert grid['jobs'] == [] and grid['totals']['all'] == {}
+        assert len(grid['times']) == c.CON_LENGTH
+
+
+class TestShiftHours:
+    def shift_hours(self, session, attendee):
+        return sorted(hour for hour, in session.query(shift_hour.c.hour).filter_by(attendee_id=attendee.id))
+
+    def test_maintained_with_shifts(self, session):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        assert not session.assign(session.staff_three.id, session.job_three.id)
+        session.expire_all()
+        assert self.shift_hours(session, session.staff_three) == sorted(session.staff_three.hours)
+
+        session.job_three.start_time += timedelta(hours=1)
+        session.commit()
+        assert self.shift_hours(session, session.staff_three) == sorted(session.staff_three.hours)
+
+        session.delete(session.query(Shift).filter_by(job_id=session.job_one.id).one())
+        session.commit()
+        assert self.shift_hours(session, session.staff_three) == sorted(session.job_three.hours)
+
+    def test_database_rejects_overlap(self, session):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        session.add(Shift(attendee_id=session.staff_three.id, job_id=session.job_two.id))
+        pytest.raises(IntegrityError, session.commit)
+        session.rollback()
+        assert session.query(Shift).filter_by(attendee_id=session.staff_three.id).count() == 1
+
+    def test_assign_reports_overlap_found_by_database(self, session, monkeypatch):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        monkeypatch.setattr(Job, 'no_overlap', lambda job, attendee: True)
+        assert 'already signed up' in session.assign(session.staff_three.id, session.job_two.id)
+        assert session.query(Shift).filter_by(attendee_id=session.staff_three.id).count() == 1
+
+    def test_bulk_assign_reports_overlap_found_by_database(self, session, monkeypatch):
+        monkeypatch.setattr(Job, 'no_overlap', lambda job, attendee: True)
+        report = uber.assignments.assign_shifts(session, [
+            (session.staff_three.id, session.job_one.id),
+            (session.staff_three.id, session.job_two.id)])
+        assert not report.assigned and len(report.conflicts) == 2
+        assert 'already signed up' in report.conflicts[0][2]
+        assert not session.query(Shift).filter_by(attendee_id=session.staff_three.id).count()
+
+    def test_double_booked(self, session):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        assert not session.assign(session.staff_three.id, session.job_three.id)
+        session.job_three.start_time -= timedelta(hours=1)
+        assert session.double_booked(session.job_three) == [session.staff_three]
+        session.job_three.start_time += timedelta(hours=2)
+        assert session.double_booked(session.job_three) == []
+
+    def test_free_volunteers_at(self, session):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        assert session.staff_three not in session.free_volunteers_at(c.EPOCH + timedelta(hours=1)).all()
+        assert session.staff_three in session.free_volunteers_at(c.EPOCH + timedelta(hours=2)).all()
+        in_arcade = session.free_volunteers_at(c.EPOCH, session.dept_arcade.id).all()
+        assert session.staff_four in in_arcade and session.staff_two not in in_arcade
+
+    def test_assignable_jobs(self, session):
+        assert not session.assign(session.staff_three.id, session.job_one.id)
+        session.expire_all()
+        jobs = session.staff_three.assignable_jobs
+        assert session.job_three in jobs
+        assert session.job_two not in jobs and session.job_four not in jobs
+
+    def test_assignable_jobs_excludes_jobs_running_into_shifts(self, session):
+        assert not session.assign(session.staff_three.id, session.job_five.id)
+        session.expire_all()
+        jobs = session.staff_three.assignable_jobs
+        assert session.job_two not in jobs and session.job_three not in jobs
+        assert session.job_one in jobs
@@ -144,3 +144,44 @@ class TestRegisterGroupMember(object):
             # doesn't actually have a unique constraint on the badge_num
             # column. So we have to manually check for duplicate badge numbers.
             assert_unique(badge_nums)
+
+
+class TestPublicStats(object):
+    @pytest.fixture(autouse=True)
+    def cache_dir(self, monkeypatch, tmpdir, GET):
+        monkeypatch.setattr(ResultCache, 'cache_dir', str(tmpdir))
+        monkeypatch.setattr(cherrypy, 'response', cherrypy._cprequest.Response())
+
+    def test_counts_at_most_once_per_ttl(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(Config, 'BADGES_SOLD', property(lambda self: calls.append(1) or 123))
+        first = json.loads(registration.Root().stats())
+        computed = len(calls)
+        second = json.loads(registration.Root().stats())
+        assert first == second and first['badges_sold'] == 123
+        assert computed and len(calls) == computed
+
+    def test_shared_between_processes(self, monkeypatch):
+        monkeypatch.setattr(uber.badge_funcs, 'result_cache', ResultCache(c.RESULT_CACHE_SIZE))
+        first = uber.badge_funcs.public_badge_stats()
+        monkeypatch.setattr(uber.badge_funcs, 'result_cache', ResultCache(c.RESULT_CACHE_SIZE))
+        monkeypatch.setattr(Config, 'BADGES_SOLD', property(lambda self: pytest.fail('recomputed')))
+        assert uber.badge_funcs.public_badge_stats() == first
+
+    def test_cache_headers(self, monkeypatch):
+        body = registration.Root().price()
+        assert json.loads(body)['badges_price'] == c.BADGE_PRICE
+        assert cherrypy.response.headers['Cache-Control'] == 'public, max-age={}'.format(c.PUBLIC_STATS_CACHE_SECONDS)
+
+        monkeypatch.setitem(cherrypy.request.headers, 'If-None-Match', cherrypy.response.headers['ETag'])
+        with pytest.raises(cherrypy.HTTPRedirect) as redirect:
+            registration.Root().price()
+        assert redirect.value.status == 304
+
+
+@pytest.mark.parametrize('order', ['badge', '-is_dept_head', 'weighted_hours_in', ''])
+def test_staffers_unknown_order(order):
+    with Session() as session:
+        result = get_innermost(registration.Root.staffers)(registration.Root(), session, order=order)
+        names = [a.first_name for a in result['staffers']]
+        assert names == sorted(names)
@@ -0,0 +1,38 @@
+import pytest
+
+from uber.common import *
+from uber.server import AngularConstants, AngularJavascript, angular_constants
+
+
+@pytest.fixture
+def consts():
+    return AngularConstants().ensure_built()
+
+
+def test_sorts_config(consts):
+    assert consts.static['EVENT_NAME'] == c.EVENT_NAME
+    assert 'BADGES_SOLD' in consts.dynamic and 'BADGES_SOLD' not in consts.static
+    assert 'PAGE_PATH' in consts.properties and 'PAGE_PATH' not in consts.static
+    assert 'CSRF_TOKEN' not in consts.bundle
+
+
+def test_bundle_name_is_content_hash(monkeypatch, consts):
+    assert consts.bundle_name == AngularConstants().ensure_built().bundle_name
+    monkeypatch.setattr(c, 'EVENT_NAME', c.EVENT_NAME + ' Renamed')
+    assert AngularConstants().ensure_built().bundle_name != consts.bundle_name
+
+
+def test_serves_bundle(monkeypatch):
+    monkeypatch.setattr(cherrypy, 'response', cherrypy._cprequest.Response())
+    name = angular_constants.ensure_built().bundle_name
+    assert AngularJavascript().constants(name) == angular_constants.bundle
+    assert 'max-age=31536000' in cherrypy.response.headers['Cache-Control']
+    with pytest.raises(HTTPRedirect):
+        AngularJavascript().constants('0123456789abcdef.js')
+
+
+def test_dynamic_consts(monkeypatch):
+    monkeypatch.setattr(cherrypy, 'response', cherrypy._cprequest.Response())
+    values = json.loads(AngularJavascript().dynamic_consts().decode('utf-8'))
+    assert values['BADGES_SOLD'] == c.BADGES_SOLD
+    assert 'CSRF_TOKEN' not in values and 'EVENT_NAME' not in values
@@ -1,15 +1,23 @@
+import time
+
 import pytest
 
 from cherrypy import HTTPError
 
 from uber.common import *
 from uber.tests.conftest import csrf_token, cp_session
-from uber.api import auth_by_token, auth_by_session, api_auth, all_api_auth
+import uber.api
+from uber.api import auth_by_token, auth_by_session, api_auth, all_api_auth, AttendeeLookup, ChangeFeed, JobLookup
 
 
 VALID_API_TOKEN = '39074db3-9295-447a-b831-8cbaa93a0522'
 
 
+@pytest.fixture(autouse=True)
+def clear_auth_cache():
+    auth_cache.invalidate()
+
+
 @pytest.fixture()
 def session():
     with Session() as session:
@@ -207,6 +215,41 @@ class TestAuthByToken(object):
         assert auth_by_token(set(required_access)) == expected
 
 
+class TestAuthCache(object):
+    def test_token_cached(self, monkeypatch, api_token):
+        monkeypatch.setitem(cherrypy.request.headers, 'X-Auth-Token', api_token.token)
+        assert auth_by_token(set()) is None
+        monkeypatch.setattr(uber.api, 'Session', None)  # any query would now fail
+        assert auth_by_token(set()) is None
+
+    def test_revocation_takes_effect_immediately(self, monkeypatch, session, api_token):
+        monkeypatch.setitem(cherrypy.request.headers, 'X-Auth-Token', api_token.token)
+        assert auth_by_token(set()) is None
+        api_token.revoked_time = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        session.commit()
+        assert auth_by_token(set()) == (403, 'Revoked auth token: {}'.format(api_token.token))
+
+    def test_expires(self, monkeypatch):
+        cache, loads = AuthCache(ttl=60), []
+        monkeypatch.setattr(time, 'time', lambda: 1000)
+        assert cache.get('key', lambda: loads.append(1) or 'value') == 'value'
+        assert cache.get('key', lambda: loads.append(1) or 'value') == 'value'
+        assert len(loads) == 1
+        monkeypatch.setattr(time, 'time', lambda: 1061)
+        cache.get('key', lambda: loads.append(1) or 'value')
+        assert len(loads) == 2
+
+    def test_not_kept_if_invalidated_while_loading(self):
+        cache = AuthCache(ttl=60)
+
+        def load():
+            cache.invalidate()
+            return 'old value'
+
+        assert cache.get('key', load) == 'old value'
+        assert cache.get('key', lambda: 'new value') == 'new value'
+
+
 class TestAuthBySession(object):
     ACCESS_ERR = 'Insufficient access for admin account'
 
@@ -400,3 +443,203 @@ class TestAllApiAuth(object):
             assert error.value._message.startswith(self.AUTH_BY_TOKEN_ERR)
         else:
             assert 'SUCCESS2' == service.func_2()
+
+
+class TestBatchedAttendeeLookups(object):
+    lookup_many = staticmethod(get_innermost(AttendeeLookup.lookup_many))
+    by_ids = staticmethod(get_innermost(AttendeeLookup.by_ids))
+
+    @pytest.fixture()
+    def attendees(self, session):
+        return session.query(Attendee).filter(Attendee.badge_num != None).order_by(Attendee.badge_num).limit(3).all()  # noqa: E711
+
+    def test_lookup_many(self, attendees):
+        badge_nums = [attendees[0].badge_num, str(attendees[1].badge_num), 'abc', 999999]
+        results = self.lookup_many(AttendeeLookup(), badge_nums)
+        assert set(results) == {str(num) for num in badge_nums}
+        assert results[str(attendees[0].badge_num)]['full_name'] == attendees[0].full_name
+        assert results[str(attendees[1].badge_num)]['badge_num'] == attendees[1].badge_num
+        assert 'error' in results['abc'] and 'error' in results['999999']
+        assert 'shifts' not in results[str(attendees[0].badge_num)]
+
+    def test_lookup_many_full(self, attendees):
+        results = self.lookup_many(AttendeeLookup(), [attendees[0].badge_num], True)
+        assert 'shifts' in results[str(attendees[0].badge_num)]
+
+    def test_by_ids(self, attendees):
+        missing = str(uuid4())
+        results = self.by_ids(AttendeeLookup(), [a.id for a in attendees] + [missing, 'not an id'])
+        for attendee in attendees:
+            assert results[attendee.id] == get_innermost(AttendeeLookup.lookup)(AttendeeLookup(), attendee.badge_num)
+        assert 'error' in results[missing] and 'error' in results['not an id']
+
+
+class TestShiftsLookupVersions(object):
+    lookup = staticmethod(get_innermost(JobLookup.lookup))
+
+    @pytest.fixture(autouse=True)
+    def cache_dir(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(ResultCache, 'cache_dir', str(tmpdir))
+
+    @pytest.fixture()
+    def job(self, session):
+        return session.query(Job).filter(Job.slots > 0).first()
+
+    def test_plain_lookup_unchanged(self, job):
+        jobs = self.lookup(JobLookup(), job.department_id)
+        assert isinstance(jobs, list) and job.id in [j['id'] for j in jobs]
+
+    def test_since_version(self, session, job):
+        result = self.lookup(JobLookup(), job.department_id, since_version='')
+        assert job.id in [j['id'] for j in result['jobs']]
+        assert cherrypy.response.headers['ETag'] == '"{}"'.format(result['version'])
+        assert self.lookup(JobLookup(), job.department_id, since_version=result['version']) == {
+            'version': result['version'], 'not_modified': True}
+
+        job.name = 'Renamed'
+        session.commit()
+        changed = self.lookup(JobLookup(), job.department_id, since_version=result['version'])
+        assert changed['version'] != result['version']
+        assert 'Renamed' in [j['name'] for j in changed['jobs']]
+
+    def test_if_none_match(self, monkeypatch, job):
+        version = self.lookup(JobLookup(), job.department_id, since_version='')['version']
+        monkeypatch.setitem(cherrypy.request.headers, 'If-None-Match', '"{}"'.format(version))
+        assert self.lookup(JobLookup(), job.department_id)['not_modified']
+
+    def test_volunteer_changes_bump_department(self, session, job):
+        volunteer = session.query(Attendee).filter_by(staffing=True).first()
+        assert not session.assign(volunteer.id, job.id)
+        version = self.lookup(JobLookup(), job.department_id, since_version='')['version']
+
+        volunteer.cellphone = '5555555555'
+        session.commit()
+        assert 'jobs' in self.lookup(JobLookup(), job.department_id, since_version=version)
+
+
+class TestJobAutofill(object):
+    autofill = staticmethod(get_innermost(JobLookup.autofill))
+
+    @pytest.mark.parametrize('max_hours', ['lots', '-1', 'nan', 'inf', []])
+    def test_invalid_max_hours(self, session, max_hours):
+        department_id = session.query(Department).first().id
+        assert 'error' in self.autofill(JobLookup(), department_id, max_hours, dry_run=True)
+
+    def test_blank_max_hours(self, session):
+        department_id = session.query(Department).first().id
+        assert 'error' not in self.autofill(JobLookup(), department_id, '', dry_run=True)
+
+class TestChangeFeed(object):
+    since = staticmethod(get_innermost(ChangeFeed.since))
+
+    def test_created_updated_deleted(self, session):
+        cursor = self.since(ChangeFeed())['cursor']
+        job = Job(name='Sync Me', start_time=c.EPOCH, duration=1, slots=1,
+                  department_id=session.query(Department).first().id)
+        session.add(job)
+        session.commit()
+
+        result = self.since(ChangeFeed(), cursor, ['Job'])
+        assert [j['id'] for j in result['changes']['Job']['created']] == [job.id]
+        assert result['changes']['Job']['created'][0]['name'] == 'Sync Me'
+        assert not result['more'] and int(result['cursor']) > int(cursor)
+        assert self.since(ChangeFeed(), result['cursor'], ['Job'])['changes']['Job'] == {
+            'created': [], 'updated': [], 'deleted': []}
+
+        cursor = result['cursor']
+        job.name = 'Synced'
+        session.commit()
+        result = self.since(ChangeFeed(), cursor, ['Job'])
+        assert [j['name'] for j in result['changes']['Job']['updated']] == ['Synced']
+
+        cursor = result['cursor']
+        session.delete(job)
+        session.commit()
+        assert self.since(ChangeFeed(), cursor, ['Job'])['changes']['Job']['deleted'] == [job.id]
+
+    def test_limit(self, session):
+        cursor = self.since(ChangeFeed())['cursor']
+        department_id = session.query(Department).first().id
+        for i in range(3):
+            session.add(Job(name='Job {}'.format(i), start_time=c.EPOCH, duration=1, slots=1,
+                            department_id=department_id))
+            session.commit()
+
+        first = self.since(ChangeFeed(), cursor, ['Job'], 2)
+        assert first['more']
+        rest = self.since(ChangeFeed(), first['cursor'], ['Job'], 2)
+        assert not rest['more']
+        created = first['changes']['Job']['created'] + rest['changes']['Job']['created']
+        assert sorted(j['name'] for j in created) == ['Job 0', 'Job 1', 'Job 2']
+
+    def test_written_on_commit(self, session):
+        cursor = self.since(ChangeFeed())['cursor']
+        job = Job(name='Not Yet', start_time=c.EPOCH, duration=1, slots=1,
+                  department_id=session.query(Department).first().id)
+        session.add(job)
+        session.flush()
+        assert session.query(change_log).filter(change_log.c.fk_id == job.id).count() == 0
+        session.rollback()
+        assert self.since(ChangeFeed(), cursor, ['Job'])['cursor'] == cursor
+
+    def test_pruned_cursor(self, session, monkeypatch):
+        cursor = self.since(ChangeFeed())['cursor']
+        department_id = session.query(Department).first().id
+        for i in range(2):
+            session.add(Job(name='Job {}'.format(i), start_time=c.EPOCH, duration=1, slots=1,
+                            department_id=department_id))
+            session.commit()
+
+        monkeypatch.setattr(c, 'CHANGE_LOG_RETENTION_DAYS', -1)
+        prune_change_log()
+        assert session.query(change_log).count() == 1
+        assert 'error' in self.since(ChangeFeed(), cursor)
+
+    def test_invalid(self):
+        assert 'error' in self.since(ChangeFeed(), '1', ['Badge'])
+        assert 'error' in self.since(ChangeFeed(), 'abc')
+
+
+class TestExport(object):
+    export_attendees = staticmethod(get_innermost(AttendeeLookup.export))
+    export_shifts = staticmethod(get_innermost(JobLookup.export))
+
+    def test_pages_through_every_attendee(self, session, monkeypatch):
+        monkeypatch.setattr(c, 'API_EXPORT_MAX_PAGE_SIZE', 3)
+        ids, cursor, pages = [], None, 0
+        while True:
+            page = self.export_attendees(AttendeeLookup(), ['badge_num'], cursor, 100)
+            assert len(page['records']) <= 3
+            ids.extend(record['id'] for record in page['records'])
+            pages += 1
+            if not page['more']:
+                assert page['cursor'] is None
+                break
+            cursor = page['cursor']
+        assert pages > 1
+        assert ids == sorted(ids) == sorted(id for id, in session.query(Attendee.id))
+
+    def test_projection(self, session):
+        record = self.export_attendees(AttendeeLookup(), ['first_name', 'is_dept_head'], page_size=1)['records'][0]
+        assert set(record) == {'_model', 'id', 'first_name', 'is_dept_head'}
+
+        record = self.export_attendees(AttendeeLookup(), page_size=1)['records'][0]
+        assert set(AttendeeLookup.fields).issubset(record)
+
+    def test_shifts(self, session):
+        shift_ids = sorted(id for id, in session.query(Shift.id))
+        records = self.export_shifts(JobLookup(), page_size=len(shift_ids) or 1)['records']
+        assert [record['id'] for record in records] == shift_ids
+        assert all('attendee' not in record and 'job_id' in record for record in records)
+
+        if shift_ids:
+            record = self.export_shifts(JobLookup(), ['job', 'attendee'], page_size=1)['records'][0]
+            assert record['job']['name'] and 'full_name' in record['attendee']
+
+    def test_invalid(self):
+        assert 'error' in self.export_attendees(AttendeeLookup(), ['password'])
+        assert 'error' in self.export_attendees(AttendeeLookup(), cursor='abc')
+        assert 'error' in self.export_attendees(AttendeeLookup(), page_size=0)
+        assert 'error' in self.export_attendees(AttendeeLookup(), page_size=-1)
+        assert 'error' in self.export_attendees(AttendeeLookup(), page_size='abc')
+        assert 'error' in self.export_shifts(JobLookup(), ['job', 'admin_account'])
@@ -0,0 +1,105 @@
+from uber.tests import *
+
+
+@pytest.fixture
+def session(request):
+    session = Session().session
+    for num in ['One', 'Two', 'Three', 'Four', 'Five', 'Six']:
+        setattr(session, 'job_' + num.lower(), session.job(name='Job ' + num))
+    for num in ['One', 'Two', 'Three', 'Four', 'Five']:
+        setattr(session, 'staff_{}'.format(num).lower(), session.attendee(badge_type=c.STAFF_BADGE, first_name=num))
+    for name in ['Arcade', 'Console']:
+        setattr(session, 'dept_' + name.lower(), session.department(name=name))
+    request.addfinalizer(session.close)
+    return session
+
+
+def shift_pairs(session):
+    return sorted(session.query(Shift.attendee_id, Shift.job_id).all())
+
+
+class TestAssignShifts:
+    def test_assigns_everything_at_once(self, session):
+        pairs = [
+            (session.staff_one.id, session.job_one.id),
+            (session.staff_three.id, session.job_two.id),
+            (session.staff_two.id, session.job_four.id)]
+        report = assignments.assign_shifts(session, pairs)
+        assert report.assigned == pairs and report.conflicts == []
+        assert shift_pairs(session) == sorted(pairs)
+
+    def test_same_errors_as_assign(self, session):
+        pairs = [
+            (session.staff_one.id, session.job_one.id),
+            (session.staff_three.id, session.job_one.id),   # job already filled
+            (session.staff_one.id, session.job_two.id),     # overlaps job one
+            (session.staff_two.id, session.job_six.id),     # missing the required role
+            (session.staff_four.id, session.job_six.id),
+            (session.staff_three.id, session.job_four.id)]
+        report = assignments.assign_shifts(session, pairs, dry_run=True)
+        assert shift_pairs(session) == []
+
+        errors = [session.assign(attendee_id, job_id) for attendee_id, job_id in pairs]
+        assert [(a, j, e) for (a, j), e in zip(pairs, errors) if e] == report.conflicts
+        assert [pair for pair, e in zip(pairs, errors) if not e] == report.assigned
+
+    def test_unknown_ids(self, session):
+        report = assignments.assign_shifts(session, [
+            (session.staff_one.id, '00000000-0000-0000-0000-000000000000'),
+            ('00000000-0000-0000-0000-000000000000', session.job_one.id)])
+        assert report.assigned == []
+        assert [error for a, j, error in report.conflicts] == ['No such job', 'No such attendee']
+
+    def test_to_dict(self, session):
+        report = assignments.assign_shifts(session, [
+            (session.staff_one.id, session.job_one.id),
+            (session.staff_three.id, session.job_one.id)], dry_run=True)
+        assert report.to_dict() == {
+            'assigned': [{'attendee_id': session.staff_one.id, 'job_id': session.job_one.id}],
+            'conflicts': [{
+                'attendee_id': session.staff_three.id,
+                'job_id': session.job_one.id,
+                'error': 'All slots for this job have already been filled'}]
+        }
+
+
+class TestAutofill:
+    def test_fills_open_slots(self, session):
+        report = assignments.autofill_department(session, session.dept_console.id)
+        assert report.conflicts == []
+        assert shift_pairs(session) == sorted(report.assigned)
+
+        session.expire_all()
+        for job in session.query(Job).filter_by(department_id=session.dept_console.id):
+            assert len(job.shifts) <= job.slots
+            for shift in job.shifts:
+                assert shift.attendee.has_required_roles(job)
+                assert session.dept_console.id in shift.attendee.assigned_depts_ids
+
+        # Job Six requires the Trusted role, which only Staff Four has.
+        assert (session.staff_four.id, session.job_six.id) in report.assigned
+
+        for attendee in [session.staff_two, session.staff_three, session.staff_four]:
+            starts = sorted((s.job.start_time, s.job.end_time) for s in attendee.shifts)
+            assert all(end <= start for (_, end), (start, _) in zip(starts, starts[1:]))
+
+    def test_spreads_hours(self, session):
+        report = assignments.autofill_department(session, session.dept_arcade.id, dry_run=True)
+        assert shift_pairs(session) == []
+        assert len({attendee_id for attendee_id, job_id in report.assigned}) == len(report.assigned)
+
+    def test_max_hours(self, session):
+        report = assignments.autofill_department(session, session.dept_console.id, max_hours=2, dry_run=True)
+        hours = defaultdict(float)
+        for attendee_id, job_id in report.assigned:
+            hours[attendee_id] += session.job(job_id).weighted_hours
+        assert report.assigned and all(h <= 2 for h in hours.values())
+
+        # Job Four runs 15 minutes over, so it's worth more than anyone may take.
+        assert session.job_four.id not in [job_id for attendee_id, job_id in report.assigned]
+
+    def test_respects_existing_shifts(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        report = assignments.autofill_department(session, session.dept_arcade.id, dry_run=True)
+        assert session.job_one.id not in [job_id for attendee_id, job_id in report.assigned]
+        assert (session.staff_one.id, session.job_two.id) not in report.assigned
@@ -0,0 +1,198 @@
+import random
+import time
+
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+class FakeVolunteer:
+    """
+    Stands in for an Attendee, with the hours, hour_map, job_intervals and
+    hour slot properties computed from a plain list of jobs rather than from
+    shifts.  Like Attendee, the values used by Job.no_overlap() are cached.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.cache = {}
+
+    def cached(self, name, compute):
+        if name not in self.cache:
+            self.cache[name] = compute()
+        return self.cache[name]
+
+    @property
+    def hours(self):
+        return set().union(*[job.hours for job in self.jobs])
+
+    @property
+    def hour_map(self):
+        return {hour: job for job in self.jobs for hour in job.hours}
+
+    @property
+    def job_intervals(self):
+        return self.cached('job_intervals', lambda: IntervalIndex(self.jobs))
+
+    @property
+    def hour_slots(self):
+        return self.cached('hour_slots', lambda: HourSlots.union(job.hour_slots for job in self.jobs))
+
+    @property
+    def extra15_slots(self):
+        return self.cached('extra15_slots', lambda: HourSlots.union(
+            job.hour_slots for job in self.jobs if job.extra15))
+
+
+def old_no_overlap(job, attendee):
+    before = job.start_time - timedelta(hours=1)
+    after = job.start_time + timedelta(hours=job.duration)
+    return not job.hours.intersection(attendee.hours) and (
+        before not in attendee.hour_map
+        or not attendee.hour_map[before].extra15
+        or job.department_id == attendee.hour_map[before].department_id
+    ) and (
+        after not in attendee.hour_map
+        or not job.extra15
+        or job.department_id == attendee.hour_map[after].department_id
+    )
+
+
+def old_exceeds_threshold(hours, window_starts):
+    for start_time in window_starts:
+        time_slice = [start_time + timedelta(hours=i) for i in range(18)]
+        if len([h for h in hours if h in time_slice]) >= 12:
+            return True
+    return False
+
+
+def old_restricted_overlaps(volunteers, untaken_jobs):
+    untaken = defaultdict(list)
+    for job in untaken_jobs:
+        for hour in job.hours:
+            untaken[hour].append(job)
+
+    overlapping = []
+    for volunteer in volunteers:
+        for job in volunteer.jobs:
+            overlapping.append({other for hour in job.hours for other in untaken[hour]})
+    return overlapping
+
+
+def new_restricted_overlaps(volunteers, untaken_jobs):
+    untaken = IntervalIndex(untaken_jobs)
+    return [set(untaken.sharing_hours(job)) for volunteer in volunteers for job in volunteer.jobs]
+
+
+def make_jobs(count, rng, days=5):
+    departments = [str(uuid4()) for i in range(10)]
+    jobs = []
+    for i in range(count):
+        # a few jobs start on the half hour, which never share hours with jobs that start on the hour
+        offset = timedelta(minutes=30) if rng.random() < 0.05 else timedelta(0)
+        jobs.append(Job(
+            id=str(uuid4()),
+            start_time=c.EPOCH + timedelta(hours=rng.randrange(days * 24)) + offset,
+            duration=rng.choice([0, 1, 2, 2, 3, 4, 6]),
+            extra15=rng.random() < 0.3,
+            department_id=rng.choice(departments)))
+    return jobs
+
+
+def make_volunteers(count, jobs, rng):
+    return [FakeVolunteer(rng.sample(jobs, rng.randrange(12))) for i in range(count)]
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1234)
+
+
+@pytest.fixture
+def jobs(rng):
+    return make_jobs(300, rng, days=2)
+
+
+def test_overlapping():
+    jobs = IntervalIndex([
+        Job(name='A', start_time=c.EPOCH, duration=2),
+        Job(name='B', start_time=c.EPOCH + timedelta(hours=2), duration=1),
+        Job(name='C', start_time=c.EPOCH + timedelta(minutes=90), duration=1),
+        Job(name='D', start_time=c.EPOCH, duration=0)])
+    assert len(jobs) == 3
+    assert [j.name for j in jobs.overlapping(c.EPOCH, c.EPOCH + timedelta(hours=1))] == ['A']
+    assert [j.name for j in jobs.overlapping(c.EPOCH + timedelta(hours=1), c.EPOCH + timedelta(hours=3))] == ['A', 'C', 'B']
+    assert jobs.overlapping(c.EPOCH + timedelta(hours=3), c.EPOCH + timedelta(hours=4)) == []
+
+
+def test_sharing_hours_matches_hour_sets(jobs):
+    index = IntervalIndex(jobs)
+    for job in jobs:
+        assert set(index.sharing_hours(job)) == {other for other in jobs if job.hours.intersection(other.hours)}
+
+
+def test_at_hour_matches_hour_map(jobs, rng):
+    for i in range(50):
+        volunteer = FakeVolunteer(rng.sample(jobs, 8))
+        hour_map = volunteer.hour_map
+        for hour in [c.EPOCH + timedelta(hours=h) for h in range(48)]:
+            assert volunteer.job_intervals.at_hour(hour) is hour_map.get(hour)
+
+
+def test_no_overlap_matches_hour_sets(jobs, rng):
+    for volunteer in make_volunteers(50, jobs, rng):
+        for job in jobs:
+            assert job.no_overlap(volunteer) == old_no_overlap(job, volunteer)
+
+
+def test_hour_slots_match_hour_sets(jobs, rng):
+    for i in range(200):
+        first, second = FakeVolunteer(rng.sample(jobs, 5)), FakeVolunteer(rng.sample(jobs, 5))
+        assert set(first.hour_slots) == first.hours
+        assert len(first.hour_slots) == len(first.hours)
+        assert set(first.hour_slots | second.hour_slots) == first.hours | second.hours
+        assert first.hour_slots.intersects(second.hour_slots) == bool(first.hours & second.hours)
+        for hour in [c.EPOCH + timedelta(minutes=30 * h) for h in range(-4, 100)]:
+            assert (hour in first.hour_slots) == (hour in first.hours)
+
+
+def test_empty_hour_slots():
+    assert not Job(start_time=c.EPOCH, duration=0).hour_slots
+    assert not HourSlots.union([])
+    assert not HourSlots().intersects(Job(start_time=c.EPOCH, duration=2).hour_slots)
+
+
+def test_exceeds_hours_in_window_matches_time_slices(jobs, rng):
+    window_starts = [c.EPOCH + timedelta(hours=h) for h in range(0, 48, 6)]
+    for volunteer in make_volunteers(200, jobs, rng):
+        hours = sorted(volunteer.hours)
+        assert exceeds_hours_in_window(hours, window_starts, 18, 12) == old_exceeds_threshold(hours, window_starts)
+
+
+def test_benchmark(rng):
+    """
+    Compares the old hour-set approach with IntervalIndex and HourSlots over
+    3k jobs and 4k volunteers.  Run with "py.test -s -k benchmark" to see the timings.
+    """
+    jobs = make_jobs(3000, rng)
+    volunteers = make_volunteers(4000, jobs, rng)
+    untaken = [job for job in jobs if rng.random() < 0.2]
+    window_starts = [c.EPOCH + timedelta(hours=h) for h in range(0, 5 * 24, 6)]
+    pairs = [(rng.choice(jobs), volunteer) for volunteer in volunteers for i in range(10)]
+
+    def timed(func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+    for name, old, new in [
+            ('no_overlap', lambda: [old_no_overlap(j, v) for j, v in pairs], lambda: [j.no_overlap(v) for j, v in pairs]),
+            ('restricted_untaken', lambda: old_restricted_overlaps(volunteers, untaken),
+                                   lambda: new_restricted_overlaps(volunteers, untaken)),
+            ('consecutive_threshold',
+                lambda: [old_exceeds_threshold(sorted(v.hours), window_starts) for v in volunteers],
+                lambda: [exceeds_hours_in_window(sorted(v.hours), window_starts, 18, 12) for v in volunteers])]:
+        old_result, old_time = timed(old)
+        new_result, new_time = timed(new)
+        assert old_result == new_result
+        print('{}: hour sets {:.3f}s, new {:.3f}s'.format(name, old_time, new_time))
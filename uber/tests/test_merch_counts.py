@@ -0,0 +1,115 @@
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+def python_shirt_manufacturing_counts(session):
+    counts = defaultdict(lambda: defaultdict(int))
+    labels = ['size unknown'] + [label for val, label in c.SHIRT_OPTS][1:]
+    sort = lambda d: sorted(d.items(), key=lambda tup: labels.index(tup[0]))
+    label = lambda s: 'size unknown' if s == c.SHIRTS[c.NO_SHIRT] else s
+
+    for attendee in session.all_attendees():
+        shirt_label = attendee.shirt_label or 'size unknown'
+        counts['staff'][label(shirt_label)] += attendee.num_staff_shirts_owed
+        counts['event'][label(shirt_label)] += attendee.num_event_shirts_owed
+
+    categories = []
+    if c.SHIRTS_PER_STAFFER > 0:
+        categories.append(('Staff Uniform Shirts', sort(counts['staff'])))
+    categories.append(('Event Shirts', sort(counts['event'])))
+    return categories
+
+
+def python_shirt_counts(session):
+    counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    labels = ['size unknown'] + [label for val, label in c.SHIRT_OPTS][1:]
+    sort = lambda d: sorted(d.items(), key=lambda tup: labels.index(tup[0]))
+    label = lambda s: 'size unknown' if s == c.SHIRTS[c.NO_SHIRT] else s
+    status = lambda got_merch: 'picked_up' if got_merch else 'outstanding'
+    sales_by_week = OrderedDict([(i, 0) for i in range(50)])
+
+    for attendee in session.all_attendees():
+        shirt_label = attendee.shirt_label or 'size unknown'
+        counts['all_staff_shirts'][label(shirt_label)][status(attendee.got_merch)] += attendee.num_staff_shirts_owed
+        counts['all_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += attendee.num_event_shirts_owed
+        if attendee.volunteer_event_shirt_eligible or attendee.replacement_staff_shirts:
+            counts['free_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += 1
+        if attendee.paid_for_a_shirt:
+            counts['paid_event_shirts'][label(shirt_label)][status(attendee.got_merch)] += 1
+            sales_by_week[(min(datetime.now(UTC), c.ESCHATON) - attendee.registered).days // 7] += 1
+
+    for week in range(48, -1, -1):
+        sales_by_week[week] += sales_by_week[week + 1]
+
+    categories = [
+        ('Free Event Shirts', sort(counts['free_event_shirts'])),
+        ('Paid Event Shirts', sort(counts['paid_event_shirts'])),
+        ('All Event Shirts', sort(counts['all_event_shirts'])),
+    ]
+    if c.SHIRTS_PER_STAFFER > 0:
+        categories.append(('Staff Shirts', sort(counts['all_staff_shirts'])))
+    return categories, sales_by_week
+
+
+def as_plain_data(categories):
+    return [(name, [(size, dict(count) if isinstance(count, dict) else count) for size, count in sizes])
+            for name, sizes in categories]
+
+
+@pytest.fixture
+def merch_attendees(monkeypatch):
+    monkeypatch.setattr(c, 'SHIRT_LEVEL', 20)
+    sizes = [val for val, label in c.SHIRT_OPTS]
+    with Session() as session:
+        attendees = []
+        for i, (badge_type, ribbon, amount_extra, second_shirt, got_merch, badge_status) in enumerate([
+                (c.STAFF_BADGE, '', 0, c.UNKNOWN, False, c.COMPLETED_STATUS),
+                (c.STAFF_BADGE, '', 0, c.TWO_STAFF_SHIRTS, True, c.COMPLETED_STATUS),
+                (c.STAFF_BADGE, c.VOLUNTEER_RIBBON, 20, c.STAFF_AND_EVENT_SHIRT, False, c.NEW_STATUS),
+                (c.ATTENDEE_BADGE, c.VOLUNTEER_RIBBON, 0, c.UNKNOWN, False, c.COMPLETED_STATUS),
+                (c.ATTENDEE_BADGE, '{},{}'.format(c.DEALER_RIBBON, c.VOLUNTEER_RIBBON), 0, c.UNKNOWN, True, c.NEW_STATUS),
+                (c.ATTENDEE_BADGE, c.DEALER_RIBBON, 0, c.UNKNOWN, False, c.COMPLETED_STATUS),
+                (c.ATTENDEE_BADGE, '', 20, c.UNKNOWN, True, c.COMPLETED_STATUS),
+                (c.ATTENDEE_BADGE, '', 20, c.UNKNOWN, False, c.INVALID_STATUS),
+                (c.SUPPORTER_BADGE, '', 20, c.UNKNOWN, False, c.COMPLETED_STATUS)]):
+            attendees.append(Attendee(
+                placeholder=True,
+                first_name='Merch',
+                last_name=str(i),
+                paid=c.NEED_NOT_PAY,
+                badge_type=badge_type,
+                badge_status=badge_status,
+                ribbon=str(ribbon),
+                amount_extra=amount_extra,
+                second_shirt=second_shirt,
+                got_merch=got_merch,
+                shirt=sizes[i % len(sizes)]))
+        session.add_all(attendees)
+        session.commit()
+        yield
+        for attendee in attendees:
+            session.delete(attendee)
+
+
+@pytest.mark.parametrize('staff_eligible', [True, False])
+@pytest.mark.parametrize('shirts_per_staffer', [0, 1, 3])
+def test_shirt_manufacturing_counts_match_python(merch_attendees, monkeypatch, staff_eligible, shirts_per_staffer):
+    monkeypatch.setattr(c, 'STAFF_ELIGIBLE_FOR_SWAG_SHIRT', staff_eligible)
+    monkeypatch.setattr(c, 'SHIRTS_PER_STAFFER', shirts_per_staffer)
+    with Session() as session:
+        assert as_plain_data(uber.merch.shirt_manufacturing_counts(session)) \
+            == as_plain_data(python_shirt_manufacturing_counts(session))
+
+
+@pytest.mark.parametrize('staff_eligible', [True, False])
+@pytest.mark.parametrize('shirts_per_staffer', [0, 1, 3])
+def test_shirt_counts_match_python(merch_attendees, monkeypatch, staff_eligible, shirts_per_staffer):
+    monkeypatch.setattr(c, 'STAFF_ELIGIBLE_FOR_SWAG_SHIRT', staff_eligible)
+    monkeypatch.setattr(c, 'SHIRTS_PER_STAFFER', shirts_per_staffer)
+    with Session() as session:
+        categories, sales_by_week = uber.merch.shirt_counts(session)
+        expected_categories, expected_sales_by_week = python_shirt_counts(session)
+        assert as_plain_data(categories) == as_plain_data(expected_categories)
+        assert sales_by_week == expected_sales_by_week
@@ -0,0 +1,73 @@
+import pytest
+
+from uber.common import *
+from uber.server import _InstrumentedService
+
+
+@pytest.fixture
+def registry():
+    return Metrics()
+
+
+def test_histogram():
+    histogram = Histogram((1, 10))
+    for value in [0.5, 1, 5, 50]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (10, 3), ('+Inf', 4)]
+    assert histogram.sum == 56.5 and histogram.count == 4
+
+
+def test_track_statuses_and_sizes(registry):
+    with registry.track('page', 'registration', 'index') as outcome:
+        outcome['status'], outcome['size'] = '200', 5000
+    with pytest.raises(cherrypy.HTTPError):
+        with registry.track('page', 'registration', 'form'):
+            raise cherrypy.HTTPError(404)
+    with pytest.raises(ValueError):
+        with registry.track('task', 'send emails', 'send_all_emails'):
+            raise ValueError()
+
+    assert registry.statuses == {
+        ('page', 'registration', 'index', '200'): 1,
+        ('page', 'registration', 'form', '404'): 1,
+        ('task', 'send emails', 'send_all_emails', 'error'): 1}
+    assert registry.sizes['page', 'registration', 'index'].sum == 5000
+    assert registry.latency['page', 'registration', 'form'].count == 1
+    assert all(count == 0 for count in registry.in_flight.values())
+
+
+def test_in_flight(registry):
+    with registry.track('jsonrpc', 'attendee', 'lookup'):
+        assert registry.in_flight['jsonrpc', 'attendee'] == 1
+    assert registry.in_flight['jsonrpc', 'attendee'] == 0
+
+
+def test_render(registry):
+    registry.instrument('jsonrpc', 'attendee', 'lookup')(lambda: None)()
+    text = registry.render()
+    assert '# TYPE uber_latency_seconds histogram' in text
+    assert 'uber_handled_total{handler="lookup",kind="jsonrpc",section="attendee",status="ok"} 1' in text
+    assert 'uber_latency_seconds_bucket{handler="lookup",kind="jsonrpc",le="+Inf",section="attendee"} 1' in text
+    assert 'uber_in_flight{kind="jsonrpc",section="attendee"} 0' in text
+
+
+def test_jsonrpc_services_are_instrumented(monkeypatch, registry):
+    monkeypatch.setattr(uber.server, 'metrics', registry)
+
+    class Service:
+        def echo(self, value):
+            return value
+
+    service = _InstrumentedService('echo', Service())
+    assert service.echo('hi') == 'hi'
+    assert registry.statuses == {('jsonrpc', 'echo', 'echo', 'ok'): 1}
+
+
+def test_page_handlers_are_instrumented(monkeypatch, registry):
+    monkeypatch.setattr(uber.decorators, 'metrics', registry)
+
+    def index():
+        return b'hello'
+
+    assert instrumented(index)() == b'hello'
+    assert registry.sizes['page', get_module_name(index), 'index'].sum == 5
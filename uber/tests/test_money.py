@@ -0,0 +1,73 @@
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+def python_prereg_money(session):
+    preregs = defaultdict(int)
+    for attendee in session.query(Attendee):
+        preregs['Attendee'] += attendee.amount_paid - attendee.amount_extra
+        preregs['extra'] += attendee.amount_extra
+
+    preregs['group_badges'] = sum(g.badge_cost for g in session.query(Group)
+                                                               .filter(Group.tables == 0, Group.amount_paid > 0))
+
+    dealers = session.query(Group).filter(Group.tables > 0, Group.amount_paid > 0).all()
+    preregs['dealer_tables'] = sum(d.table_cost for d in dealers)
+    preregs['dealer_badges'] = sum(d.badge_cost for d in dealers)
+    return preregs
+
+
+@pytest.fixture
+def paid_groups():
+    with Session() as session:
+        groups = []
+        for name, tables in [('Money Group', 0), ('Money Dealer', 2), ('Other Dealer', 1)]:
+            group = Group(name=name, tables=tables, amount_paid=100)
+            group.attendees = [
+                Attendee(paid=c.PAID_BY_GROUP, first_name='Stored', last_name=name, base_badge_price=30),
+                Attendee(paid=c.PAID_BY_GROUP, first_name='Overridden', last_name=name, overridden_price=15),
+                Attendee(paid=c.PAID_BY_GROUP, first_name='Unpriced', last_name=name, placeholder=True),
+                Attendee(paid=c.HAS_PAID, first_name='Individual', last_name=name, amount_paid=40, amount_extra=10)]
+            groups.append(group)
+        session.add_all(groups)
+        session.flush()
+
+        # presave adjustments always fill in base_badge_price, so bypass them to test calculated prices
+        session.query(Attendee).filter_by(first_name='Unpriced').update({'base_badge_price': 0})
+        session.commit()
+        result_cache.clear()
+        yield
+        for group in groups:
+            session.delete(group)
+
+
+def test_prereg_money_matches_python(paid_groups):
+    with Session() as session:
+        assert dict(money.prereg_money(session)) == dict(python_prereg_money(session))
+
+
+def test_sale_money():
+    with Session() as session:
+        session.add_all([Sale(what='Shirt', cash=10), Sale(what='Shirt', cash=5), Sale(what='Lanyard', cash=2)])
+        session.commit()
+        result_cache.clear()
+        sales = money.sale_money(session)
+        assert sales['Shirt'] == 15
+        assert sales['Lanyard'] == 2
+
+
+def test_prereg_money_is_invalidated_on_flush(paid_groups):
+    with Session() as session:
+        before = money.prereg_money(session)['extra']
+        session.add(Attendee(first_name='Kick', last_name='In', amount_paid=50, amount_extra=50, placeholder=True))
+        session.commit()
+        assert money.prereg_money(session)['extra'] == before + 50
+
+
+def test_budget_section_wrappers(paid_groups):
+    from uber.site_sections import budget
+    with Session() as session:
+        assert dict(budget.prereg_money(session)) == dict(money.prereg_money(session))
+        assert budget.sale_money(session) == money.sale_money(session)
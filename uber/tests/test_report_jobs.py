@@ -0,0 +1,110 @@
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+class FakeReports:
+    @csv_file
+    def names(self, out, session, prefix=''):
+        out.writerow([prefix + 'Badge #', 'Name'])
+
+    @csv_file
+    def broken(self, out, session):
+        raise ValueError('oops')
+
+    def not_a_report(self, session):
+        return {}
+
+for _name in ['names', 'broken', 'not_a_report']:
+    setattr(FakeReports, _name, set_renderable(getattr(FakeReports, _name), [c.STATS]))
+
+
+@pytest.fixture
+def fake_reports(monkeypatch, tmpdir):
+    monkeypatch.setattr(uber.server.Root, 'fake_reports', FakeReports(), raising=False)
+    monkeypatch.setattr(ReportJobQueue, 'artifact_dir', str(tmpdir))
+    yield
+    while not report_jobs.pending.empty():
+        report_jobs.pending.get_nowait()
+    with Session() as session:
+        session.query(ReportJob).delete()
+
+
+def _submit(session, handler, **params):
+    job = report_jobs.submit(session, 'fake_reports', handler, params)
+    return job.id
+
+
+def test_fingerprint_ignores_param_order():
+    assert ReportJobQueue.fingerprint('summary', 'x', {'a': '1', 'b': '2'}) \
+        == ReportJobQueue.fingerprint('summary', 'x', {'b': '2', 'a': '1'})
+    assert ReportJobQueue.fingerprint('summary', 'x', {'a': '1'}) \
+        != ReportJobQueue.fingerprint('summary', 'x', {'a': '2'})
+
+
+def test_only_file_reports_can_be_submitted(fake_reports):
+    with Session() as session:
+        pytest.raises(AssertionError, report_jobs.submit, session, 'fake_reports', 'not_a_report')
+        pytest.raises(AssertionError, report_jobs.submit, session, 'fake_reports', 'nonexistent')
+
+
+def test_run_writes_artifact(fake_reports):
+    with Session() as session:
+        job_id = _submit(session, 'names', prefix='Staff ')
+
+    report_jobs.run(job_id)
+
+    with Session() as session:
+        job = session.report_job(job_id)
+        assert job.status == c.REPORT_COMPLETE
+        assert job.progress == 100
+        assert job.filename == 'names.csv'
+        assert job.content_type == 'application/csv'
+        assert job.is_downloadable
+        with open(job.artifact_path, 'rb') as f:
+            assert f.read().decode('utf-8').startswith('Staff Badge #,Name')
+
+
+def test_failed_run(fake_reports):
+    with Session() as session:
+        job_id = _submit(session, 'broken')
+
+    report_jobs.run(job_id)
+
+    with Session() as session:
+        job = session.report_job(job_id)
+        assert job.status == c.REPORT_FAILED
+        assert 'oops' in job.error
+        assert not job.is_downloadable
+
+
+class TestDeduplication:
+    def test_pending_job_is_reused(self, fake_reports):
+        with Session() as session:
+            assert _submit(session, 'names') == _submit(session, 'names')
+            assert _submit(session, 'names') != _submit(session, 'names', prefix='Staff ')
+
+    def test_fresh_job_is_reused(self, fake_reports):
+        with Session() as session:
+            job_id = _submit(session, 'names')
+        report_jobs.run(job_id)
+        with Session() as session:
+            assert _submit(session, 'names') == job_id
+
+    def test_stale_job_is_not_reused(self, fake_reports):
+        with Session() as session:
+            job_id = _submit(session, 'names')
+        report_jobs.run(job_id)
+        with Session() as session:
+            job = session.report_job(job_id)
+            job.completed_time -= timedelta(minutes=c.REPORT_JOB_FRESH_MINUTES + 1)
+        with Session() as session:
+            assert _submit(session, 'names') != job_id
+
+    def test_failed_job_is_not_reused(self, fake_reports):
+        with Session() as session:
+            job_id = _submit(session, 'broken')
+        report_jobs.run(job_id)
+        with Session() as session:
+            assert _submit(session, 'broken') != job_id
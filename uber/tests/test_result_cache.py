@@ -0,0 +1,133 @@
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+@pytest.fixture
+def cache(monkeypatch, tmpdir):
+    monkeypatch.setattr(ResultCache, 'cache_dir', str(tmpdir))
+    return ResultCache(max_entries=2)
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(uber.result_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_key_includes_params_and_access():
+    key = ResultCache.make_key('summary.index', {'a': 1}, {c.STATS})
+    assert key == ResultCache.make_key('summary.index', {'a': '1'}, {c.STATS})
+    assert key != ResultCache.make_key('summary.index', {'a': 2}, {c.STATS})
+    assert key != ResultCache.make_key('summary.index', {'a': 1}, {c.STATS, c.PEOPLE})
+    assert key != ResultCache.make_key('summary.other', {'a': 1}, {c.STATS})
+    assert key != ResultCache.make_key('summary.index', {'a': 1}, {c.STATS}, account_id='abc')
+
+
+def test_ttl_and_stale(cache, now):
+    policy = CachePolicy(ttl=60, stale=60)
+    cache.set('k', b'page', cache.snapshot(policy))
+    assert cache.get('k', policy) == (b'page', True)
+
+    now[0] += 90
+    assert cache.get('k', policy) == (b'page', False)
+
+    now[0] += 60
+    assert cache.get('k', policy) == (None, False)
+
+
+def test_model_invalidation(cache):
+    policy = CachePolicy(depends_on=[Attendee, 'Shift'])
+    cache.set('k', b'page', cache.snapshot(policy))
+
+    cache.invalidate({'Group'})
+    assert cache.get('k', policy) == (b'page', True)
+
+    cache.invalidate({'Shift'})
+    assert cache.get('k', policy) == (None, False)
+
+
+def test_invalidation_during_computation(cache):
+    policy = CachePolicy(depends_on=[Attendee])
+    generations = cache.snapshot(policy)
+    cache.invalidate({'Attendee'})
+    cache.set('k', b'page', generations)
+    assert cache.get('k', policy) == (None, False)
+
+
+def test_lru_falls_back_to_disk(cache):
+    policy = CachePolicy()
+    for key in ['a', 'b', 'c']:
+        cache.set(key, key.encode(), cache.snapshot(policy))
+
+    assert list(cache.entries) == ['b', 'c']
+    assert cache.get('a', policy) == (b'a', True)
+    assert list(cache.entries) == ['c', 'a']
+
+
+def test_clear(cache):
+    policy = CachePolicy()
+    cache.set('k', b'page', cache.snapshot(policy))
+    cache.clear()
+    assert cache.get('k', policy) == (None, False)
+
+
+def test_flush_invalidates_result_cache():
+    policy = CachePolicy(depends_on=[Attendee])
+    before = result_cache.snapshot(policy)
+    with Session() as session:
+        session.add(Attendee(first_name='Cache', last_name='Buster'))
+        session.flush()
+        assert result_cache.snapshot(policy) != before
+        session.rollback()
+
+
+def test_fetch(cache):
+    policy = CachePolicy(depends_on=[Attendee])
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+
+    assert cache.fetch('k', policy, compute) == 1
+    assert cache.fetch('k', policy, compute) == 1
+
+    cache.invalidate({'Attendee'})
+    assert cache.fetch('k', policy, compute) == 2
+
+
+def test_entries_from_another_process(cache):
+    policy = CachePolicy(depends_on=[Attendee])
+    cache.set('k', b'page', cache.snapshot(policy))
+    cache.set('shared', b'page', cache.snapshot(CachePolicy()))
+
+    restarted = ResultCache(max_entries=2)
+    assert restarted.get('k', policy) == (None, False)
+    assert restarted.get('shared', CachePolicy()) == (b'page', True)
+
+
+def test_prune(cache, now):
+    cache.max_age, cache.max_files = 60 * 60, 2
+    policy = CachePolicy()
+    for i, key in enumerate(['a', 'b', 'c', 'd']):
+        cache.set(key, key.encode(), cache.snapshot(policy))
+        os.utime(cache._path(key), (now[0] - 2 * 60 * 60 + i * 60 * 60,) * 2)
+
+    cache.prune()
+    assert sorted(os.listdir(cache.cache_dir)) == ['c', 'd']
+
+
+def test_read_between_flush_and_commit_is_invalidated():
+    policy = CachePolicy(depends_on=[Attendee])
+    key = ResultCache.make_key('test.between_flush_and_commit', {})
+    with Session() as session:
+        session.add(Attendee(first_name='Mid', last_name='Flush', placeholder=True))
+        session.flush()
+
+        # Another request reads the old committed data after our flush but
+        # before our commit, and caches it.
+        result_cache.set(key, 'old', result_cache.snapshot(policy))
+        assert result_cache.get(key, policy) == ('old', True)
+
+        session.commit()
+        assert result_cache.get(key, policy) == (None, False)
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from uber.common import *
+from uber.api import AttendeeLookup, ChangeFeed, JobLookup
+
+
+@pytest.fixture
+def session(request):
+    session = Session().session
+    for num in ['One', 'Two', 'Three']:
+        attendee = session.attendee(badge_type=c.STAFF_BADGE, first_name=num)
+        setattr(session, 'staff_' + num.lower(), attendee)
+    session.job_one = session.job(name='Job One')
+    session.job_four = session.job(name='Job Four')
+    assert not session.assign(session.staff_one.id, session.job_one.id)
+    assert not session.assign(session.staff_two.id, session.job_four.id)
+    session.expire_all()
+    request.addfinalizer(session.close)
+    return session
+
+
+@pytest.mark.parametrize('attrs', [
+    None,
+    ['first_name', 'badge_status_label', 'ribbon_labels'],
+    AttendeeLookup.fields,
+    AttendeeLookup.fields_full,
+    ChangeFeed.fields['Attendee'],
+    {'first_name': True, 'shifts': False, '_model': False},
+    {'shifts': True, 'food_restrictions': True},
+])
+def test_attendee_matches_to_dict(session, attrs):
+    serialize = compile_to_dict(attrs)
+    for attendee in [session.staff_one, session.staff_three]:
+        assert serialize(attendee) == attendee.to_dict(attrs)
+
+
+@pytest.mark.parametrize('attrs', [None, JobLookup.fields, ChangeFeed.fields['Job']])
+def test_job_matches_to_dict(session, attrs):
+    serialize = compile_to_dict(attrs)
+    for job in [session.job_one, session.job_four]:
+        assert serialize(job) == job.to_dict(attrs)
+
+
+def test_reused_across_models(session):
+    serialize = compile_to_dict(['name'])
+    assert serialize(session.job_one) == session.job_one.to_dict(['name'])
+    assert serialize(session.job_one.department) == session.job_one.department.to_dict(['name'])
+
+
+def test_sessionized_matches_to_dict(session):
+    attendee = session.staff_one
+    attrs = Attendee.to_dict_default_attrs + ['promo_code'] + list(Attendee.extra_apply_attrs_restricted)
+    assert Charge.to_sessionized(attendee) == attendee.to_dict(attrs)
+
+
+def test_benchmark(session):
+    """
+    Compares the per-object cost of Model.to_dict() and compile_to_dict() for
+    an attendee with AttendeeLookup.fields_full and a job with its nested
+    shifts.  Run with "py.test -s -k benchmark" to see the timings.
+    """
+    session.expire_all()
+    attendee = session.query(Attendee).options(
+        subqueryload(Attendee.dept_memberships),
+        subqueryload(Attendee.assigned_depts),
+        subqueryload(Attendee.food_restrictions),
+        subqueryload(Attendee.shifts).subqueryload(Shift.job)).get(session.staff_one.id)
+    job = session.query(Job).options(
+        subqueryload(Job.department),
+        subqueryload(Job.shifts).subqueryload(Shift.attendee)).get(session.job_one.id)
+
+    def per_object(func, instance, attrs, iterations=500):
+        start = time.perf_counter()
+        for i in range(iterations):
+            result = func(instance, attrs)
+        return result, (time.perf_counter() - start) / iterations
+
+    for name, instance, attrs in [
+            ('Attendee with fields_full', attendee, AttendeeLookup.fields_full),
+            ('Job with shifts', job, JobLookup.fields)]:
+        serialize = compile_to_dict(attrs)
+        old_result, old_time = per_object(lambda instance, attrs: instance.to_dict(attrs), instance, attrs)
+        new_result, new_time = per_object(lambda instance, attrs: serialize(instance), instance, attrs)
+        assert old_result == new_result
+        print('{}: to_dict {:.1f}us, compiled {:.1f}us per object'.format(name, old_time * 1e6, new_time * 1e6))
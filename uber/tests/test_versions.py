@@ -0,0 +1,127 @@
+import pytest
+
+from uber.common import *
+from uber.tests.conftest import *
+
+
+@pytest.fixture
+def stamps():
+    return VersionStamps()
+
+
+@pytest.fixture
+def session(request, monkeypatch, tmpdir):
+    monkeypatch.setattr(ResultCache, 'cache_dir', str(tmpdir))
+    session = Session().session
+    session.staff_one = session.attendee(badge_type=c.STAFF_BADGE, first_name='One')
+    session.staff_three = session.attendee(badge_type=c.STAFF_BADGE, first_name='Three')
+    session.job_one = session.job(name='Job One')
+    monkeypatch.setitem(cherrypy.session, 'staffer_id', session.staff_one.id)
+    request.addfinalizer(session.close)
+    return session
+
+
+def test_bump(stamps):
+    assert stamps.current([('department', 'a')]) == stamps.start
+    stamps.bump([('department', 'a')])
+    first = stamps.current([('department', 'a')])
+    assert first > stamps.start
+    assert stamps.current([('department', 'b')]) == stamps.start
+    assert stamps.current([ALL_DEPARTMENTS]) == first
+
+    stamps.bump([('attendee', 'x')])
+    assert stamps.current([('attendee', 'x')]) > first
+    assert stamps.current([('department', 'a'), ('department', 'b')]) == first
+    assert stamps.current([ALL_DEPARTMENTS]) == first
+    assert stamps.current([]) == stamps.start
+
+
+def test_commit_bumps_department_and_volunteer(session):
+    dept_key, volunteer_key = ('department', session.job_one.department_id), ('attendee', session.staff_three.id)
+    before = version_stamps.current([dept_key]), version_stamps.current([volunteer_key])
+
+    assert not session.assign(session.staff_three.id, session.job_one.id)
+    assert version_stamps.current([dept_key]) > before[0]
+    assert version_stamps.current([volunteer_key]) > before[1]
+
+
+def test_rollback_does_not_bump(session):
+    dept_key = ('department', session.job_one.department_id)
+    before = version_stamps.current([dept_key])
+    session.job_one.name = 'Renamed'
+    session.flush()
+    session.rollback()
+    assert version_stamps.current([dept_key]) == before
+
+
+def test_signups_version_changes_with_department(session):
+    version = session.signups_version(session.staff_one)
+    assert session.signups_version(session.staff_one) == version
+
+    session.job_one.description = 'Now with more snacks'
+    session.commit()
+    assert session.signups_version(session.staff_one) > version
+
+
+def test_versioned_jobs_for_signups(session):
+    version = session.signups_version(session.staff_one)
+    full = session.versioned_jobs_for_signups(version)
+    assert full['version'] == version
+    assert full['jobs'] == session.jobs_for_signups()
+    assert full['etag']
+
+    unchanged = session.versioned_jobs_for_signups(version, since=version)
+    assert unchanged['jobs'] == [] and unchanged['removed'] == []
+
+    assert not session.assign(session.staff_one.id, session.job_one.id)
+    session.expire_all()
+    new_version = session.signups_version(session.staff_one)
+    delta = session.versioned_jobs_for_signups(new_version, since=version)
+    assert delta['since'] == version
+    assert [job['id'] for job in delta['jobs']] == [session.job_one.id]
+    assert delta['jobs'][0]['taken']
+
+    unknown = session.versioned_jobs_for_signups(new_version, since=12345)
+    assert 'since' not in unknown and unknown['etag'] != full['etag']
+
+
+def test_bump_all_attendees(stamps):
+    stamps.bump([('attendee', 'x')])
+    assert stamps.current([ALL_ATTENDEES]) == stamps.current([('attendee', 'x')]) > stamps.start
+    assert stamps.current([ALL_DEPARTMENTS]) == stamps.start
+
+
+def test_staffer_roster(session):
+    roster = session.staffer_roster()
+    assert roster['version'] == version_stamps.current([STAFFER_ROSTER])
+    assert len(roster['staffers']) <= 20
+    names = [s['full_name'] for s in roster['staffers']]
+    assert names == sorted(names, key=str.lower)
+
+    assert [s['full_name'] for s in session.staffer_roster('thr')['staffers']] == ['Three Three']
+    assert [s['full_name'] for s in session.staffer_roster('VOLUN')['staffers']] == ['Regular Volunteer']
+    assert session.staffer_roster('nobody has this name')['staffers'] == []
+
+
+def test_staffer_roster_sees_new_names(session):
+    before = session.staffer_roster('thr')
+    assert session.staffer_roster('thr') == before
+
+    session.staff_three.first_name = 'Thrice'
+    session.commit()
+    after = session.staffer_roster('thr')
+    assert after['version'] > before['version']
+    assert [s['full_name'] for s in after['staffers']] == ['Thrice Three']
+    assert after['etag'] != before['etag']
+
+
+def test_staffer_roster_ignores_signups(session):
+    before = session.staffer_roster('thr')
+    assert not session.assign(session.staff_three.id, session.job_one.id)
+    assert session.staffer_roster('thr')['version'] == before['version']
+
+
+def test_staffers_for_dropdown(session):
+    staffers = session.staffers_for_dropdown()
+    assert len(staffers) == session.query(Attendee).filter_by(staffing=True).count()
+    assert {'id': session.staff_three.id, 'full_name': 'Three Three'} in staffers
@@ -1,4 +1,5 @@
 from uber.common import *
+from uber.serializers import compile_to_dict
 
 
 class CSRFException(Exception):
@@ -332,6 +333,17 @@ class Charge:
 
         return promo_code_count
 
+    _sessionizers = {}
+
+    @classmethod
+    def _sessionizer(cls, model, relation):
+        if model not in cls._sessionizers:
+            cls._sessionizers[model] = compile_to_dict(
+                model.to_dict_default_attrs
+                + [relation]
+                + list(model.extra_apply_attrs_restricted))
+        return cls._sessionizers[model]
+
     @classmethod
     def to_sessionized(cls, m):
         if is_listy(m):
@@ -339,13 +351,9 @@ class Charge:
         elif isinstance(m, dict):
             return m
         elif isinstance(m, sa.Attendee):
-            return m.to_dict(sa.Attendee.to_dict_default_attrs
-                + ['promo_code']
-                + list(sa.Attendee.extra_apply_attrs_restricted))
+            return cls._sessionizer(sa.Attendee, 'promo_code')(m)
         elif isinstance(m, sa.Group):
-            return m.to_dict(sa.Group.to_dict_default_attrs
-                + ['attendees']
-                + list(sa.Group.extra_apply_attrs_restricted))
+            return cls._sessionizer(sa.Group, 'attendees')(m)
         else:
             raise AssertionError('{} is not an attendee or group'.format(m))
 
@@ -0,0 +1,65 @@
+"""
+Version stamps for data which clients poll for.
+
+Pages such as signups.jobs are polled by every volunteer, but the data behind
+them only changes when someone edits a job or signs up for a shift.  Rather
+than rebuilding the response on every poll, we keep a version stamp for each
+department and each attendee, which is bumped whenever a transaction which
+changed something belonging to it is committed; see the session listeners in
+uber/models/__init__.py.  A response which only depends on some departments
+and attendees can then be cached under the newest of their stamps.
+
+Stamps are taken from a single clock which starts at the current time in
+milliseconds, so that they keep increasing across restarts.  Like the result
+cache's generation counters, they're kept in memory, so changes made by other
+processes aren't seen; anything cached by version should also have a ttl.
+"""
+import time
+from threading import RLock
+
+
+__all__ = ['ALL_ATTENDEES', 'ALL_DEPARTMENTS', 'STAFFER_ROSTER', 'VersionStamps', 'version_stamps']
+
+
+# Bumped along with every department or attendee respectively, for data which
+# depends on all of them.
+ALL_ATTENDEES = ('attendee', None)
+ALL_DEPARTMENTS = ('department', None)
+
+# Bumped only when a volunteer is added or removed or changes their name, for
+# the roster of volunteers' names, which would otherwise be invalidated by
+# every shift signup along with ALL_ATTENDEES.
+STAFFER_ROSTER = ('staffer_roster', None)
+
+
+class VersionStamps:
+    def __init__(self):
+        self.lock = RLock()
+        self.start = self.clock = int(time.time() * 1000)
+        self.stamps = {}
+
+    def bump(self, keys):
+        """
+        Gives each of the given keys a new stamp, which is newer than every
+        stamp returned so far.  Keys are tuples such as ('department', id) or
+        ('attendee', id); bumping any department or attendee also bumps
+        ALL_DEPARTMENTS or ALL_ATTENDEES.
+        """
+        keys = set(keys)
+        keys.update({(kind, None) for kind, id in keys})
+
+        with self.lock:
+            self.clock += 1
+            for key in keys:
+                self.stamps[key] = self.clock
+
+    def current(self, keys):
+        """
+        Returns the newest stamp of the given keys; keys which have never been
+        bumped are as old as this process.
+        """
+        with self.lock:
+            return max([self.stamps.get(key, self.start) for key in keys], default=self.start)
+
+
+version_stamps = VersionStamps()